@@ -5,6 +5,8 @@ from flask_bootstrap import Bootstrap
 from flask_caching import Cache
 from config import config
 from flask_migrate import Migrate
+from .helpers.profiler import SQLProfiler
+from .helpers.slow_queries import SlowQueryLog
 import sentry_sdk
 from sentry_sdk.integrations.flask import FlaskIntegration
 
@@ -12,7 +14,9 @@ bootstrap = Bootstrap()
 db = SQLAlchemy()
 login_manager = LoginManager()
 cache = Cache()
-migrate = Migrate(db=db)
+migrate = Migrate(db=db, render_as_batch=True)
+profiler = SQLProfiler()
+slow_query_log = SlowQueryLog()
 
 def create_app(config_name):
     """Create an instance of this flask application."""
@@ -22,7 +26,6 @@ def create_app(config_name):
     app.config.from_prefixed_env('POETPIECE')
 
     with app.app_context():
-        from .helpers import cleanup
         from . import errors
 
     # Initialize Flask extensions
@@ -31,6 +34,8 @@ def create_app(config_name):
     login_manager.init_app(app)
     cache.init_app(app)
     migrate.init_app(app)
+    profiler.init_app(app)
+    slow_query_log.init_app(app)
 
     # Initialize Sentry
     sentry_sdk.init(
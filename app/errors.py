@@ -1,7 +1,6 @@
 from flask import render_template, current_app, request, redirect, url_for, flash
 from sqlalchemy.exc import OperationalError
-from .helpers.cleanup import failed_posts, lock
-import time
+from .helpers.idempotency import failed_posts
 
 
 @current_app.errorhandler(OperationalError)
@@ -12,13 +11,10 @@ def handle_db_connection_error(e):
     # Generate a unique hash for the request data to use as an idempotency key
     data_hash = hash(frozenset(request.form.items()))
 
-    if data_hash in failed_posts:
+    # Mark the data as failed, unless this is its retry
+    if not failed_posts.add(data_hash):
         flash('There was a server timeout, but it has been resolved', 'error')
         return redirect(request.url)
-    
-    with lock:
-        # Mark the data as failed
-        failed_posts[data_hash] = time.time()
 
     flash('Database connection failed; retrying...', 'error')
     return redirect(request.referrer)
@@ -0,0 +1,66 @@
+"""Remember the keys of recently failed POST requests for a while.
+
+A POST that fails on a database error is redirected back to be retried, and
+its key is kept so that the retry can be told apart from a first attempt.
+Every key lives for the same time, so the keys expire in the order they were
+added: they are kept in an ordered dict and the expired ones are popped from
+its front whenever a key is added or looked up, which is amortized O(1).
+The number of keys is capped, the oldest going first. Requests that fail no
+POST never touch the keys or their lock.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+FAILED_POST_TTL = 3600
+MAX_FAILED_POSTS = 10000
+
+
+class ExpiringKeys:
+    """A bounded set of keys that expire a fixed time after being added."""
+
+    def __init__(self, ttl=FAILED_POST_TTL, size=MAX_FAILED_POSTS,
+                 clock=time.monotonic):
+        self.ttl = ttl
+        self.size = size
+        self.clock = clock
+        self.expiries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def _expire(self, now):
+        while self.expiries:
+            key, expiry = next(iter(self.expiries.items()))
+            if expiry > now:
+                break
+            del self.expiries[key]
+
+    def add(self, key):
+        """Add a key unless it is there already; return whether it was added."""
+        with self.lock:
+            now = self.clock()
+            self._expire(now)
+            if key in self.expiries:
+                return False
+
+            self.expiries[key] = now + self.ttl
+            while len(self.expiries) > self.size:
+                self.expiries.popitem(last=False)
+            return True
+
+    def __contains__(self, key):
+        with self.lock:
+            self._expire(self.clock())
+            return key in self.expiries
+
+    def __len__(self):
+        with self.lock:
+            self._expire(self.clock())
+            return len(self.expiries)
+
+    def clear(self):
+        with self.lock:
+            self.expiries.clear()
+
+
+failed_posts = ExpiringKeys()
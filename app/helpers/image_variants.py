@@ -0,0 +1,154 @@
+"""Make downscaled variants of uploaded images for responsive pages.
+
+Each stored image gets a ``thumbnail``, ``card`` and ``full`` WebP written
+beside it as ``<hash>-<name>.webp``, so like the image itself a variant is
+made once whatever the number of resources using it, and is deleted with
+it. The work is decoding and resampling, so it runs in a pool of processes
+once the transaction saving the resource commits, and the variants are then
+recorded on the resource, which serves the original until they are.
+"""
+
+import logging
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import sqlalchemy as sa
+from flask import current_app
+from PIL import Image, ImageOps
+from sqlalchemy.orm import Session
+from .. import db
+from .img_handler import URL_PREFIX, upload_path
+from .types import HexUUID
+
+# the widths the variants are bounded by, smallest first
+VARIANTS = (('thumbnail', 160), ('card', 480), ('full', 1280))
+FORMAT, EXTENSION, QUALITY = 'WEBP', '.webp', 80
+SESSION_KEY = 'pending_image_variants'
+
+logger = logging.getLogger('poetpiece.image_variants')
+
+_pool = None
+
+
+def variant_path(path, name):
+    """Get the path of a variant of a stored image."""
+    return f'{os.path.splitext(path)[0]}-{name}{EXTENSION}'
+
+
+def _write(image, target):
+    # write beside the target and rename, so a variant is never half there
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(target))
+    try:
+        with os.fdopen(fd, 'wb') as tmp:
+            image.save(tmp, FORMAT, quality=QUALITY, method=4)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, target)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def make_variants(upload_folder, path):
+    """Write the variants of a stored image that are not there yet.
+
+    Runs in a worker process, so it takes no application context. Returns
+    the url, width and height of each variant by name, or an empty dict if
+    the file cannot be read as an image.
+    """
+    variants = {}
+    try:
+        with Image.open(os.path.join(upload_folder, path)) as image:
+            image = ImageOps.exif_transpose(image)
+            if image.mode not in ('RGB', 'RGBA'):
+                image = image.convert(
+                    'RGBA' if image.has_transparency_data else 'RGB')
+
+            for name, width in VARIANTS:
+                target_path = variant_path(path, name)
+                target = os.path.join(upload_folder, target_path)
+                if os.path.exists(target):
+                    # made for another resource showing the same image
+                    with Image.open(target) as variant:
+                        size = variant.size
+                else:
+                    # an image is never upscaled; smaller ones keep their size
+                    variant = image.copy()
+                    variant.thumbnail((width, width * 4),
+                                      Image.Resampling.LANCZOS)
+                    _write(variant, target)
+                    size = variant.size
+                variants[name] = {'url': URL_PREFIX + target_path,
+                                  'width': size[0], 'height': size[1]}
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        logger.warning('No variants for %s: %s', path, e)
+        return {}
+    return variants
+
+
+def record(resource_id, url, variants):
+    """Record the variants made for a resource if it still shows the image."""
+    if not variants:
+        return False
+    resources = sa.table('resources', sa.column('id', HexUUID()),
+                         sa.column('body'), sa.column('variants', sa.JSON))
+    with db.engine.begin() as connection:
+        result = connection.execute(resources.update().where(
+            (resources.c.id == resource_id) & (resources.c.body == url)
+        ).values(variants=variants))
+    return result.rowcount > 0
+
+
+def _get_pool(workers):
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=workers)
+    return _pool
+
+
+def _record_made(app, resource_id, url, future):
+    try:
+        variants = future.result()
+    except Exception:
+        logger.exception('Making the variants of %s failed', url)
+        return
+    with app.app_context():
+        record(resource_id, url, variants)
+
+
+def generate(resource_id, url):
+    """Make and record the variants of a resource's image.
+
+    With ``IMAGE_VARIANT_WORKERS`` at 0 they are made in the calling thread.
+    """
+    app = current_app._get_current_object()
+    args = (app.config['UPLOAD_FOLDER'], upload_path(url))
+    workers = app.config.get('IMAGE_VARIANT_WORKERS', 0)
+    if not workers:
+        return record(resource_id, url, make_variants(*args))
+
+    future = _get_pool(workers).submit(make_variants, *args)
+    future.add_done_callback(partial(_record_made, app, resource_id, url))
+    return future
+
+
+def generate_after_commit(session, resource_id, url):
+    """Make the variants of a new image once the current transaction commits."""
+    session.info.setdefault(SESSION_KEY, {})[resource_id] = url
+
+
+def generate_pending(session):
+    """Start making the variants of the images a transaction saved."""
+    for resource_id, url in session.info.pop(SESSION_KEY, {}).items():
+        if upload_path(url) is not None:
+            generate(resource_id, url)
+
+
+def discard_pending(session, previous_transaction):
+    """Forget the images of a transaction that was rolled back."""
+    session.info.pop(SESSION_KEY, None)
+
+
+db.event.listen(Session, 'after_commit', generate_pending)
+db.event.listen(Session, 'after_soft_rollback', discard_pending)
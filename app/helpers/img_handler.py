@@ -1,16 +1,186 @@
-from flask import current_app
+"""Store uploaded images by their content.
+
+An upload is hashed in fixed-size chunks while it streams to a temporary
+file, which is then renamed into place under its SHA-256 in directories
+sharded by the first two pairs of hex digits, e.g.
+``resources/ab/cd/abcd...ef.png``. Identical images are stored once; the
+``uploads`` table counts the records using each file, and a file is
+deleted once the transaction dropping its last use commits, together with
+the variants made of it, which are stored beside it as ``<hash>-<name>``.
+A file stored for a transaction that rolls back is deleted unless another
+one has counted it meanwhile.
+
+As the name of a stored file changes with its content, uploads are served
+with a strong ETag and cached by browsers for good; a front proxy can be
+handed the transfer through ``USE_X_SENDFILE`` or ``UPLOADS_ACCEL_REDIRECT``.
+"""
+
+import hashlib
+import mimetypes
 import os
+import tempfile
+import sqlalchemy as sa
+from flask import abort, current_app, request, send_file, url_for
+from sqlalchemy.orm import Session
+from werkzeug.security import safe_join
+from werkzeug.utils import secure_filename
+from .. import db
 
+CHUNK_SIZE = 64 * 1024
+# also matches the /static/uploads/ urls of images stored before
+URL_PREFIX = '/uploads/'
+SESSION_KEY = 'released_uploads'
+NEW_KEY = 'new_uploads'
 
-def delete_img(filepath: str, custom_dir='resources'):
-    """Delete an image from the filesystem if it exists."""
+
+def save_img(file_storage, custom_dir='resources'):
+    """Store an uploaded image unless it is stored already; return its URL."""
     upload_folder = current_app.config.get('UPLOAD_FOLDER')
-    # Extract the filename from the file path
-    filename = filepath.rpartition('/')[-1]
-    # Generate an absolute path to the image
-    img_path = os.path.join(upload_folder, custom_dir, filename)
+    # the temporary file is on the same filesystem, so renaming is atomic
+    tmp_dir = os.path.join(upload_folder, '.tmp')
+    os.makedirs(tmp_dir, exist_ok=True)
+
+    digest = hashlib.sha256()
+    fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+    try:
+        with os.fdopen(fd, 'wb') as tmp:
+            while chunk := file_storage.stream.read(CHUNK_SIZE):
+                digest.update(chunk)
+                tmp.write(chunk)
+        os.chmod(tmp_path, 0o644)
+
+        file_hash = digest.hexdigest()
+        extension = os.path.splitext(
+            secure_filename(file_storage.filename or ''))[1].lower()
+        path = f'{custom_dir}/{file_hash[:2]}/{file_hash[2:4]}/' \
+            f'{file_hash}{extension}'
+
+        img_path = os.path.join(upload_folder, path)
+        os.makedirs(os.path.dirname(img_path), exist_ok=True)
+        stored = os.path.exists(img_path)
+        # replacing a stored copy of the same content changes nothing
+        os.replace(tmp_path, img_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    url = url_for('main.upload', path=path)
+    if not stored:
+        # counted only once the record using it is saved
+        db.session.info.setdefault(NEW_KEY, set()).add(url)
+    return url
+
+
+def upload_path(url):
+    """Get the path of an uploaded image within the upload folder."""
+    if not url or URL_PREFIX not in url:
+        return None
+    return url.partition(URL_PREFIX)[2] or None
+
+
+def delete_img(url):
+    """Delete an uploaded image from the filesystem if it exists."""
+    path = upload_path(url)
+    if path is None:
+        return False
+
+    # the variants are made of stored images, so they import this module
+    from .image_variants import VARIANTS, variant_path
+
+    upload_folder = current_app.config.get('UPLOAD_FOLDER')
+    img_path = os.path.join(upload_folder, path)
+
+    # only the variants: a legacy photo.png must not take photo-2.png along
+    for name, _ in VARIANTS:
+        variant = os.path.join(upload_folder, variant_path(path, name))
+        if os.path.exists(variant):
+            os.remove(variant)
 
     if os.path.exists(img_path):
         os.remove(img_path)
         return True
     return False
+
+
+def send_upload(path):
+    """Send a stored upload with the headers to cache it for good."""
+    upload_folder = current_app.config.get('UPLOAD_FOLDER')
+    filename = safe_join(upload_folder, path)
+    # the temporary files of uploads in progress are not served
+    hidden = any(part.startswith('.') for part in path.split('/'))
+    if filename is None or hidden or not os.path.isfile(filename):
+        abort(404)
+
+    # the name is the hash of the content, or of the image it derives from
+    etag = os.path.splitext(os.path.basename(path))[0]
+    max_age = current_app.config.get('UPLOADS_MAX_AGE', 365 * 24 * 60 * 60)
+    accel_prefix = current_app.config.get('UPLOADS_ACCEL_REDIRECT')
+    if accel_prefix:
+        # nginx sends the file from an internal location mapped to the folder
+        mimetype = mimetypes.guess_type(path)[0]
+        response = current_app.response_class(
+            mimetype=mimetype or 'application/octet-stream')
+        response.headers['X-Accel-Redirect'] = \
+            f"{accel_prefix.rstrip('/')}/{path}"
+        response.set_etag(etag)
+        response.cache_control.public = True
+        response.cache_control.max_age = max_age
+        response.make_conditional(request)
+    else:
+        # sets X-Sendfile instead of sending the bytes with USE_X_SENDFILE
+        response = send_file(filename, etag=etag, conditional=True,
+                             max_age=max_age)
+
+    response.cache_control.immutable = True
+    return response
+
+
+def delete_after_commit(session, url):
+    """Delete an image no longer used once the current transaction commits."""
+    session.info.setdefault(SESSION_KEY, set()).add(url)
+
+
+def delete_released(session):
+    """Delete the images whose last use a transaction dropped."""
+    urls = session.info.pop(SESSION_KEY, None)
+    if not urls:
+        return
+
+    _delete_unused(urls)
+
+
+def _delete_unused(urls):
+    # an upload of the same content may have been counted since
+    uploads = sa.table('uploads', sa.column('path'))
+    with db.engine.connect() as connection:
+        used = set(connection.execute(sa.select(uploads.c.path).where(
+            uploads.c.path.in_([upload_path(url) for url in urls]))
+        ).scalars())
+
+    for url in urls:
+        if upload_path(url) not in used:
+            delete_img(url)
+
+
+def keep_new(session):
+    """Keep the images stored for a transaction that committed."""
+    session.info.pop(NEW_KEY, None)
+
+
+def keep_released(session, previous_transaction):
+    """Keep the images of a transaction that was rolled back."""
+    session.info.pop(SESSION_KEY, None)
+
+
+def delete_new(session, previous_transaction):
+    """Delete the images stored for a transaction that was rolled back."""
+    urls = session.info.pop(NEW_KEY, None)
+    if urls:
+        _delete_unused(urls)
+
+
+db.event.listen(Session, 'after_commit', delete_released)
+db.event.listen(Session, 'after_commit', keep_new)
+db.event.listen(Session, 'after_soft_rollback', keep_released)
+db.event.listen(Session, 'after_soft_rollback', delete_new)
@@ -0,0 +1,153 @@
+"""Keyset (cursor) pagination for ordered queries.
+
+A page is fetched by seeking past the sort key of the last row shown
+instead of skipping rows with OFFSET, so every page costs the same. The
+sort key travels between requests as an opaque, URL-safe cursor.
+"""
+
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as DecodeError
+from datetime import datetime
+import sqlalchemy as sa
+from .. import db
+
+
+class CursorPage:
+    """A page of results fetched with a cursor."""
+
+    def __init__(self, items, per_page, next_cursor=None, total=None):
+        self.items = items
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+        self.total = total
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {'dt': value.isoformat()}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict):
+        return datetime.fromisoformat(value['dt'])
+    return value
+
+
+def encode_cursor(name, values):
+    """Build an opaque cursor from the name of an ordering and a sort key."""
+    payload = json.dumps([name, [_encode_value(v) for v in values]])
+    return urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(name, cursor, size):
+    """Get the sort key in a cursor, or None if it is empty or invalid."""
+    if not cursor:
+        return None
+
+    try:
+        padding = '=' * (-len(cursor) % 4)
+        cursor_name, values = json.loads(urlsafe_b64decode(cursor + padding))
+    except (DecodeError, ValueError, TypeError):
+        return None
+
+    # cursors of other orderings cannot be used to seek this one
+    if cursor_name != name or not isinstance(values, list) \
+            or len(values) != size:
+        return None
+    return [_decode_value(v) for v in values]
+
+
+def sort_column(column):
+    """Get the expression to sort and seek on for a column.
+
+    SQLite keeps datetimes as text, so they are compared as stored rather
+    than as re-rendered bound datetimes.
+    """
+    if db.engine.dialect.name == 'sqlite' and \
+            isinstance(column.type, sa.DateTime):
+        return sa.type_coerce(column, sa.String)
+    return column
+
+
+def _unpack(key):
+    expression, descending, *nullable = key
+    return expression, descending, bool(nullable and nullable[0])
+
+
+def sort_order(key):
+    """Get the ORDER BY clause of a sort key."""
+    expression, descending, nullable = _unpack(key)
+    order = expression.desc() if descending else expression.asc()
+    return order.nulls_last() if nullable else order
+
+
+def _equals(expression, value):
+    return expression.is_(None) if value is None else expression == value
+
+
+def seek(keys, values):
+    """Build the condition for rows that come after a sort key.
+
+    ``keys`` is a list of ``(expression, descending)`` pairs, with a third
+    item set for the expressions that can be NULL; those sort last.
+    """
+    clauses = []
+
+    for i, key in enumerate(keys):
+        expression, descending, nullable = _unpack(key)
+        if values[i] is None:
+            # nothing sorts after NULL within the rows equal so far
+            continue
+
+        step = expression < values[i] if descending else expression > values[i]
+        if nullable:
+            step = step | expression.is_(None)
+        clauses.append(sa.and_(
+            *[_equals(keys[j][0], values[j]) for j in range(i)], step))
+    return sa.or_(*clauses)
+
+
+def paginate(query, name, keys, cursor, per_page, total=None):
+    """Fetch the page of a query that comes after a cursor."""
+    values = decode_cursor(name, cursor, len(keys))
+    expressions = [key[0] for key in keys]
+
+    query = query.add_columns(*expressions)
+    if values is not None:
+        query = query.filter(seek(keys, values))
+
+    rows = query.order_by(*[sort_order(key) for key in keys]
+                          ).limit(per_page + 1).all()
+
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        next_cursor = encode_cursor(name, list(rows[-1][1:]))
+
+    return CursorPage([row[0] for row in rows], per_page, next_cursor, total)
+
+
+def estimate_count(table_name):
+    """Estimate the number of rows in a table without counting them."""
+    dialect = db.engine.dialect.name
+
+    if dialect == 'postgresql':
+        statement = sa.text('SELECT reltuples::bigint FROM pg_class '
+                            'WHERE relname = :table_name')
+        estimate = db.session.execute(
+            statement, {'table_name': table_name}).scalar()
+    elif dialect == 'sqlite':
+        # rowids only grow, so the largest one bounds the row count
+        estimate = db.session.execute(
+            sa.text(f'SELECT MAX(rowid) FROM {table_name}')).scalar()
+    else:
+        estimate = db.session.execute(
+            sa.text(f'SELECT COUNT(*) FROM {table_name}')).scalar()
+
+    return max(estimate or 0, 0)
@@ -0,0 +1,197 @@
+"""Cache the pages rendered for anonymous visitors and derived data.
+
+Every cached page or value depends on a few tags such as ``poems`` or
+``poem:<id>``. Each tag has a version stored in the cache and the versions
+are part of the cache keys, so bumping a tag's version makes every entry
+that depends on it unreachable. Tags are collected from the records a
+session flushes and bumped only once the transaction commits.
+
+Pages can also be validated by browsers: a page with a version kept up to
+date on write gets an ETag and Last-Modified, and a browser whose copy is
+current gets a 304 before the page is queried or rendered.
+"""
+
+import time
+from functools import wraps
+from urllib.parse import urlencode
+from uuid import uuid4
+from flask import request, session, make_response, current_app
+from flask_login import current_user
+from sqlalchemy.orm import Session
+from werkzeug.http import is_resource_modified
+from .. import cache, db
+
+SESSION_KEY = 'page_cache_tags'
+
+
+def _tag_key(tag):
+    return f'page-tag/{tag}'
+
+
+def _get_versions(tags):
+    """Get the current versions of tags, creating the missing ones."""
+    keys = [_tag_key(tag) for tag in tags]
+    versions = cache.get_many(*keys)
+
+    for i, version in enumerate(versions):
+        if version is None:
+            # a fresh version so that pages cached under a lost one are unreachable
+            cache.add(keys[i], uuid4().hex, timeout=0)
+            versions[i] = cache.get(keys[i])
+    return versions
+
+
+def bump(*tags):
+    """Invalidate every cached page that depends on any of the tags."""
+    for tag in tags:
+        cache.set(_tag_key(tag), uuid4().hex, timeout=0)
+
+
+def invalidate(*tags):
+    """Invalidate pages by tags once the current transaction commits."""
+    db.session.info.setdefault(SESSION_KEY, set()).update(tags)
+
+
+def _versions_key(tags):
+    return '/'.join(f'{tag}:{version}' for tag, version in
+                    zip(tags, _get_versions(tags)))
+
+
+def _page_key(tags):
+    query = urlencode(sorted(request.args.items(multi=True)))
+    return f'page/{request.path}?{query}/{_versions_key(tags)}'
+
+
+def cached_until(*tags):
+    """Cache the result of a function without arguments until a tag changes."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args):
+            key = f'value/{func.__module__}.{func.__qualname__}/' \
+                f'{_versions_key(tags)}'
+            value = cache.get(key)
+
+            if value is None:
+                value = func(*args)
+                cache.set(key, value, timeout=current_app.config.get(
+                    'PAGE_CACHE_TIMEOUT'))
+            return value
+        return wrapper
+    return decorator
+
+
+def _is_cacheable():
+    return request.method == 'GET' and not current_user.is_authenticated \
+        and '_flashes' not in session
+
+
+def cache_anonymous_page(get_tags):
+    """Serve GET requests of anonymous users from the cache.
+
+    ``get_tags`` is called with the view arguments and returns the tags the
+    page depends on, or None when the page must not be cached.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(**kwargs):
+            if not _is_cacheable():
+                return func(**kwargs)
+
+            tags = get_tags(**kwargs)
+            if tags is None:
+                return func(**kwargs)
+
+            key = _page_key(tags)
+            cached = cache.get(key)
+
+            if cached is not None:
+                body, mimetype = cached
+                return current_app.response_class(body, mimetype=mimetype)
+
+            response = make_response(func(**kwargs))
+
+            # pages carrying messages for this visitor only are not shared
+            if response.status_code == 200 and _is_cacheable():
+                cache.set(key, (response.get_data(), response.mimetype),
+                          timeout=current_app.config.get('PAGE_CACHE_TIMEOUT'))
+            return response
+        return wrapper
+    return decorator
+
+
+def _visitor():
+    """Identify who a page is rendered for, as part of its ETag."""
+    if not current_user.is_authenticated:
+        return 'anonymous'
+
+    # the forms of a page carry CSRF tokens that expire, so a copy is
+    # validated for no longer than half their lifetime
+    limit = current_app.config.get('WTF_CSRF_TIME_LIMIT', 3600)
+    window = int(time.time() // (limit / 2)) if limit else 0
+    return f'{current_user.id}.{window}'
+
+
+def conditional_page(get_version):
+    """Answer GET requests for a page the browser has a current copy of.
+
+    ``get_version`` is called with the view arguments and returns the
+    version of the page and when it was last modified, or None when the
+    page cannot be validated. A page differs by visitor, so browsers are
+    asked to revalidate it on every visit.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(**kwargs):
+            # messages for the visitor are shown once
+            if request.method != 'GET' or '_flashes' in session:
+                return func(**kwargs)
+
+            validators = get_version(**kwargs)
+            if validators is None:
+                return func(**kwargs)
+
+            version, last_modified = validators
+            etag = f'{version}-{_visitor()}'
+            if is_resource_modified(request.environ, etag=etag,
+                                    last_modified=last_modified):
+                response = make_response(func(**kwargs))
+                if response.status_code != 200:
+                    return response
+            else:
+                response = current_app.response_class(status=304)
+
+            response.set_etag(etag)
+            response.last_modified = last_modified
+            response.cache_control.no_cache = True
+            response.cache_control.private = current_user.is_authenticated
+            response.vary.add('Cookie')
+            return response
+        return wrapper
+    return decorator
+
+
+def collect_tags(session, flush_context):
+    """Remember the tags of the records written in a flush."""
+    tags = session.info.setdefault(SESSION_KEY, set())
+
+    for record in (*session.new, *session.dirty, *session.deleted):
+        get_tags = getattr(record, 'page_cache_tags', None)
+        if get_tags is not None:
+            tags.update(get_tags())
+
+
+def bump_tags(session):
+    """Invalidate the pages of the records written in a transaction."""
+    tags = session.info.pop(SESSION_KEY, None)
+    if tags:
+        bump(*tags)
+
+
+def discard_tags(session, previous_transaction):
+    """Forget the tags of a transaction that was rolled back."""
+    session.info.pop(SESSION_KEY, None)
+
+
+db.event.listen(Session, 'after_flush', collect_tags)
+db.event.listen(Session, 'after_commit', bump_tags)
+db.event.listen(Session, 'after_soft_rollback', discard_tags)
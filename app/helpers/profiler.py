@@ -0,0 +1,172 @@
+"""Count and time the SQL statements each request runs.
+
+When ``SQL_PROFILING`` is on, every response carries a ``Server-Timing``
+header with the time spent in the database and in the whole request, and
+a rolling summary per endpoint is kept in memory. The summary, with p50 and
+p95 latencies and the statements that ran most often, is served at
+``/_perf`` only when ``SQL_PROFILING_PAGE`` is on as well, as the address a
+request comes from cannot be told apart from its proxy's.
+"""
+
+import re
+import time
+from collections import defaultdict, deque
+from threading import Lock
+from flask import g, request, render_template, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+def normalize(statement):
+    """Reduce a statement to a form shared by its repeated executions."""
+    statement = re.sub(r'\s+', ' ', statement).strip()
+    statement = re.sub(r"'(?:[^']|'')*'", '?', statement)
+    statement = re.sub(r'\b\d+(?:\.\d+)?\b', '?', statement)
+    # IN lists grow with the number of bound values
+    return re.sub(r'\(\s*\?(?:\s*,\s*\?)*\s*\)', '(?)', statement)
+
+
+def percentile(values, share):
+    """Get the value below which a share of the sorted values fall."""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(share * len(values)))]
+
+
+class RequestProfile:
+    """The statements run while serving a single request."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.count = 0
+        self.db_time = 0.0
+        self.statements = defaultdict(lambda: [0, 0.0])
+
+    def record(self, statement, duration):
+        self.count += 1
+        self.db_time += duration
+        stats = self.statements[normalize(statement)]
+        stats[0] += 1
+        stats[1] += duration
+
+
+class EndpointSummary:
+    """Rolling statistics of the recent requests to an endpoint."""
+
+    def __init__(self, window, top_statements):
+        self.requests = deque(maxlen=window)
+        self.top_statements = top_statements
+        # normalized statement -> [executions, total time, most in a request]
+        self.statements = {}
+
+    def add(self, profile, duration):
+        self.requests.append((duration, profile.db_time, profile.count))
+
+        for statement, (count, db_time) in profile.statements.items():
+            stats = self.statements.setdefault(statement, [0, 0.0, 0])
+            stats[0] += count
+            stats[1] += db_time
+            stats[2] = max(stats[2], count)
+
+        # keep memory bounded by forgetting the least run statements
+        if len(self.statements) > self.top_statements * 4:
+            ranked = sorted(self.statements.items(),
+                            key=lambda item: item[1][0], reverse=True)
+            self.statements = dict(ranked[:self.top_statements * 2])
+
+    def report(self):
+        durations = sorted(duration for duration, _, _ in self.requests)
+        db_times = sorted(db_time for _, db_time, _ in self.requests)
+        counts = [count for _, _, count in self.requests]
+        top = sorted(self.statements.items(),
+                     key=lambda item: item[1][0], reverse=True)
+
+        return {
+            'requests': len(durations),
+            'p50_ms': percentile(durations, 0.5) * 1000,
+            'p95_ms': percentile(durations, 0.95) * 1000,
+            'db_p50_ms': percentile(db_times, 0.5) * 1000,
+            'db_p95_ms': percentile(db_times, 0.95) * 1000,
+            'queries_mean': sum(counts) / len(counts) if counts else 0,
+            'queries_max': max(counts, default=0),
+            'statements': [{
+                'sql': sql, 'executions': executions,
+                'total_ms': total * 1000, 'max_per_request': most,
+            } for sql, (executions, total, most) in top[:self.top_statements]],
+        }
+
+
+class SQLProfiler:
+    """Flask extension that profiles the SQL run by each request."""
+
+    def __init__(self, app=None):
+        self.summaries = {}
+        self.lock = Lock()
+        self.window = 500
+        self.top_statements = 10
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        if not app.config.get('SQL_PROFILING'):
+            return
+
+        self.window = app.config.get('SQL_PROFILING_WINDOW', self.window)
+        app.before_request(self.start_request)
+        app.after_request(self.finish_request)
+        if app.config.get('SQL_PROFILING_PAGE'):
+            app.add_url_rule('/_perf', 'perf', self.show_summary)
+
+        if not event.contains(Engine, 'before_cursor_execute',
+                              self.before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute',
+                         self.before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute',
+                         self.after_cursor_execute)
+
+    @staticmethod
+    def before_cursor_execute(conn, cursor, statement, parameters, context,
+                              executemany):
+        conn.info.setdefault('profiler_started', []).append(
+            time.perf_counter())
+
+    @staticmethod
+    def after_cursor_execute(conn, cursor, statement, parameters, context,
+                             executemany):
+        started = conn.info['profiler_started'].pop()
+        profile = g.get('_sql_profile') if has_request_context() else None
+
+        if profile is not None:
+            profile.record(statement, time.perf_counter() - started)
+
+    def start_request(self):
+        g._sql_profile = RequestProfile()
+
+    def finish_request(self, response):
+        profile = g.pop('_sql_profile', None)
+        if profile is None:
+            return response
+
+        duration = time.perf_counter() - profile.started
+        response.headers.add(
+            'Server-Timing',
+            f'db;dur={profile.db_time * 1000:.2f};desc="{profile.count} queries", '
+            f'app;dur={duration * 1000:.2f}')
+
+        if request.endpoint and request.endpoint != 'perf':
+            with self.lock:
+                summary = self.summaries.get(request.endpoint)
+                if summary is None:
+                    summary = self.summaries[request.endpoint] = \
+                        EndpointSummary(self.window, self.top_statements)
+                summary.add(profile, duration)
+        return response
+
+    def report(self):
+        """Summarize the recent requests of every endpoint."""
+        with self.lock:
+            return {endpoint: summary.report()
+                    for endpoint, summary in sorted(self.summaries.items())}
+
+    def show_summary(self):
+        return render_template('perf.html', report=self.report())
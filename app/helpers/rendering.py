@@ -0,0 +1,84 @@
+"""Render the Markdown bodies of resources to sanitized HTML.
+
+Markdown output goes through a single bleach pass that strips the tags not
+allowed and turns bare URLs into links. The cleaner is built once per
+thread, as a bleach cleaner holds parser state and cannot be shared, and
+recent renders are kept in a bounded LRU keyed on the SHA-256 of the text,
+so a body saved again unchanged is not rendered twice.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from bleach.linkifier import LinkifyFilter
+from bleach.sanitizer import Cleaner
+from markdown import markdown
+
+ALLOWED_TAGS = frozenset([
+    'a', 'abbr', 'acronym', 'b', 'blockquote', 'code',
+    'em', 'i', 'li', 'ol', 'pre', 'strong', 'ul',
+    'h1', 'h2', 'h3', 'h4', 'h5', 'p', 'u', 'del',
+    's', 'sup', 'sub'
+])
+
+_local = threading.local()
+
+
+def _get_cleaner():
+    cleaner = getattr(_local, 'cleaner', None)
+    if cleaner is None:
+        cleaner = _local.cleaner = Cleaner(
+            tags=ALLOWED_TAGS, strip=True, filters=[LinkifyFilter])
+    return cleaner
+
+
+def render_markdown(text):
+    """Render Markdown to sanitized HTML, bypassing the cache."""
+    return _get_cleaner().clean(markdown(text, output_format='html'))
+
+
+def content_hash(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class RenderCache:
+    """A bounded LRU of rendered HTML keyed on the hash of its Markdown."""
+
+    def __init__(self, size=512):
+        self.size = size
+        self.renders = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, text):
+        key = content_hash(text)
+        with self.lock:
+            html = self.renders.get(key)
+            if html is not None:
+                self.renders.move_to_end(key)
+                self.hits += 1
+                return html
+
+        # render outside the lock; a race only renders the same text twice
+        html = render_markdown(text)
+        with self.lock:
+            self.misses += 1
+            self.renders[key] = html
+            self.renders.move_to_end(key)
+            while len(self.renders) > self.size:
+                self.renders.popitem(last=False)
+        return html
+
+    def clear(self):
+        with self.lock:
+            self.renders.clear()
+            self.hits = self.misses = 0
+
+
+renders = RenderCache()
+
+
+def render(text):
+    """Render Markdown to sanitized HTML, reusing a recent render."""
+    return renders.render(text)
@@ -0,0 +1,308 @@
+"""Full-text search over poem titles, descriptions and stanzas.
+
+Each supported database gets a backend that owns a side table holding one
+search document per poem. The documents are rewritten incrementally from
+the mapper events registered in models.py, so a search only ever needs to
+join that table against poems.
+"""
+
+import re
+import sqlalchemy as sa
+from .. import db
+from .types import HexUUID
+
+SEARCH_TABLE = 'poems_search'
+
+
+def _text(statement, params):
+    """Build a textual statement binding poem ids, expanding any lists."""
+    return sa.text(statement).bindparams(*[
+        sa.bindparam(key, type_=HexUUID(), expanding=isinstance(value, list))
+        for key, value in params.items()])
+
+
+def get_terms(search_string):
+    """Split a user's search string into plain word tokens."""
+    return re.findall(r'\w+', search_string or '')
+
+
+class SearchBackend:
+    """Fallback search backend that filters with LIKE and does not rank."""
+
+    def create(self, connection):
+        """Create the structures that hold the search documents."""
+        pass
+
+    def drop(self, connection):
+        """Remove the structures that hold the search documents."""
+        pass
+
+    def reindex(self, connection, poem_id):
+        """Rebuild the search document of a poem."""
+        pass
+
+    def remove(self, connection, poem_id):
+        """Remove the search document of a poem."""
+        pass
+
+    def reindex_many(self, connection, poem_ids):
+        """Rebuild the search documents of many poems at once."""
+        for poem_id in poem_ids:
+            self.reindex(connection, poem_id)
+
+    def reindex_all(self, connection):
+        """Rebuild the search documents of all the poems."""
+        pass
+
+    def match(self, query, model, search_string):
+        """Filter a Poem query by a search string and return its ranking."""
+        stanzas = sa.table('stanzas', sa.column('poem_id'),
+                           sa.column('content'))
+
+        for term in get_terms(search_string):
+            pattern = f'%{term}%'
+            in_stanzas = sa.select(stanzas.c.poem_id).where(
+                (stanzas.c.poem_id == model.id) &
+                stanzas.c.content.ilike(pattern)
+            ).exists()
+
+            query = query.filter(model.title.ilike(pattern) |
+                                 model.description.ilike(pattern) |
+                                 in_stanzas)
+        return query, None
+
+
+class SQLiteSearchBackend(SearchBackend):
+    """Search backend built on an external-content FTS5 table."""
+
+    DOCUMENTS_TABLE = f'{SEARCH_TABLE}_docs'
+
+    def create(self, connection):
+        docs, fts = self.DOCUMENTS_TABLE, SEARCH_TABLE
+        statements = [
+            f'CREATE TABLE IF NOT EXISTS {docs} ('
+            'rowid INTEGER PRIMARY KEY, poem_id BLOB NOT NULL UNIQUE, '
+            'title TEXT, description TEXT, stanzas TEXT)',
+            f'CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5('
+            f'title, description, stanzas, content={docs!r}, '
+            "content_rowid='rowid', tokenize='porter unicode61')",
+            # keep the FTS5 index in step with the documents table
+            f'CREATE TRIGGER IF NOT EXISTS {docs}_ai AFTER INSERT ON {docs} BEGIN '
+            f'INSERT INTO {fts} (rowid, title, description, stanzas) '
+            'VALUES (new.rowid, new.title, new.description, new.stanzas); END',
+            f'CREATE TRIGGER IF NOT EXISTS {docs}_ad AFTER DELETE ON {docs} BEGIN '
+            f'INSERT INTO {fts} ({fts}, rowid, title, description, stanzas) '
+            "VALUES ('delete', old.rowid, old.title, old.description, old.stanzas); END",
+            f'CREATE TRIGGER IF NOT EXISTS {docs}_au AFTER UPDATE ON {docs} BEGIN '
+            f'INSERT INTO {fts} ({fts}, rowid, title, description, stanzas) '
+            "VALUES ('delete', old.rowid, old.title, old.description, old.stanzas); "
+            f'INSERT INTO {fts} (rowid, title, description, stanzas) '
+            'VALUES (new.rowid, new.title, new.description, new.stanzas); END',
+        ]
+
+        for statement in statements:
+            connection.exec_driver_sql(statement)
+
+    def drop(self, connection):
+        connection.exec_driver_sql(f'DROP TABLE IF EXISTS {SEARCH_TABLE}')
+        connection.exec_driver_sql(
+            f'DROP TABLE IF EXISTS {self.DOCUMENTS_TABLE}')
+
+    def _upsert(self, connection, where, params=None, stanzas=None):
+        stanzas = stanzas or (
+            "(SELECT group_concat(content, ' ') FROM stanzas "
+            'WHERE stanzas.poem_id = poems.id)')
+        params = params or {}
+        connection.execute(_text(
+            f'INSERT INTO {self.DOCUMENTS_TABLE} '
+            '(poem_id, title, description, stanzas) '
+            "SELECT id, title, COALESCE(description, ''), "
+            f"COALESCE({stanzas}, '') FROM poems {where} "
+            'ON CONFLICT (poem_id) DO UPDATE SET title = excluded.title, '
+            'description = excluded.description, stanzas = excluded.stanzas',
+            params), params)
+
+    def _upsert_grouped(self, connection, poem_ids=None):
+        # concatenate the stanzas of many poems in one pass, not once a poem;
+        # "WHERE true" keeps SQLite from parsing ON CONFLICT as a join
+        stanzas_filter = 'WHERE poem_id IN :poem_ids' if poem_ids else ''
+        poems_filter = 'WHERE id IN :poem_ids' if poem_ids else 'WHERE true'
+        self._upsert(connection, "LEFT JOIN (SELECT poem_id, group_concat("
+                     f"content, ' ') AS content FROM stanzas {stanzas_filter} "
+                     'GROUP BY poem_id) AS texts ON texts.poem_id = poems.id '
+                     f'{poems_filter}',
+                     {'poem_ids': list(poem_ids)} if poem_ids else None,
+                     stanzas='texts.content')
+
+    def reindex(self, connection, poem_id):
+        self._upsert(connection, 'WHERE id = :poem_id', {'poem_id': poem_id})
+
+    def remove(self, connection, poem_id):
+        params = {'poem_id': poem_id}
+        connection.execute(_text(
+            f'DELETE FROM {self.DOCUMENTS_TABLE} WHERE poem_id = :poem_id',
+            params), params)
+
+    def reindex_many(self, connection, poem_ids):
+        if poem_ids:
+            self._upsert_grouped(connection, poem_ids)
+
+    def reindex_all(self, connection):
+        connection.exec_driver_sql(f'DELETE FROM {self.DOCUMENTS_TABLE}')
+        self._upsert_grouped(connection)
+
+    def match(self, query, model, search_string):
+        terms = get_terms(search_string)
+        if not terms:
+            return query, None
+
+        docs = sa.table(self.DOCUMENTS_TABLE, sa.column('rowid'),
+                        sa.column('poem_id'))
+        fts = sa.table(SEARCH_TABLE, sa.column('rowid'))
+        # every term must match, each one as a prefix
+        expression = ' '.join(f'"{term}"*' for term in terms)
+
+        query = query.join(docs, docs.c.poem_id == model.id).join(
+            fts, fts.c.rowid == docs.c.rowid
+        ).filter(sa.literal_column(SEARCH_TABLE).op('MATCH')(expression))
+
+        # bm25 is lower for better matches; titles weigh the most
+        rank = sa.func.bm25(sa.literal_column(SEARCH_TABLE), 10.0, 4.0, 1.0)
+        return query, rank.asc()
+
+
+class PostgresSearchBackend(SearchBackend):
+    """Search backend built on a weighted tsvector with a GIN index."""
+
+    LANGUAGE = 'english'
+
+    def create(self, connection):
+        connection.exec_driver_sql(
+            f'CREATE TABLE IF NOT EXISTS {SEARCH_TABLE} ('
+            'poem_id UUID PRIMARY KEY REFERENCES poems (id) '
+            'ON DELETE CASCADE, document TSVECTOR NOT NULL)')
+        connection.exec_driver_sql(
+            f'CREATE INDEX IF NOT EXISTS ix_{SEARCH_TABLE}_document '
+            f'ON {SEARCH_TABLE} USING GIN (document)')
+
+    def drop(self, connection):
+        connection.exec_driver_sql(f'DROP TABLE IF EXISTS {SEARCH_TABLE}')
+
+    def _upsert(self, connection, where, params=None, stanzas=None):
+        language = self.LANGUAGE
+        stanzas = stanzas or (
+            "(SELECT string_agg(content, ' ') FROM stanzas "
+            'WHERE stanzas.poem_id = poems.id)')
+        params = params or {}
+        connection.execute(_text(
+            f'INSERT INTO {SEARCH_TABLE} (poem_id, document) '
+            f"SELECT id, setweight(to_tsvector('{language}', "
+            "COALESCE(title, '')), 'A') || "
+            f"setweight(to_tsvector('{language}', "
+            "COALESCE(description, '')), 'B') || "
+            f"setweight(to_tsvector('{language}', "
+            f"COALESCE({stanzas}, '')), 'C') FROM poems {where} "
+            'ON CONFLICT (poem_id) DO UPDATE SET document = excluded.document',
+            params), params)
+
+    def _upsert_grouped(self, connection, poem_ids=None):
+        # concatenate the stanzas of many poems in one pass, not once a poem
+        stanzas_filter = 'WHERE poem_id IN :poem_ids' if poem_ids else ''
+        poems_filter = 'WHERE id IN :poem_ids' if poem_ids else ''
+        self._upsert(connection, "LEFT JOIN (SELECT poem_id, string_agg("
+                     f"content, ' ') AS content FROM stanzas {stanzas_filter} "
+                     'GROUP BY poem_id) AS texts ON texts.poem_id = poems.id '
+                     f'{poems_filter}',
+                     {'poem_ids': list(poem_ids)} if poem_ids else None,
+                     stanzas='texts.content')
+
+    def reindex(self, connection, poem_id):
+        self._upsert(connection, 'WHERE id = :poem_id', {'poem_id': poem_id})
+
+    def remove(self, connection, poem_id):
+        params = {'poem_id': poem_id}
+        connection.execute(_text(
+            f'DELETE FROM {SEARCH_TABLE} WHERE poem_id = :poem_id',
+            params), params)
+
+    def reindex_many(self, connection, poem_ids):
+        if poem_ids:
+            self._upsert_grouped(connection, poem_ids)
+
+    def reindex_all(self, connection):
+        self._upsert_grouped(connection)
+
+    def match(self, query, model, search_string):
+        terms = get_terms(search_string)
+        if not terms:
+            return query, None
+
+        search = sa.table(SEARCH_TABLE, sa.column('poem_id'),
+                          sa.column('document'))
+        tsquery = sa.func.to_tsquery(
+            self.LANGUAGE, ' & '.join(f'{term}:*' for term in terms))
+
+        query = query.join(search, search.c.poem_id == model.id).filter(
+            search.c.document.op('@@')(tsquery))
+
+        rank = sa.func.ts_rank_cd(search.c.document, tsquery)
+        return query, rank.desc()
+
+
+BACKENDS = {
+    'sqlite': SQLiteSearchBackend,
+    'postgresql': PostgresSearchBackend,
+}
+
+
+def get_backend(dialect_name=None):
+    """Get the search backend for a database dialect."""
+    dialect_name = dialect_name or db.engine.dialect.name
+    return BACKENDS.get(dialect_name, SearchBackend)()
+
+
+def _text_changed(target, *keys):
+    """Check whether any of the searchable attributes of a record changed."""
+    state = db.inspect(target)
+    return any(state.attrs[key].history.has_changes() for key in keys)
+
+
+def on_poem_change(mapper, connection, target):
+    """Rebuild the search document of a poem whose text changed."""
+    if _text_changed(target, 'title', 'description'):
+        get_backend(connection.dialect.name).reindex(connection, target.id)
+
+
+def on_poem_delete(mapper, connection, target):
+    """Remove the search document of a deleted poem."""
+    get_backend(connection.dialect.name).remove(connection, target.id)
+
+
+def on_stanza_change(mapper, connection, target):
+    """Rebuild the search documents of the poems a stanza changed in."""
+    if not _text_changed(target, 'content', 'poem_id'):
+        return
+
+    # a stanza moved to another poem leaves the document of the first too
+    poem_ids = {target.poem_id,
+                *db.inspect(target).attrs.poem_id.history.deleted} - {None}
+    if poem_ids:
+        get_backend(connection.dialect.name).reindex_many(connection,
+                                                          list(poem_ids))
+
+
+def on_stanza_delete(mapper, connection, target):
+    """Rebuild the search document of the poem a stanza was removed from."""
+    if target.poem_id is not None:
+        get_backend(connection.dialect.name).reindex(connection,
+                                                     target.poem_id)
+
+
+def create_index(target, connection, **kwargs):
+    """Create the search structures along with the other tables."""
+    get_backend(connection.dialect.name).create(connection)
+
+
+def drop_index(target, connection, **kwargs):
+    """Remove the search structures along with the other tables."""
+    get_backend(connection.dialect.name).drop(connection)
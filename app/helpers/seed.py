@@ -0,0 +1,233 @@
+"""Generate a large synthetic dataset for development and benchmarks.
+
+Rows are built in memory in batches and written with executemany INSERTs
+on the tables directly, skipping the ORM unit of work and its events. The
+derived data that those events would maintain (slugs, search documents,
+rating and vote aggregates) is filled in or rebuilt in bulk afterwards.
+
+Activity is skewed the way it is on a real site: a few poets write most of
+the poems and a few poems draw most of the comments, ratings and votes.
+"""
+
+from datetime import datetime, timedelta, timezone
+from itertools import accumulate
+from random import Random
+from uuid import uuid4
+from slugify import slugify
+from werkzeug.security import generate_password_hash
+from .. import db
+from . import search, page_cache
+from ..models import (User, Poet, Category, Poem, Stanza, Comment,
+                      PoemRating, Resource, Reaction)
+
+WORDS = (
+    'moon river silence ember morning ash salt bone window harbor wind '
+    'night garden letter mother sparrow rain iron lantern orchard winter '
+    'ocean thread dust honey stone mirror candle field shadow bridge '
+    'whisper road song fever glass hollow thunder petal tide echo'
+).split()
+
+DEFAULT_PASSWORD = 'password'
+
+
+class Seeder:
+    """Bulk-insert a synthetic dataset of a given size."""
+
+    def __init__(self, batch_size=5000, seed=None, skew=1.2, days=730):
+        self.batch_size = batch_size
+        self.random = Random(seed)
+        self.skew = skew
+        self.now = datetime.now(timezone.utc)
+        self.days = days
+        # ties the generated names together and keeps reruns unique
+        self.run = uuid4().hex[:6]
+        self.counts = {}
+
+    def _weights(self, size):
+        """Get cumulative power-law weights to draw ``size`` items by."""
+        weights = [self.random.paretovariate(self.skew) for _ in range(size)]
+        return list(accumulate(weights))
+
+    def _draw(self, population, weights, k=1):
+        return self.random.choices(population, cum_weights=weights, k=k)
+
+    def _date(self, after=None):
+        start = after or self.now - timedelta(days=self.days)
+        span = (self.now - start).total_seconds()
+        return start + timedelta(seconds=self.random.uniform(0, span))
+
+    def _text(self, low, high):
+        return ' '.join(self.random.choices(
+            WORDS, k=self.random.randint(low, high)))
+
+    def _insert(self, model, rows):
+        """Insert rows from any iterable, one batch at a time."""
+        table = model.__table__
+        batch, count = [], 0
+
+        for row in rows:
+            batch.append(row)
+            if len(batch) == self.batch_size:
+                count += self._flush(table, batch)
+                batch = []
+        count += self._flush(table, batch)
+        self.counts[table.name] = self.counts.get(table.name, 0) + count
+
+    @staticmethod
+    def _flush(table, batch):
+        if batch:
+            db.session.execute(table.insert(), batch)
+            db.session.commit()
+        return len(batch)
+
+    def seed_users(self, count, poets):
+        # hashing is deliberately slow, so every seeded user shares one hash
+        password_hash = generate_password_hash(DEFAULT_PASSWORD)
+        users = [{
+            'id': uuid4().hex,
+            'username': f'user{i}_{self.run}',
+            'password_hash': password_hash,
+            'created_at': self._date(),
+        } for i in range(count)]
+        self._insert(User, users)
+
+        poet_rows = [{
+            'id': uuid4().hex,
+            'user_id': user['id'],
+            'email': f"{user['username']}@example.com",
+            'gender': self.random.choice(['female', 'male']),
+            'verified': self.random.random() < 0.3,
+            'bio': self._text(8, 30),
+            'created_at': self._date(user['created_at']),
+        } for user in users[:poets]]
+        self._insert(Poet, poet_rows)
+
+        self.user_ids = [user['id'] for user in users]
+        self.poets = poet_rows
+
+    def seed_categories(self, count):
+        categories = [{
+            'id': uuid4().hex,
+            'name': f'{self.random.choice(WORDS)}_{self.run}_{i}',
+            'description': self._text(5, 20),
+            'created_at': self._date(),
+        } for i in range(count)]
+        self._insert(Category, categories)
+        self.category_ids = [category['id'] for category in categories]
+
+    def seed_poems(self, count, stanzas):
+        poet_weights = self._weights(len(self.poets))
+        category_weights = self._weights(len(self.category_ids))
+        authors = self._draw(self.poets, poet_weights, count)
+        categories = self._draw(self.category_ids, category_weights, count)
+
+        poems = []
+        for i in range(count):
+            title = f'{self._text(2, 5).title()} {self.run} {i}'
+            poems.append({
+                'id': uuid4().hex,
+                'author_id': authors[i]['id'],
+                'category_id': categories[i],
+                'title': title,
+                'slug': slugify(title),
+                'description': self._text(10, 40),
+                'premium': self.random.random() < 0.1,
+                'completed': self.random.random() < 0.7,
+                'published': self.random.random() < 0.9,
+                'created_at': self._date(authors[i]['created_at']),
+            })
+        self._insert(Poem, poems)
+        self.poems = poems
+
+        def stanza_rows():
+            for poem in poems:
+                for index in range(1, self.random.randint(1, 2 * stanzas) + 1):
+                    yield {
+                        'id': uuid4().hex,
+                        'poem_id': poem['id'],
+                        'index': index,
+                        'content': '\n'.join(self._text(4, 9)
+                                             for _ in range(4)),
+                        'created_at': poem['created_at'],
+                    }
+        self._insert(Stanza, stanza_rows())
+
+    def seed_comments(self, count):
+        weights = self._weights(len(self.poems))
+
+        def rows():
+            for poem in self._draw(self.poems, weights, count):
+                yield {
+                    'id': uuid4().hex,
+                    'user_id': self.random.choice(self.user_ids),
+                    'poem_id': poem['id'],
+                    'comment': self._text(3, 30),
+                    'approved': self.random.random() < 0.8,
+                    'created_at': self._date(poem['created_at']),
+                }
+        self._insert(Comment, rows())
+
+    def _pairs(self, records, count):
+        """Draw distinct (user, record) pairs, skewed towards some records."""
+        weights = self._weights(len(records))
+        seen = set()
+
+        for record in self._draw(records, weights, count):
+            user_id = self.random.choice(self.user_ids)
+            if (user_id, record['id']) not in seen:
+                seen.add((user_id, record['id']))
+                yield user_id, record
+
+    def seed_ratings(self, count):
+        def rows():
+            for user_id, poem in self._pairs(self.poems, count):
+                yield {
+                    'id': uuid4().hex,
+                    'user_id': user_id,
+                    'poem_id': poem['id'],
+                    # most readers rate generously
+                    'rating': float(self.random.choices(
+                        [1, 2, 3, 4, 5], weights=[1, 2, 4, 6, 5])[0]),
+                    'created_at': self._date(poem['created_at']),
+                }
+        self._insert(PoemRating, rows())
+
+    def seed_resources(self, count, reactions):
+        resources = []
+        for i in range(count):
+            body = self._text(20, 80)
+            resources.append({
+                'id': uuid4().hex,
+                'poet_id': self.random.choice(self.poets)['id'],
+                'rtype': Resource.ResourceTypes.BRIEF.value,
+                'title': f'{self._text(2, 5).title()} {self.run} {i}',
+                'body': body,
+                # plain words render to a single paragraph
+                'body_html': f'<p>{body}</p>',
+                'published': True,
+                'approved': True,
+                'created_at': self._date(),
+            })
+        self._insert(Resource, resources)
+
+        def rows():
+            for user_id, resource in self._pairs(resources, reactions):
+                yield {
+                    'id': uuid4().hex,
+                    'user_id': user_id,
+                    'record_id': resource['id'],
+                    'reaction_type': 'UPVOTE' if self.random.random() < 0.8
+                    else 'DOWNVOTE',
+                    'created_at': self._date(resource['created_at']),
+                }
+        self._insert(Reaction, rows())
+
+    def rebuild(self):
+        """Rebuild the data the skipped model events would have kept."""
+        backend = search.get_backend()
+        backend.reindex_all(db.session.connection())
+        db.session.commit()
+
+        Poem.recount_ratings()
+        Resource.recount_votes()
+        page_cache.bump('poems', 'categories', 'poets')
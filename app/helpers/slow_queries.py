@@ -0,0 +1,146 @@
+"""Log the statements that run slower than a threshold, with their plans.
+
+A statement slower than ``SLOW_QUERY_THRESHOLD`` milliseconds is queued
+with the endpoint that ran it and the shape of its parameters. A worker
+thread asks the database for the statement's plan and appends the entry to
+a rotating JSON Lines file, so requests never wait on the EXPLAIN. Each
+distinct statement, once normalized, is logged only once per process.
+"""
+
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+from logging.handlers import RotatingFileHandler
+from flask import request, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import StaticPool
+from .profiler import normalize
+
+logger = logging.getLogger('poetpiece.slow_queries')
+
+# statements the database can give a plan for
+EXPLAINABLE = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH')
+
+
+def parameter_shape(parameters):
+    """Describe bound parameters by their types, leaving out the values."""
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [type(value).__name__ for value in parameters]
+    return type(parameters).__name__
+
+
+class SlowQueryLog:
+    """Flask extension that records slow statements and their plans."""
+
+    def __init__(self, app=None):
+        self.threshold = 0
+        self.queue = queue.Queue(maxsize=1000)
+        self.seen = set()
+        self.lock = threading.Lock()
+        self.worker = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.threshold = app.config.get('SLOW_QUERY_THRESHOLD', 0) / 1000
+        if not self.threshold:
+            return
+
+        path = app.config['SLOW_QUERY_LOG']
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if not any(getattr(handler, 'baseFilename', None) == path
+                   for handler in logger.handlers):
+            handler = RotatingFileHandler(
+                path, maxBytes=app.config.get('SLOW_QUERY_LOG_MAX_BYTES', 0),
+                backupCount=app.config.get('SLOW_QUERY_LOG_BACKUPS', 0))
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            logger.addHandler(handler)
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+
+        if not event.contains(Engine, 'after_cursor_execute',
+                              self.after_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute',
+                         self.before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute',
+                         self.after_cursor_execute)
+
+    @staticmethod
+    def before_cursor_execute(conn, cursor, statement, parameters, context,
+                              executemany):
+        conn.info.setdefault('slow_query_started', []).append(
+            time.perf_counter())
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters,
+                             context, executemany):
+        duration = time.perf_counter() - conn.info['slow_query_started'].pop()
+        if not self.threshold or duration < self.threshold or \
+                not statement.lstrip().upper().startswith(EXPLAINABLE):
+            return
+
+        sql = normalize(statement)
+        with self.lock:
+            if sql in self.seen:
+                return
+            self.seen.add(sql)
+
+        if executemany:
+            parameters = parameters[0] if parameters else ()
+        entry = {
+            'logged_at': datetime.now(timezone.utc).isoformat(),
+            'endpoint': request.endpoint if has_request_context() else None,
+            'duration_ms': round(duration * 1000, 3),
+            'sql': sql,
+            'parameters': parameter_shape(parameters),
+            'executemany': executemany,
+        }
+
+        try:
+            self.queue.put_nowait((conn.engine, statement, parameters, entry))
+        except queue.Full:
+            return
+        self._start_worker()
+
+    def _start_worker(self):
+        with self.lock:
+            if self.worker is None or not self.worker.is_alive():
+                self.worker = threading.Thread(
+                    target=self._work, name='slow-query-log', daemon=True)
+                self.worker.start()
+
+    def _work(self):
+        while True:
+            engine, statement, parameters, entry = self.queue.get()
+            try:
+                entry['plan'] = self.explain(engine, statement, parameters)
+            except Exception as e:
+                entry['plan'] = None
+                entry['plan_error'] = str(e)
+            finally:
+                logger.info(json.dumps(entry))
+                self.queue.task_done()
+
+    @staticmethod
+    def explain(engine, statement, parameters):
+        """Get the plan the database would use to run a statement."""
+        if isinstance(engine.pool, StaticPool):
+            # an in-memory database has one connection, busy with requests
+            raise RuntimeError('Cannot explain on a single shared connection.')
+
+        prefix = 'EXPLAIN QUERY PLAN ' if engine.dialect.name == 'sqlite' \
+            else 'EXPLAIN '
+
+        with engine.connect() as connection:
+            rows = connection.exec_driver_sql(prefix + statement, parameters)
+            return [' '.join(str(value) for value in row) for row in rows]
+
+    def flush(self):
+        """Wait until every queued statement has been logged."""
+        self.queue.join()
@@ -0,0 +1,54 @@
+"""Column types shared by the models."""
+
+from uuid import UUID
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+def _to_uuid(value):
+    if isinstance(value, UUID):
+        return value
+    try:
+        return UUID(value)
+    except (TypeError, ValueError, AttributeError):
+        return None
+
+
+class HexUUID(sa.TypeDecorator):
+    """A UUID stored compactly but read and written as a 32-char hex string.
+
+    PostgreSQL gets its native 16-byte UUID type and other databases a
+    16-byte BLOB. A value that is not a UUID, such as a mistyped id in a
+    URL, is bound as NULL and so matches no row.
+    """
+
+    impl = sa.LargeBinary(16)
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name == 'postgresql':
+            return dialect.type_descriptor(postgresql.UUID(as_uuid=True))
+        return dialect.type_descriptor(sa.LargeBinary(16))
+
+    def process_bind_param(self, value, dialect):
+        value = _to_uuid(value) if value is not None else None
+        if value is None or dialect.name == 'postgresql':
+            return value
+        return value.bytes
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        if isinstance(value, UUID):
+            return value.hex
+        return UUID(bytes=bytes(value)).hex
+
+    def literal_processor(self, dialect):
+        def process(value):
+            value = _to_uuid(value)
+            if value is None:
+                return 'NULL'
+            if dialect.name == 'postgresql':
+                return f"'{value}'::uuid"
+            return f"X'{value.hex}'"
+        return process
@@ -14,3 +14,4 @@ main.add_url_rule('/me/view-as-user', view_func=views.PoetView.as_view('preview_
 main.add_url_rule('/become-poet', view_func=views.BecomePoetView.as_view('become_poet'), methods=['GET', 'POST'])
 main.add_url_rule('/delete-account', view_func=views.DeleteUserView.as_view('delete_me'), methods=['GET'])
 main.add_url_rule('/take-survey', view_func=views.LoginView.as_view('handle_survey'), methods=['GET', 'POST'])
+main.add_url_rule('/uploads/<path:path>', view_func=views.UploadView.as_view('upload'), methods=['GET'])
@@ -1,7 +1,7 @@
 from flask import flash, redirect, url_for, render_template, request, current_app
 from flask_login import current_user, login_user
 from .. import db
-from ..models import User, Poet
+from ..models import User, Poet, get_current_poet
 from datetime import timedelta
 from .forms import PoetForm, UpdatePasswordForm, EditProfileForm
 
@@ -10,11 +10,10 @@ class MainController:
     def delete_account(self):
         """Remove a user's account from db."""
         user = User.find_by(id=current_user.id, one=True)
+        poet = get_current_poet()
 
-        if user and user.is_poet:
-            poet = Poet.find_by(user_id=user.id, one=True)
-
-            if poet.poems.all():
+        if user and poet:
+            if poet.poems.first():
                 flash('To proceed with this operation, please delete all your poems.')
                 # redirect to the handle_survey endpoint
                 return redirect(url_for('.handle_survey', type='account_deletion'))
@@ -5,6 +5,7 @@ from . import main
 from ..models import Poet
 from .forms import LoginForm, SignupForm, PoetForm
 from ..poems.views import PoetView
+from ..helpers.img_handler import send_upload
 from .controllers import MainController
 
 # Create the main controller
@@ -116,3 +117,9 @@ class SurveyView(MethodView):
     def get(self):
         """Handles different types of surveys. COMING SOON!"""
         return render_template('main/survey.html', survey_title='Account Deletion')
+
+
+class UploadView(MethodView):
+    def get(self, path):
+        """Send an uploaded file, or a 304 if the browser has it already."""
+        return send_upload(path)
@@ -1,14 +1,17 @@
 from . import db, login_manager
-from flask import current_app
+from flask import current_app, g, has_request_context
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import UserMixin, current_user
 from sqlalchemy.sql import func
+from sqlalchemy.dialects import postgresql, sqlite
 from uuid import uuid4
 from enum import Enum
-from markdown import markdown
-import bleach
+from functools import partial
 from slugify import slugify
-from .helpers.img_handler import delete_img
+from .helpers import search, page_cache, rendering, img_handler, \
+    image_variants
+from .helpers.page_cache import cached_until
+from .helpers.types import HexUUID
 
 
 class BaseModel(db.Model):
@@ -20,22 +23,25 @@ class BaseModel(db.Model):
         """Generate a uuid and return the 32-char string."""
         return uuid4().hex
 
-    id = db.Column(db.String(255), primary_key=True, default=_id)
+    id = db.Column(HexUUID, primary_key=True, default=_id)
     created_at = db.Column(db.DateTime(timezone=True),
                            server_default=func.now())
     updated_at = db.Column(db.DateTime(timezone=True), onupdate=func.now())
 
+    @staticmethod
+    def format_date(date):
+        """Format a date like '21st, Aug 2023'."""
+        day = date.day
+        suffix = 'th' if 11 <= day <= 13 else {1: 'st', 2: 'nd', 3: 'rd'}.get(day % 10, 'th')
+        return date.strftime(f"{day}{suffix}, %b %Y")
+
     @property
     def created_on(self):
-        day = self.created_at.day
-        suffix = 'th' if 11 <= day <= 13 else {1: 'st', 2: 'nd', 3: 'rd'}.get(day % 10, 'th')
-        return self.created_at.strftime(f"{day}{suffix}, %b %Y")
+        return self.format_date(self.created_at)
     
     @property
     def updated_on(self):
-        day = self.updated_at.day
-        suffix = 'th' if 11 <= day <= 13 else {1: 'st', 2: 'nd', 3: 'rd'}.get(day % 10, 'th')
-        return self.updated_at.strftime(f"{day}{suffix}, %b %Y")
+        return self.format_date(self.updated_at)
 
     def save(self):
         """Save instance to database."""
@@ -116,6 +122,10 @@ class BaseModel(db.Model):
         group_by = group_by or cls.id
         return db.session.query(*select).group_by(group_by)
 
+    def page_cache_tags(self):
+        """Get the tags of the cached pages that show this record."""
+        return []
+
     @property
     def slug(self):
         return slugify(self.title)
@@ -143,6 +153,9 @@ class User(UserMixin, BaseModel):
     @property
     def is_poet(self):
         """Check that user is an poet."""
+        if has_request_context() and current_user.get_id() == self.id:
+            return get_current_poet() is not None
+
         poet_exists = Poet.query.filter_by(user_id=self.id).first()
         return bool(poet_exists)
 
@@ -163,13 +176,32 @@ class User(UserMixin, BaseModel):
     def find_by_username(cls, username):
         return cls.find_by(username=username, one=True)
 
+    def page_cache_tags(self):
+        # usernames appear on the poem cards and pages and the poet choices;
+        # signing up or logging in changes none of them
+        session = db.object_session(self)
+        if self in session.deleted or self not in session.new and \
+                db.inspect(self).attrs.username.history.has_changes():
+            return ['poems', 'poets', 'categories']
+        return []
+
+    @staticmethod
+    def on_update(mapper, connection, target):
+        # usernames are shown with the poems and comments of their users
+        if db.inspect(target).attrs.username.history.has_changes():
+            Poem.touch(connection, Poem.author_id.in_(
+                db.select(Poet.id).where(Poet.user_id == target.id)
+            ) | Poem.id.in_(
+                db.select(Comment.poem_id).where(Comment.user_id == target.id)
+            ))
+
 
 class Poet(BaseModel):
     """Model representing an poet instance."""
 
     __tablename__ = 'poets'
 
-    user_id = db.Column(db.String(255), db.ForeignKey(
+    user_id = db.Column(HexUUID, db.ForeignKey(
         'users.id', ondelete='CASCADE'), unique=True)
     email = db.Column(db.String(255), unique=True, index=True)
     gender = db.Column(db.String(10), nullable=False)
@@ -190,8 +222,7 @@ class Poet(BaseModel):
     @property
     def poet_name(self):
         """Return the poet username."""
-        user = User.find_by(id=self.user_id, one=True)
-        return user.username
+        return self.users.username
 
     @classmethod
     def reached_limit(cls):
@@ -201,10 +232,21 @@ class Poet(BaseModel):
 
         return True if poets_count >= max_poets_count else False
 
+    def page_cache_tags(self):
+        return ['poets']
+
     @classmethod
+    @cached_until('poets')
     def get_choices(cls):
-        return [(poet.poet_name, poet.poet_name.capitalize())
-                for poet in cls.find_all()]
+        usernames = db.session.query(User.username).join(
+            cls, cls.user_id == User.id).order_by(User.username)
+        return [(username, username.capitalize())
+                for username, in usernames]
+
+    @staticmethod
+    def on_account_change(mapper, connection, target):
+        # drop the cached poet of the current user; it may have changed
+        g.pop('_current_poet', None)
 
 
 class Category(BaseModel):
@@ -223,33 +265,82 @@ class Category(BaseModel):
         category = cls.find_by(name=name, one=True)
         return category.id if category else None
 
+    def page_cache_tags(self):
+        return ['poems', 'categories']
+
+    @staticmethod
+    def on_update(mapper, connection, target):
+        # the category is named on the pages of its poems
+        if db.inspect(target).attrs.name.history.has_changes():
+            Poem.touch(connection, Poem.category_id == target.id)
+
     @classmethod
+    @cached_until('poems', 'categories')
+    def get_summaries(cls):
+        """Get every category with its number of poems in a single query."""
+        rows = db.session.query(
+            cls.id, cls.name, cls.description, cls.created_at,
+            func.count(Poem.id).label('poem_count')
+        ).outerjoin(Poem, Poem.category_id == cls.id).group_by(
+            cls.id, cls.name, cls.description, cls.created_at
+        ).order_by(cls.name).all()
+
+        return [{
+            'id': row.id,
+            'name': row.name,
+            'description': row.description,
+            'created_on': cls.format_date(row.created_at),
+            'poem_count': row.poem_count,
+        } for row in rows]
+
+    @classmethod
+    @cached_until('categories')
     def get_choices(cls):
-        return [(category.name, category.name.upper())
-                for category in cls.find_all()]
+        names = db.session.query(cls.name).order_by(cls.name)
+        return [(name, name.upper()) for name, in names]
 
 
 class Poem(BaseModel):
     """Model representing a poem instance."""
 
     __tablename__ = 'poems'
-
-    author_id = db.Column(db.String(255), db.ForeignKey('poets.id',
-                                                        ondelete='SET NULL'), nullable=True)
+    __table_args__ = (
+        # the latest published poems are listed on most pages
+        db.Index('ix_poems_published_created_at', 'published', 'created_at'),
+        # read backwards to seek the popular poems after a cursor
+        db.Index('ix_poems_rating_id', 'rating', 'id'),
+    )
+
+    author_id = db.Column(HexUUID, db.ForeignKey('poets.id',
+                                                        ondelete='SET NULL'), nullable=True, index=True)
     title = db.Column(db.String(255), unique=True)
     description = db.Column(db.String(3000), nullable=True)
-    category_id = db.Column(db.String(255), db.ForeignKey('categories.id',
-                                                          ondelete='SET NULL'), nullable=True)
+    category_id = db.Column(HexUUID, db.ForeignKey('categories.id',
+                                                          ondelete='SET NULL'), nullable=True, index=True)
+    slug = db.Column(db.String(255), unique=True, index=True)
     rating = db.Column(db.Float, default=0.0)
+    # running aggregates of the poem's ratings; rating holds their mean
+    rating_sum = db.Column(db.Float, default=0.0, server_default='0',
+                           nullable=False)
+    rating_count = db.Column(db.Integer, default=0, server_default='0',
+                             nullable=False)
     premium = db.Column(db.Boolean, default=False)
     completed = db.Column(db.Boolean, default=False)
     published = db.Column(db.Boolean, default=False)
+    # bumped by every write to the poem, its stanzas, comments and ratings,
+    # so that its page can be validated without being rendered
+    version = db.Column(db.Integer, default=1, server_default='1',
+                        nullable=False)
+    modified_at = db.Column(db.DateTime(timezone=True),
+                            server_default=func.now())
 
     # foreign keys
     stanzas = db.relationship(
         'Stanza', backref='poems', lazy='dynamic', cascade='all, delete, delete-orphan')
     comments = db.relationship('Comment', backref='poems', lazy='dynamic',
                                cascade='all,delete')
+    slug_redirects = db.relationship('PoemSlugRedirect', backref='poem',
+                                     cascade='all, delete, delete-orphan')
 
     @property
     def crafted_on(self):
@@ -258,17 +349,61 @@ class Poem(BaseModel):
     @property
     def is_accessible(self):
         """Check if current user is authorized to view or manipulate poem."""
-        if current_user.is_poet:
-            poet = Poet.find_by(user_id=current_user.id, one=True)
-            if self.author_id == poet.id:
-                return True
-        return False
+        poet = get_current_poet()
+        return poet is not None and self.author_id == poet.id
 
     def publish(self):
         """Publish or unpublish a poem."""
         self.published = not self.published
         self.save()
 
+    def page_cache_tags(self):
+        return ['poems', f'poem:{self.id}']
+
+    @classmethod
+    def update_rating(cls, poem_id, added, removed=None):
+        """Atomically fold a new or changed rating into a poem's aggregates."""
+        delta = added - (removed or 0)
+        count = cls.rating_count if removed is not None else cls.rating_count + 1
+
+        cls.query.filter_by(id=poem_id).update({
+            cls.rating_sum: cls.rating_sum + delta,
+            cls.rating_count: count,
+            cls.rating: (cls.rating_sum + delta) / count,
+            cls.version: cls.version + 1,
+            cls.modified_at: func.now(),
+        }, synchronize_session=False)
+
+    @classmethod
+    def recount_ratings(cls):
+        """Rebuild the rating aggregates of every poem from its ratings."""
+        totals = db.select(
+            PoemRating.poem_id,
+            func.sum(PoemRating.rating).label('total'),
+            func.count(PoemRating.id).label('count')
+        ).group_by(PoemRating.poem_id).subquery()
+
+        db.session.execute(db.update(cls).values(
+            rating_sum=0, rating_count=0, rating=0))
+        result = db.session.execute(db.update(cls).where(
+            cls.id == totals.c.poem_id
+        ).values(
+            rating_sum=totals.c.total, rating_count=totals.c.count,
+            rating=totals.c.total / totals.c.count
+        ))
+        cls.touch(db.session.connection())
+        db.session.commit()
+        return result.rowcount
+
+    @classmethod
+    def touch(cls, connection, *criteria):
+        """Bump the version of the poems matching the criteria, or of all."""
+        table = cls.__table__
+        # updated_at stays the time the poem itself was edited
+        connection.execute(table.update().where(*criteria).values(
+            version=table.c.version + 1, modified_at=func.now(),
+            updated_at=table.c.updated_at))
+
     @classmethod
     def get_choices(cls):
         return [(poem.title, poem.title.upper())
@@ -276,19 +411,107 @@ class Poem(BaseModel):
 
     @classmethod
     def find_poem_by_slug(cls, slugname):
-        for poem in cls.find_all():
-            if poem.slug == slugname:
-                return poem
-        return None
+        """Find a poem by its current slug or by one it was known by."""
+        poem = cls.find_by(slug=slugname, one=True)
+
+        if poem is None:
+            redirect = PoemSlugRedirect.find_by(slug=slugname, one=True)
+            poem = redirect.poem if redirect else None
+        return poem
+
+    @staticmethod
+    def on_update(mapper, connection, target):
+        """Bump the version of a poem whose columns changed."""
+        if db.object_session(target).is_modified(
+                target, include_collections=False):
+            target.version = Poem.version + 1
+            target.modified_at = func.now()
+
+    @staticmethod
+    def shown_with(record):
+        """Get the ids of the poems whose pages show a stanza or comment."""
+        # one moved to another poem has left the page of the first too
+        return {record.poem_id,
+                *db.inspect(record).attrs.poem_id.history.deleted} - {None}
+
+    @staticmethod
+    def on_content_change(mapper, connection, target):
+        """Bump the version of the poem a stanza or comment belongs to."""
+        poem_ids = Poem.shown_with(target)
+        if poem_ids:
+            Poem.touch(connection, Poem.id.in_(poem_ids))
+
+    @staticmethod
+    def unique_slug(target, title):
+        """Slugify a title, suffixed like 'ode-2' if another poem has it."""
+        # titles that differ only by case or punctuation share a slug
+        base = slugify(title) or 'poem'
+        criteria = [(Poem.slug == base) | Poem.slug.like(f'{base}-%')]
+        if target.id is not None:
+            criteria.append(Poem.id != target.id)
+
+        with db.session.no_autoflush:
+            taken = set(db.session.execute(
+                db.select(Poem.slug).where(*criteria)).scalars())
+        taken.update(poem.slug for poem in db.session.new
+                     if isinstance(poem, Poem) and poem is not target)
+
+        slug, suffix = base, 2
+        while slug in taken:
+            slug, suffix = f'{base}-{suffix}', suffix + 1
+        return slug
+
+    @staticmethod
+    def on_changed_title(target, value, oldvalue, initiator):
+        """Keep the stored slug in sync with the title."""
+        old_slug = target.slug
+        # a retitled poem keeps its slug while the title still slugifies to it
+        if value and old_slug and slugify(value) == old_slug:
+            return
+        new_slug = Poem.unique_slug(target, value) if value else None
+
+        if new_slug == old_slug:
+            return
+
+        target.slug = new_slug
+
+        with db.session.no_autoflush:
+            # a live slug always wins over a redirect with the same name
+            if new_slug:
+                stale = PoemSlugRedirect.find_by(slug=new_slug, one=True)
+                if stale is not None:
+                    db.session.delete(stale)
+
+            # remember the old slug so that existing links keep working
+            if old_slug and target.id is not None:
+                redirect = PoemSlugRedirect.find_by(slug=old_slug, one=True)
+                if redirect is None:
+                    redirect = PoemSlugRedirect(slug=old_slug)
+                target.slug_redirects.append(redirect)
+
+
+class PoemSlugRedirect(BaseModel):
+    """Model mapping a poem's former slug to the poem."""
+
+    __tablename__ = 'poem_slug_redirects'
+
+    slug = db.Column(db.String(255), unique=True, index=True, nullable=False)
+    poem_id = db.Column(HexUUID, db.ForeignKey(
+        'poems.id', ondelete='CASCADE'), nullable=False)
 
 
 class Stanza(BaseModel):
     """Model representing a stanza of a poem."""
 
     __tablename__ = 'stanzas'
-
-    poem_id = db.Column(db.String(255), db.ForeignKey(
-        'poems.id', ondelete='CASCADE'))
+    __table_args__ = (
+        # not unique: reordering renumbers every stanza in one statement
+        db.Index('ix_stanzas_poem_id_index', 'poem_id', 'index'),
+    )
+
+    # the poem a stanza is moved from is loaded, so its version is bumped
+    poem_id = db.column_property(db.Column(HexUUID, db.ForeignKey(
+        'poems.id', ondelete='CASCADE')), active_history=True)
     index = db.Column(db.Integer, nullable=False)
     content = db.Column(db.Text, nullable=False)
 
@@ -300,16 +523,78 @@ class Stanza(BaseModel):
     def edited_on(self):
         return self.updated_on
 
+    def page_cache_tags(self):
+        # stanzas are matched by the search page
+        return ['poems', *[f'poem:{poem_id}'
+                           for poem_id in Poem.shown_with(self)]]
+
+    @classmethod
+    def replace_for_poem(cls, poem_id, stanzas):
+        """Make the stanzas of a poem match a list, in one transaction.
+
+        ``stanzas`` lists every stanza in reading order. Items with an ``id``
+        keep that stanza, the others are created and the stanzas left out
+        are deleted. Returns the ids of the stanzas in their new order.
+        """
+        current = {row.id: row for row in db.session.execute(
+            db.select(cls.id, cls.index, cls.content).where(
+                cls.poem_id == poem_id))}
+
+        kept = [item['id'] for item in stanzas if item.get('id')]
+        if len(kept) != len(set(kept)) or not current.keys() >= set(kept):
+            raise ValueError('Each stanza can be listed once, and only '
+                             'stanzas of this poem can be kept.')
+
+        edits, moves, inserts, order = [], {}, [], []
+        for index, item in enumerate(stanzas, 1):
+            stanza = current.get(item.get('id'))
+
+            if stanza is None:
+                inserts.append({'id': uuid4().hex, 'poem_id': poem_id,
+                                'index': index, 'content': item['content']})
+                order.append(inserts[-1]['id'])
+                continue
+
+            if stanza.content != item['content']:
+                edits.append({'id': stanza.id, 'content': item['content']})
+            if stanza.index != index:
+                moves[stanza.id] = index
+            order.append(stanza.id)
+
+        db.session.execute(db.delete(cls).where(
+            cls.poem_id == poem_id, cls.id.not_in(kept)
+        ).execution_options(synchronize_session=False))
+        if edits:
+            db.session.execute(db.update(cls), edits)
+        if moves:
+            # a single statement renumbers every moved stanza
+            db.session.execute(db.update(cls).where(cls.id.in_(moves)).values(
+                index=db.case(*[(cls.id == stanza_id, index)
+                                for stanza_id, index in moves.items()])
+            ).execution_options(synchronize_session=False))
+        if inserts:
+            db.session.execute(db.insert(cls), inserts)
+
+        # bulk statements skip the events that keep these up to date
+        connection = db.session.connection()
+        search.get_backend(connection.dialect.name).reindex(connection, poem_id)
+        Poem.touch(connection, Poem.id == poem_id)
+        page_cache.invalidate('poems', f'poem:{poem_id}')
+
+        db.session.commit()
+        return order
+
 
 class Comment(BaseModel):
     """Model representing a comment made by a user on a poem."""
 
     __tablename__ = 'comments'
 
-    user_id = db.Column(db.String(255), db.ForeignKey(
+    user_id = db.Column(HexUUID, db.ForeignKey(
         'users.id', ondelete='CASCADE'))
-    poem_id = db.Column(db.String(255), db.ForeignKey(
-        'poems.id', ondelete='CASCADE'))
+    # the poem a comment is moved from is loaded, so its version is bumped
+    poem_id = db.column_property(db.Column(HexUUID, db.ForeignKey(
+        'poems.id', ondelete='CASCADE'), index=True), active_history=True)
     comment = db.Column(db.String(255), nullable=False)
     approved = db.Column(db.Boolean, default=False)
 
@@ -317,15 +602,25 @@ class Comment(BaseModel):
     def last_edit(self):
         return self.updated_on
 
+    def page_cache_tags(self):
+        return [f'poem:{poem_id}' for poem_id in Poem.shown_with(self)]
+
 
 class PoemRating(BaseModel):
     """Model representing rating given by a user to a poem."""
 
     __tablename__ = 'poem_ratings'
-
-    user_id = db.Column(db.String(255), db.ForeignKey(
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'poem_id',
+                            name='uq_poem_ratings_user_id_poem_id'),
+        # the unique constraint leads with user_id, so it cannot serve
+        # the lookups of a poem's ratings
+        db.Index('ix_poem_ratings_poem_id', 'poem_id'),
+    )
+
+    user_id = db.Column(HexUUID, db.ForeignKey(
         'users.id', ondelete='CASCADE'))
-    poem_id = db.Column(db.String(255), db.ForeignKey(
+    poem_id = db.Column(HexUUID, db.ForeignKey(
         'poems.id', ondelete='CASCADE'))
     rating = db.Column(db.Float, default=0.0)
 
@@ -333,11 +628,31 @@ class PoemRating(BaseModel):
     def rated_on(self):
         return self.created_at
 
+    def page_cache_tags(self):
+        return ['poems', f'poem:{self.poem_id}']
+
+    def change(self, rating):
+        """Change the rating if it still holds the value that was read.
+
+        Returns whether it changed, so that of concurrent changes only one
+        adjusts the poem's aggregates by the old value.
+        """
+        changed = type(self).query.filter_by(
+            id=self.id, rating=self.rating
+        ).update({PoemRating.rating: rating}, synchronize_session=False)
+        # the update skips the flush that collects the page cache tags
+        if changed == 1:
+            page_cache.invalidate(*self.page_cache_tags())
+        return changed == 1
+
 
 class Resource(BaseModel):
     """Represents a resource added by a poet."""
 
     __tablename__ = 'resources'
+    __table_args__ = (
+        db.Index('ix_resources_rtype_published', 'rtype', 'published'),
+    )
 
     class ResourceTypes(Enum):
         LINK = 0
@@ -351,20 +666,119 @@ class Resource(BaseModel):
     published = db.Column(db.Boolean, default=False)
     body_html = db.Column(db.Text)
     approved = db.Column(db.Boolean, default=True)
-    poet_id = db.Column(db.String(255), db.ForeignKey(
+    poet_id = db.Column(HexUUID, db.ForeignKey(
         'poets.id', ondelete='CASCADE'))
+    # vote tallies kept in sync with the reactions table
+    upvotes = db.Column(db.Integer, default=0, server_default='0',
+                        nullable=False)
+    downvotes = db.Column(db.Integer, default=0, server_default='0',
+                          nullable=False)
+    # the downscaled copies of an image, by name; see image_variants
+    variants = db.Column(db.JSON(none_as_null=True))
 
-    @property
-    def upvotes(self):
-        reactions = Reaction.find_by(reaction_type='UPVOTE',
-                                     record_id=self.id)
-        return len(reactions)
+    VOTE_COLUMNS = {'UPVOTE': 'upvotes', 'DOWNVOTE': 'downvotes'}
 
-    @property
-    def downvotes(self):
-        reactions = Reaction.find_by(reaction_type='DOWNVOTE',
-                                     record_id=self.id)
-        return len(reactions)
+    @classmethod
+    def update_votes(cls, resource_id, added=None, removed=None):
+        """Atomically adjust the vote tallies of a resource."""
+        values = {}
+
+        if added in cls.VOTE_COLUMNS:
+            column = getattr(cls, cls.VOTE_COLUMNS[added])
+            values[column] = column + 1
+        if removed in cls.VOTE_COLUMNS:
+            column = getattr(cls, cls.VOTE_COLUMNS[removed])
+            values[column] = column - 1
+
+        if values:
+            cls.query.filter_by(id=resource_id).update(
+                values, synchronize_session=False)
+
+    @classmethod
+    def recount_votes(cls):
+        """Recompute the vote tallies of every resource from reactions."""
+        def tally(reaction_type):
+            return db.select(func.count(Reaction.id)).where(
+                (Reaction.record_id == cls.id) &
+                (Reaction.reaction_type == reaction_type)
+            ).scalar_subquery()
+
+        result = db.session.execute(db.update(cls).values(
+            upvotes=tally('UPVOTE'), downvotes=tally('DOWNVOTE')
+        ))
+        db.session.commit()
+        return result.rowcount
+
+    @classmethod
+    def rerender_bodies(cls, render_map=map, batch_size=500):
+        """Render the html of every text resource again from its body.
+
+        ``render_map`` maps the renderer over a batch of bodies; pass the
+        ``map`` of a process pool to render in parallel. Only the resources
+        whose html changed are written. Returns how many there were.
+        """
+        image = cls.ResourceTypes.IMAGE.value
+        changed, last_id = 0, None
+
+        while True:
+            query = db.select(cls.id, cls.body, cls.body_html, cls.updated_at
+                              ).where(cls.rtype != image).order_by(cls.id)
+            if last_id is not None:
+                query = query.where(cls.id > last_id)
+            rows = db.session.execute(query.limit(batch_size)).all()
+            if not rows:
+                break
+
+            htmls = render_map(rendering.render_markdown,
+                               [row.body for row in rows])
+            # keep updated_at, as a re-render is not an edit
+            updates = [{'id': row.id, 'body_html': html,
+                        'updated_at': row.updated_at}
+                       for row, html in zip(rows, htmls)
+                       if html != row.body_html]
+            if updates:
+                db.session.execute(db.update(cls), updates)
+                db.session.commit()
+
+            changed += len(updates)
+            last_id = rows[-1].id
+        return changed
+
+    @classmethod
+    def make_image_variants(cls, variants_map=map, force=False,
+                            batch_size=100):
+        """Make and record the variants of the image resources lacking them.
+
+        ``variants_map`` maps the maker over a batch of stored images; pass
+        the ``map`` of a process pool to make them in parallel. With
+        ``force`` the variants of every image are recorded again. Returns
+        how many resources were recorded.
+        """
+        upload_folder = current_app.config['UPLOAD_FOLDER']
+        query = db.select(cls.id, cls.body).where(
+            cls.rtype == cls.ResourceTypes.IMAGE.value).order_by(cls.id)
+        if not force:
+            query = query.where(cls.variants.is_(None))
+        recorded, last_id = 0, None
+
+        while True:
+            batch = query if last_id is None else query.where(cls.id > last_id)
+            rows = db.session.execute(batch.limit(batch_size)).all()
+            # the variants are recorded on their own connection, which a
+            # read left open here would keep waiting on SQLite
+            db.session.rollback()
+            if not rows:
+                break
+
+            images = [row for row in rows
+                      if img_handler.upload_path(row.body) is not None]
+            made = variants_map(
+                partial(image_variants.make_variants, upload_folder),
+                [img_handler.upload_path(row.body) for row in images])
+            for row, variants in zip(images, made):
+                recorded += image_variants.record(row.id, row.body, variants)
+            last_id = rows[-1].id
+        return recorded
 
     def has_voted(self):
         """Checks if the current user has voted."""
@@ -398,56 +812,125 @@ class Resource(BaseModel):
 
     @staticmethod
     def on_changed_body(target, value, oldvalue, initiator):
-        allowed_tags = [
-            'a', 'abbr', 'acronym', 'b', 'blockquote', 'code',
-            'em', 'i', 'li', 'ol', 'pre', 'strong', 'ul',
-            'h1', 'h2', 'h3', 'h4', 'h5', 'p', 'u', 'del',
-            's', 'sup', 'sub'
-        ]
-
+        # an unchanged body keeps its rendered html
+        if value == oldvalue:
+            return
 
         if Resource.get_type_key(target.rtype) == 'IMAGE':
-            if oldvalue and not hasattr(oldvalue, 'NO_VALUE'):
-                # delete the existing image
-                delete_img(oldvalue)
-        else:
-            if value:
-                # parse the value into html and save to body_html
-                target.body_html = bleach.linkify(bleach.clean(markdown(
-                    value, output_format='html'),
-                    tags=allowed_tags, strip=True
-                ))
-    
+            # the variants of the old image are not this one's
+            target.variants = None
+        elif value:
+            # parse the value into html and save to body_html
+            target.body_html = rendering.render(value)
+
+    @staticmethod
+    def on_image_change(mapper, connection, target):
+        """Count the uses of the stored images a resource adds or drops."""
+        if Resource.get_type_key(target.rtype) != 'IMAGE':
+            return
+
+        history = db.inspect(target).attrs.body.history
+        added, deleted = set(history.added), set(history.deleted)
+        for url in added - deleted:
+            Upload.acquire(connection, img_handler.upload_path(url))
+            image_variants.generate_after_commit(
+                db.object_session(target), target.id, url)
+        for url in deleted - added:
+            Resource._release_image(connection, target, url)
+
     @staticmethod
     def on_delete_listener(mapper, connection, target):
-        # call the on_change_body to remove any image from filesystem
-        Resource.on_changed_body(target, None, target.body, None)
+        if Resource.get_type_key(target.rtype) == 'IMAGE':
+            Resource._release_image(connection, target, target.body)
+
+    @staticmethod
+    def _release_image(connection, target, url):
+        # the file goes once no resource uses it and the deletion commits
+        if Upload.release(connection, img_handler.upload_path(url)):
+            img_handler.delete_after_commit(db.object_session(target), url)
 
     @property
     def is_accessible(self):
         """Check if current user is authorized to manipulate resource."""
-        if current_user.is_poet:
-            poet = Poet.find_by(user_id=current_user.id, one=True)
-            if self.poet_id == poet.id:
-                return True
-        return False
+        poet = get_current_poet()
+        return poet is not None and self.poet_id == poet.id
+
+    def image_url(self, variant='card'):
+        """Get the url of a variant of an image, or of the image itself."""
+        return (self.variants or {}).get(variant, {}).get('url', self.body)
+
+    @property
+    def srcset(self):
+        """Get the srcset of an image's variants, if they are made yet."""
+        if not self.variants:
+            return None
+        widths = {}
+        for variant in self.variants.values():
+            widths.setdefault(variant['width'], variant['url'])
+        return ', '.join(f'{url} {width}w'
+                         for width, url in sorted(widths.items()))
+
+
+class Upload(BaseModel):
+    """Represents a stored upload and the number of records using it."""
+
+    __tablename__ = 'uploads'
+
+    path = db.Column(db.String(255), unique=True, nullable=False)
+    refcount = db.Column(db.Integer, default=0, server_default='0',
+                         nullable=False)
+
+    @classmethod
+    def acquire(cls, connection, path):
+        """Count one more use of a stored file."""
+        if path is None:
+            return
+
+        table = cls.__table__
+        # a concurrent first use of the same file counts on the same row
+        insert = postgresql.insert if connection.dialect.name == 'postgresql' \
+            else sqlite.insert
+        connection.execute(insert(table).values(
+            path=path, refcount=1
+        ).on_conflict_do_update(index_elements=[table.c.path],
+                                set_={'refcount': table.c.refcount + 1}))
+
+    @classmethod
+    def release(cls, connection, path):
+        """Count one use less of a stored file; True if it was the last."""
+        if path is None:
+            return False
+
+        table = cls.__table__
+        connection.execute(db.update(table).where(
+            table.c.path == path).values(refcount=table.c.refcount - 1))
+        result = connection.execute(db.delete(table).where(
+            (table.c.path == path) & (table.c.refcount <= 0)))
+        return result.rowcount > 0
 
 
 class Reaction(BaseModel):
     """Represent a user who votes on a resource."""
 
     __tablename__ = 'reactions'
+    __table_args__ = (
+        # a user has a single reaction to a record, moved between types
+        db.UniqueConstraint('record_id', 'user_id',
+                            name='uq_reactions_record_id_user_id'),
+        db.Index('ix_reactions_record_id_reaction_type',
+                 'record_id', 'reaction_type'),
+    )
 
     class ReactionTypes:
         UPVOTE = 'UPVOTE'
         DOWNVOTE = 'DOWNVOTE'
         RATE = 'RATE'
 
-    user_id = db.Column(db.String(255), db.ForeignKey('users.id',
+    user_id = db.Column(HexUUID, db.ForeignKey('users.id',
                                                       ondelete='CASCADE'))
     reaction_type = db.Column(db.String(16), nullable=False)
     # holds the id of the object of user's reaction e.g poem or resource.
-    record_id = db.Column(db.String(255), nullable=False)
+    record_id = db.Column(HexUUID, nullable=False)
     value = db.Column(db.Float(precision=1), default=0.0)
 
     @classmethod
@@ -455,6 +938,18 @@ class Reaction(BaseModel):
         return {k: v for k, v in cls.ReactionTypes.__dict__
                 if not k.startswith('_')}
 
+    @classmethod
+    def switch_type(cls, reaction_id, old, new):
+        """Move a reaction to another type if it still has the old one.
+
+        Returns whether it moved, so that of concurrent switches only one
+        adjusts the tallies.
+        """
+        moved = cls.query.filter_by(
+            id=reaction_id, reaction_type=old
+        ).update({cls.reaction_type: new}, synchronize_session=False)
+        return moved == 1
+
 
 # load user into the login manager if user exists.
 @login_manager.user_loader
@@ -463,6 +958,43 @@ def load_user(user_id):
     return User.find_by(id=user_id, one=True)
 
 
+def get_current_poet():
+    """Get the poet account of the current user, querying once per request."""
+    if not current_user.is_authenticated:
+        return None
+
+    user_id, poet = g.get('_current_poet', (None, None))
+
+    if user_id != current_user.id:
+        poet = Poet.find_by(user_id=current_user.id, one=True)
+        g._current_poet = (current_user.id, poet)
+    return poet
+
+
 # add event listeners
-db.event.listen(Resource.body, 'set', Resource.on_changed_body)
-db.event.listen(Resource, 'before_delete', Resource.on_delete_listener)
\ No newline at end of file
+db.event.listen(Poem.title, 'set', Poem.on_changed_title)
+db.event.listen(Resource.body, 'set', Resource.on_changed_body,
+                active_history=True)
+db.event.listen(Resource, 'after_insert', Resource.on_image_change)
+db.event.listen(Resource, 'after_update', Resource.on_image_change)
+db.event.listen(Resource, 'after_delete', Resource.on_delete_listener)
+db.event.listen(Poet, 'after_insert', Poet.on_account_change)
+db.event.listen(Poet, 'after_delete', Poet.on_account_change)
+
+# keep the versions that poem pages are validated with up to date
+db.event.listen(Poem, 'before_update', Poem.on_update)
+db.event.listen(Category, 'after_update', Category.on_update)
+db.event.listen(User, 'after_update', User.on_update)
+for model in (Stanza, Comment):
+    for event in ('after_insert', 'after_update', 'after_delete'):
+        db.event.listen(model, event, Poem.on_content_change)
+
+# keep the full-text search documents of poems up to date
+db.event.listen(db.metadata, 'after_create', search.create_index)
+db.event.listen(db.metadata, 'before_drop', search.drop_index)
+db.event.listen(Poem, 'after_insert', search.on_poem_change)
+db.event.listen(Poem, 'after_update', search.on_poem_change)
+db.event.listen(Poem, 'after_delete', search.on_poem_delete)
+db.event.listen(Stanza, 'after_insert', search.on_stanza_change)
+db.event.listen(Stanza, 'after_update', search.on_stanza_change)
+db.event.listen(Stanza, 'after_delete', search.on_stanza_delete)
@@ -0,0 +1,53 @@
+import click
+from . import poems, transfer
+from .. import db
+from ..helpers import search, page_cache
+from ..models import Poem
+
+
+@poems.cli.command('reindex')
+def reindex():
+    """Rebuild the full-text search documents of all the poems."""
+    with db.engine.begin() as connection:
+        backend = search.get_backend(connection.dialect.name)
+        backend.create(connection)
+        backend.reindex_all(connection)
+    click.echo('Rebuilt the poems search index.')
+
+
+@poems.cli.command('recount-ratings')
+def recount_ratings():
+    """Rebuild the rating aggregates of all the poems."""
+    count = Poem.recount_ratings()
+    # every listing and poem page shows ratings
+    page_cache.bump('poems', 'categories')
+    click.echo(f'Recounted the ratings of {count} poem(s).')
+
+
+@poems.cli.command('export')
+@click.argument('output', type=click.File('w'), default='-')
+@click.option('--batch-size', default=500, help='Poems read per batch.')
+def export(output, batch_size):
+    """Write every poem with its stanzas as JSON Lines to OUTPUT."""
+    count = 0
+    for line in transfer.export_poems(batch_size=batch_size):
+        output.write(line)
+        count += 1
+    click.echo(f'Exported {count} poem(s).', err=True)
+
+
+@poems.cli.command('import')
+@click.argument('source', type=click.File('rb'))
+@click.option('--chunk-size', default=500, help='Poems saved per transaction.')
+def import_(source, chunk_size):
+    """Create or update poems by slug from the JSON Lines in SOURCE."""
+    try:
+        created, updated, _ = transfer.import_poems(source,
+                                                    chunk_size=chunk_size)
+    except transfer.PoemImportError as e:
+        created, updated, _ = e.counts
+        if created or updated:
+            click.echo(f'Created {created} and updated {updated} poem(s) '
+                       'before the failure.', err=True)
+        raise click.ClickException(str(e))
+    click.echo(f'Created {created} and updated {updated} poem(s).')
@@ -2,7 +2,12 @@ from flask import redirect, request, flash, url_for, current_app
 from flask_login import current_user
 from ..utils import can_manage_poem
 from sqlalchemy.exc import OperationalError, IntegrityError
-from ..models import Poet, Poem, Category, Stanza, Comment, User
+from sqlalchemy.orm import joinedload, contains_eager
+from ..helpers import search, keyset
+from . import transfer
+from .. import db
+from ..models import (Poet, Poem, Category, Stanza, Comment, User,
+                      PoemRating, get_current_poet)
 
 
 class PoemsController:
@@ -35,13 +40,43 @@ class PoemsController:
             'AUTHORS': [Poem.author_id, Poem.rating.desc(), Poem.premium],
         }
 
-        return ORDERS.get(order_by.upper(), 'A-Z')
+        return ORDERS.get(order_by.upper(), ORDERS['A-Z'])
+
+    def __get_keyset(self, order_by: str):
+        """Get the name and the unique sort key of an ordering for seeking."""
+        KEYSETS = {
+            'RECENT': [(Poem.created_at, True)],
+            'POPULAR': [(Poem.rating, True)],
+            'A-Z': [(Poem.title, False)],
+            'Z-A': [(Poem.title, True)],
+            # poems of deleted or unknown authors come last
+            'AUTHORS': [(Poem.author_id, False, True), (Poem.rating, True)],
+        }
+
+        name = order_by.upper() if order_by.upper() in KEYSETS else 'A-Z'
+        # the id breaks ties, so that every row has a distinct position; it
+        # follows the last key, so an index on both is read in one direction
+        keys = [*KEYSETS[name], (Poem.id, KEYSETS[name][-1][1])]
+
+        return name, [(keyset.sort_column(column), *options)
+                      for column, *options in keys]
     
+    def __with_card_data(self, query, category_joined=False):
+        """Load the category and author username shown on poem cards."""
+        category = contains_eager(Poem.categories) if category_joined \
+            else joinedload(Poem.categories)
+
+        return query.options(
+            category, joinedload(Poem.poets).joinedload(Poet.users)
+        )
+
     def __get_published_or_owned_by(self, query):
-        if current_user.is_anonymous or not current_user.is_poet:
+        poet = get_current_poet()
+
+        if poet is None:
             query = query.filter(Poem.published == True)
         else:
-            poet_id = Poet.find_by(user_id=current_user.id, one=True).id
+            poet_id = poet.id
 
             # filter out poems that are not published and owned by current user
             query = query.filter(((Poem.author_id == poet_id) & (
@@ -50,8 +85,7 @@ class PoemsController:
 
         return query
     
-    def get_poems(self, category, page, order_by='RECENT'):
-
+    def __get_listing_query(self, category):
         # query both the Poem and Category tables
         query = Poem.join(Category, 'category_id', False)
 
@@ -61,11 +95,33 @@ class PoemsController:
         if category:
             query = query.filter(Category.name == category)
 
+        return self.__with_card_data(query, category_joined=True)
+
+    def get_poems(self, category, page, order_by='RECENT'):
+        query = self.__get_listing_query(category)
+
         return query.order_by(*self.__get_ordering_list(order_by)).paginate(
             page=page, per_page=current_app.config.get('FLASK_POEMS_PER_PAGE', 10),
             error_out=False
         )
     
+    def get_poems_after(self, category, cursor, order_by='RECENT'):
+        """Get the page of poems after a cursor instead of a page number."""
+        query = self.__get_listing_query(category)
+        name, keys = self.__get_keyset(order_by)
+
+        # counting would cost a scan, so estimate the total instead
+        if category:
+            total = next((c['poem_count'] for c in self.get_categories()
+                          if c['name'] == category), 0)
+        else:
+            total = keyset.estimate_count(Poem.__tablename__)
+
+        return keyset.paginate(
+            query, name, keys, cursor,
+            current_app.config.get('FLASK_POEMS_PER_PAGE', 10), total
+        )
+    
     def __process_search_query(self, query_params: dict):
         """Process the form data passed and returned a more refined dict data."""
         query_data = {}
@@ -100,7 +156,7 @@ class PoemsController:
 
         return query_data
     
-    def search(self):
+    def __get_search_query(self):
         # parse and convert query string into dictionary
         query_params = self.__process_search_query(
             request.args.to_dict(flat=True)
@@ -108,14 +164,15 @@ class PoemsController:
 
         # initializing database query
         query = Poem.query
+        ordering = self.__get_ordering_list('A-Z')
 
-        # query by search string
+        # query the full-text index by search string, best matches first
         if query_params.get('q'):
-            print(type(query_params.get('q')), 'search string')
             search_string = query_params.pop('q')
-            query = query.filter(
-                Poem.title.ilike(f'%{search_string}%') | Poem.description.ilike(f'%{search_string}%')
-            )
+            query, rank = search.get_backend().match(query, Poem, search_string)
+
+            if rank is not None:
+                ordering = [rank, *ordering]
         
         # filter query by rating
         if query_params.get('rating'):
@@ -131,8 +188,28 @@ class PoemsController:
         
         # remove any unpublished poems that the current user did not compose
         query = self.__get_published_or_owned_by(query)
+        query = self.__with_card_data(query)
+
+        return query.order_by(*ordering)
 
-        return query.order_by(*self.__get_ordering_list('A-Z')).all()
+    def search(self, page=1, per_page=None):
+        """Get a page of the poems that match the search query and filters."""
+        max_per_page = current_app.config.get('FLASK_SEARCH_MAX_PER_PAGE', 50)
+        per_page = per_page or current_app.config.get('FLASK_POEMS_PER_PAGE', 10)
+
+        return self.__get_search_query().paginate(
+            page=page, per_page=min(max(per_page, 1), max_per_page),
+            error_out=False
+        )
+
+    def stream_search(self):
+        """Yield every poem that matches the search query and filters.
+
+        Rows are fetched from a server-side cursor in batches, so the full
+        result set is never held in memory.
+        """
+        batch_size = current_app.config.get('FLASK_SEARCH_STREAM_BATCH', 500)
+        yield from self.__get_search_query().yield_per(batch_size)
     
     def create_category(self, data):
         try:
@@ -145,12 +222,16 @@ class PoemsController:
         
         return False
     
-    def get_categories(self):
-        categories = Category.find_all()
-        return [(category.id, category.poems.count()) for category in categories]
+    def get_categories(self, with_poems=False):
+        """Get the summaries of categories, optionally only those with poems."""
+        categories = Category.get_summaries()
+
+        if with_poems:
+            categories = [c for c in categories if c['poem_count']]
+        return categories
     
     def create_poem(self, data: dict):
-        poet = Poet.find_by(user_id=current_user.id, one=True)
+        poet = get_current_poet()
         category_id = Category.get_id(data.pop('category'))
 
         data.update({
@@ -173,8 +254,11 @@ class PoemsController:
         
         return poem
     
-    def get_poem(self, poem_id=None, slugname=None):
-        if slugname is not None:
+    def get_poem(self, poem_id=None, slugname=None, poem=None):
+        """Get a poem the current user may see; pass it if it is loaded."""
+        if poem is not None:
+            pass
+        elif slugname is not None:
             poem = Poem.find_poem_by_slug(slugname)
         else:
             poem = Poem.find_by(id=poem_id, one=True)
@@ -204,12 +288,45 @@ class PoemsController:
         except IntegrityError as e:
             flash('You have already added this comment', 'error')
     
+    def rate_poem(self, poem, rating):
+        """Add or change the current user's rating of a poem."""
+        existing = PoemRating.find_by(user_id=current_user.id,
+                                      poem_id=poem.id, one=True)
+
+        try:
+            if existing is None:
+                Poem.update_rating(poem.id, rating)
+                PoemRating.create(user_id=current_user.id, poem_id=poem.id,
+                                  rating=rating)
+            elif existing.rating != rating:
+                # a concurrent change must not remove the same old rating
+                if existing.change(rating):
+                    Poem.update_rating(poem.id, rating,
+                                       removed=existing.rating)
+                db.session.commit()
+
+            flash('Thank you for rating this poem')
+            return True
+        except IntegrityError:
+            db.session.rollback()
+            flash('You have already rated this poem', 'error')
+
+        return False
+
+    def get_user_rating(self, poem):
+        """Get the rating the current user gave a poem, if any."""
+        if current_user.is_anonymous:
+            return None
+
+        return db.session.query(PoemRating.rating).filter_by(
+            user_id=current_user.id, poem_id=poem.id).scalar()
+
     def get_poet(self, poem_id=None):
         poet = None
         message = ''
 
         if poem_id is None:
-            poet = Poet.find_by(user_id=current_user.id, one=True)
+            poet = get_current_poet()
 
             if poet is None:
                 message = 'You are not a poet. Go to your profile page to create a poet account'
@@ -230,7 +347,7 @@ class PoemsController:
             if poet.user_id != current_user.id:
                 poems = poems.filter_by(published=True)
             
-            poems = poems.order_by(*self.__get_ordering_list('RECENT')).limit(
+            poems = self.__with_card_data(poems).order_by(*self.__get_ordering_list('RECENT')).limit(
                 current_app.config.get('FLASK_POEMS_PER_PAGE', 5)
             ).all()
 
@@ -240,14 +357,10 @@ class PoemsController:
         return False
     
     def delete_poem(self, poem_id):
-        if not can_manage_poem(poem_id):
-            flash("Don't be a sly; you cannot control what you don't have!", 'error')
-            return False
-        
-        poem = Poem.find_by(id=poem_id, one=True)
+        poem = can_manage_poem(poem_id)
 
-        if poem is None:
-            flash('There is no poem with given id', 'error')
+        if not poem:
+            flash("Don't be a sly; you cannot control what you don't have!", 'error')
             return False
         
         poem.delete()
@@ -280,3 +393,47 @@ class PoemsController:
 
         flash(f'Stanza {stanza.index} has been removed from this poem')
         return True
+
+    def save_stanzas(self, poem, stanzas):
+        """Replace all the stanzas of a poem; return an error or None."""
+        if not isinstance(stanzas, list) or not all(
+            isinstance(item, dict) and isinstance(item.get('content'), str)
+            and 0 < len(item['content'].strip()) <= 3000
+            and isinstance(item.get('id'), (str, type(None)))
+            for item in stanzas
+        ):
+            return 'Send a list of stanzas, each with 1 to 3000 characters of content'
+
+        try:
+            Stanza.replace_for_poem(poem.id, [
+                {'id': item.get('id'), 'content': item['content'].strip()}
+                for item in stanzas])
+        except ValueError as e:
+            db.session.rollback()
+            return str(e)
+        return None
+
+    def export_poems(self):
+        """Stream the current poet's poems as JSON Lines."""
+        return transfer.export_poems(author_id=get_current_poet().id)
+
+    def import_poems(self, file):
+        """Create or update the current poet's poems from a JSON Lines file."""
+        try:
+            counts = transfer.import_poems(file,
+                                           author_id=get_current_poet().id)
+        except transfer.PoemImportError as e:
+            flash(str(e), 'error')
+            # the chunks before the failing line are saved all the same
+            if any(e.counts):
+                flash(self.__import_summary('Imported the poems up to the failure',
+                                            *e.counts))
+        else:
+            flash(self.__import_summary('Imported your poems', *counts))
+
+    @staticmethod
+    def __import_summary(message, created, updated, skipped):
+        message += f': {created} created, {updated} updated'
+        if skipped:
+            message += f', {skipped} skipped as they belong to other poets'
+        return message
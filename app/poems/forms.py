@@ -4,6 +4,7 @@ from wtforms import (StringField, IntegerField,
                      SelectField, TextAreaField, IntegerRangeField)
 from wtforms.validators import (DataRequired, Length,
                                 NumberRange, Regexp)
+from flask_wtf.file import FileField, FileRequired, FileAllowed
 from ..models import Category, Poet
 from flask import request
 
@@ -50,7 +51,7 @@ class FilterPoemForm(FlaskForm):
         self.poet.choices = [('', 'All'), *Poet.get_choices()]
 
         # delete csrf token on GET requests
-        if request.method == 'GET':
+        if request.method == 'GET' and 'csrf_token' in self:
             del self.csrf_token
 
     def hidden_tag(self, *fields):
@@ -83,9 +84,26 @@ class CategoryForm(FlaskForm):
     submit = SubmitField('Add Category')
 
 
+class RatingForm(FlaskForm):
+    """Represents the form for rating poems."""
+
+    rating = IntegerRangeField('Rate this poem', validators=[
+        DataRequired(), NumberRange(1, 5)], default=3,
+        render_kw={'min': 1, 'max': 5})
+    submit = SubmitField('Rate')
+
+
 class CommentForm(FlaskForm):
     """Represents the form for creating or editing comments."""
 
     comment = TextAreaField('Add a comment', validators=[
         Length(1, 1000), DataRequired()], render_kw={'rows': '2'})
     submit = SubmitField('Post')
+
+
+class PoemImportForm(FlaskForm):
+    """Represents the form for importing poems from a JSON Lines file."""
+
+    poems = FileField('Choose a JSON Lines File of Poems:', validators=[
+        FileRequired(), FileAllowed(['jsonl', 'json'], 'JSON Lines files only!')])
+    submit = SubmitField('Import Poems')
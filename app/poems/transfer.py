@@ -0,0 +1,247 @@
+"""Export and import poems with their stanzas as JSON Lines.
+
+Every line holds one poem with its stanzas, the name of its category and
+the username of its author. Exports stream from the database in batches
+and imports upsert poems by slug in chunked transactions, so neither holds
+more than a batch of poems in memory.
+"""
+
+import json
+from itertools import islice
+from uuid import uuid4
+from slugify import slugify
+from sqlalchemy.exc import IntegrityError
+from .. import db
+from ..helpers import search, page_cache
+from ..models import Poem, Stanza, Category, Poet, User
+
+POEM_FIELDS = ('title', 'description', 'premium', 'completed', 'published')
+FLAGS = ('premium', 'completed', 'published')
+TEXTS = ('description', 'category', 'author')
+MAX_TITLE_LENGTH = 255
+
+
+class PoemImportError(ValueError):
+    """Raised when an import stops at poems that cannot be imported.
+
+    The chunks before them stay committed; ``counts`` holds the numbers of
+    poems they created, updated and skipped.
+    """
+
+    def __init__(self, message, counts=(0, 0, 0)):
+        super().__init__(message)
+        self.counts = counts
+
+
+def export_poems(author_id=None, batch_size=500):
+    """Yield every poem, or every poem of an author, as a line of JSON."""
+    statement = db.select(
+        Poem.id, Poem.slug, *[getattr(Poem, field) for field in POEM_FIELDS],
+        Poem.created_at, Category.name.label('category'),
+        User.username.label('author')
+    ).outerjoin(Category, Category.id == Poem.category_id).outerjoin(
+        Poet, Poet.id == Poem.author_id
+    ).outerjoin(User, User.id == Poet.user_id).order_by(Poem.id)
+
+    if author_id is not None:
+        statement = statement.where(Poem.author_id == author_id)
+
+    # rows come from a server-side cursor one batch at a time
+    result = db.session.execute(
+        statement.execution_options(yield_per=batch_size))
+
+    for rows in result.partitions():
+        stanzas = {row.id: [] for row in rows}
+        for stanza in db.session.execute(db.select(
+            Stanza.poem_id, Stanza.index, Stanza.content
+        ).where(Stanza.poem_id.in_(stanzas)).order_by(
+            Stanza.poem_id, Stanza.index
+        )):
+            stanzas[stanza.poem_id].append(
+                {'index': stanza.index, 'content': stanza.content})
+
+        for row in rows:
+            poem = {field: getattr(row, field) for field in POEM_FIELDS}
+            poem.update(slug=row.slug, category=row.category,
+                        author=row.author, stanzas=stanzas[row.id],
+                        created_at=row.created_at.isoformat()
+                        if row.created_at else None)
+            yield json.dumps(poem) + '\n'
+
+
+def _read_stanzas(stanzas):
+    if not isinstance(stanzas, list):
+        raise ValueError('stanzas must be a list')
+
+    read = {}
+    for number, stanza in enumerate(stanzas, 1):
+        if not isinstance(stanza, dict) \
+                or not isinstance(stanza.get('content'), str) \
+                or not stanza['content'].strip():
+            raise ValueError('every stanza needs content')
+
+        index = stanza.get('index', number)
+        try:
+            if isinstance(index, bool) or not isinstance(index, (int, str)):
+                raise ValueError
+            index = int(index)
+        except ValueError:
+            raise ValueError('a stanza index must be a whole number')
+        if index in read:
+            raise ValueError(f'stanza {index} is listed twice')
+        read[index] = stanza['content']
+    return [{'index': index, 'content': content}
+            for index, content in read.items()]
+
+
+def _read_poem(poem):
+    """Check the fields of a poem and convert them to what is stored."""
+    if not isinstance(poem, dict):
+        raise ValueError('a poem must be an object')
+
+    title = poem.get('title')
+    if not isinstance(title, str) or not title.strip():
+        raise ValueError('a poem needs a title')
+    if len(title) > MAX_TITLE_LENGTH:
+        raise ValueError(f'a title has at most {MAX_TITLE_LENGTH} characters')
+    for field in TEXTS:
+        if not isinstance(poem.get(field), (str, type(None))):
+            raise ValueError(f'{field} must be text')
+    for field in FLAGS:
+        if not isinstance(poem.get(field), (bool, type(None))):
+            raise ValueError(f'{field} must be true or false')
+
+    slug = poem.get('slug')
+    if not isinstance(slug, (str, type(None))):
+        raise ValueError('slug must be text')
+    slug = slugify(slug or title)
+    if not slug:
+        raise ValueError('the title has nothing to make a slug of')
+
+    return {**poem, 'slug': slug,
+            'stanzas': _read_stanzas(poem.get('stanzas') or [])}
+
+
+def _read(lines):
+    """Yield the number of each line with the poem it holds."""
+    for number, line in enumerate(lines, 1):
+        try:
+            if isinstance(line, bytes):
+                line = line.decode('utf-8')
+            if not line.strip():
+                continue
+            poem = _read_poem(json.loads(line))
+        except ValueError as e:
+            raise PoemImportError(f'Line {number} is not a valid poem: {e}')
+        yield number, poem
+
+
+def _import_chunk(poems, author_id=None):
+    """Upsert a chunk of poems and replace their stanzas."""
+    # a slug listed twice in a chunk takes its last version
+    poems = list({poem['slug']: poem for poem in poems}.values())
+
+    # create the categories that do not exist yet
+    names = {poem['category'] for poem in poems if poem.get('category')}
+    categories = dict(db.session.execute(
+        db.select(Category.name, Category.id).where(Category.name.in_(names))
+    ).all()) if names else {}
+    missing = [{'id': uuid4().hex, 'name': name}
+               for name in names - categories.keys()]
+    if missing:
+        db.session.execute(db.insert(Category), missing)
+        categories.update((row['name'], row['id']) for row in missing)
+
+    if author_id is None:
+        usernames = {poem['author'] for poem in poems if poem.get('author')}
+        authors = dict(db.session.execute(
+            db.select(User.username, Poet.id).join(Poet, Poet.user_id == User.id)
+            .where(User.username.in_(usernames))
+        ).all()) if usernames else {}
+
+    existing = {row.slug: (row.id, row.author_id)
+                for row in db.session.execute(
+                    db.select(Poem.slug, Poem.id, Poem.author_id).where(
+                        Poem.slug.in_([poem['slug'] for poem in poems])))}
+
+    inserts, updates, skipped = [], [], 0
+    for poem in poems:
+        row = {field: poem[field] for field in POEM_FIELDS if field in poem}
+        row.update(slug=poem['slug'],
+                   category_id=categories.get(poem.get('category')),
+                   author_id=author_id if author_id is not None
+                   else authors.get(poem.get('author')))
+
+        if poem['slug'] in existing:
+            poem_id, owner_id = existing[poem['slug']]
+            # poets may only overwrite their own poems
+            if author_id is not None and owner_id != author_id:
+                skipped += 1
+                continue
+            row['id'] = poem_id
+            updates.append(row)
+        else:
+            row['id'] = uuid4().hex
+            inserts.append(row)
+        poem['id'] = row['id']
+
+    if inserts:
+        db.session.execute(db.insert(Poem), inserts)
+    if updates:
+        db.session.execute(db.update(Poem), updates)
+
+    imported = [poem for poem in poems if 'id' in poem]
+    ids = [poem['id'] for poem in imported]
+    if ids:
+        db.session.execute(db.delete(Stanza).where(Stanza.poem_id.in_(ids)))
+        stanzas = [{
+            'id': uuid4().hex, 'poem_id': poem['id'],
+            'index': stanza['index'], 'content': stanza['content'],
+        } for poem in imported for stanza in poem['stanzas']]
+        if stanzas:
+            db.session.execute(db.insert(Stanza), stanzas)
+
+        # bulk statements skip the events that maintain the search index
+        connection = db.session.connection()
+        search.get_backend(connection.dialect.name).reindex_many(
+            connection, ids)
+        Poem.touch(connection, Poem.id.in_(ids))
+
+    page_cache.invalidate('poems', 'categories',
+                          *[f"poem:{row['id']}" for row in updates])
+    db.session.commit()
+    return len(inserts), len(updates), skipped
+
+
+def import_poems(lines, author_id=None, chunk_size=500):
+    """Upsert poems by slug from lines of JSON, a chunk per transaction.
+
+    When ``author_id`` is given every poem is imported for that poet and
+    poems of other poets are left untouched. Returns the numbers of poems
+    created, updated and skipped, or raises a ``PoemImportError`` holding
+    them for the chunks committed before the ones that failed.
+    """
+    poems = _read(lines)
+    totals = (0, 0, 0)
+
+    while True:
+        try:
+            chunk = list(islice(poems, chunk_size))
+        except PoemImportError as e:
+            e.counts = totals
+            raise
+        if not chunk:
+            return totals
+
+        try:
+            counts = _import_chunk([poem for _, poem in chunk], author_id)
+        except IntegrityError as e:
+            db.session.rollback()
+            raise PoemImportError(
+                f'Lines {chunk[0][0]} to {chunk[-1][0]} were not imported as '
+                f'a poem with one of their titles already exists', totals
+            ) from e
+        except Exception:
+            db.session.rollback()
+            raise
+        totals = tuple(total + count for total, count in zip(totals, counts))
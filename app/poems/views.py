@@ -1,31 +1,81 @@
-from flask import render_template, redirect, request, flash, url_for
+import csv
+import io
+from flask import (render_template, redirect, request, flash, url_for,
+                   Response, stream_with_context, jsonify, g)
 from flask.views import MethodView
 from flask_login import login_required, current_user
 from . import poems
 from .controllers import PoemsController
 from .forms import (PoemForm, CategoryForm, StanzaForm,
-                    CommentForm, FilterPoemForm)
+                    CommentForm, FilterPoemForm, RatingForm, PoemImportForm)
 from ..models import Poet, Poem, Category, Stanza, Comment
 from ..utils import is_poet, can_manage_poem, is_verified_poet
+from ..helpers.page_cache import cache_anonymous_page, conditional_page
 
 # Intitialize the controller for this view
 controllers = PoemsController()
 
 
+def find_page_poem(poem_id=None, slugname=None):
+    """Find the poem of a page once per request, for its validators."""
+    if 'page_poem' not in g:
+        g.page_poem = Poem.find_by(id=poem_id, one=True) \
+            if poem_id is not None else Poem.find_by(slug=slugname, one=True)
+    return g.page_poem
+
+
+def poem_page_tags(poem_id=None, slugname=None):
+    """Get the cache tags of a poem page, if the poem exists."""
+    if poem_id is None:
+        poem = find_page_poem(slugname=slugname)
+
+        # old slugs redirect, so there is nothing to cache
+        if poem is None:
+            return None
+        poem_id = poem.id
+    return ['categories', f'poem:{poem_id}']
+
+
+def poem_page_version(poem_id=None, slugname=None):
+    """Get the version of a poem page and when it changed last."""
+    poem = find_page_poem(poem_id, slugname)
+
+    # old slugs redirect, so there is nothing to validate
+    if poem is None:
+        return None
+    return f'{poem.id}.{poem.version}', poem.modified_at
+
+
 class IndexView(MethodView):
+    decorators = [cache_anonymous_page(lambda: ['poems'])]
+
     def get(self):
         """Get all poems from the database, filter them according and paginate them."""
         context = {}
 
-        request_args = controllers.get_args(**{
+        request_args = controllers.get_args('cursor', **{
             'category': { 'type': str, 'default': '' },
             'page': { 'type': int, 'default': 1 },
+            'order': { 'type': str, 'default': 'RECENT' },
         })
 
         # get categories
-        context['all_category_names'] = [c.name for c in Category.find_all() if c.poems.all()]
-        # get pagination object
-        context['pagination'] = controllers.get_poems(**request_args)
+        context['all_category_names'] = [
+            c['name'] for c in controllers.get_categories(with_poems=True)]
+
+        # get pagination object; seek with a cursor when one is asked for
+        if request_args['cursor'] is not None:
+            context['pagination'] = controllers.get_poems_after(
+                request_args['category'], request_args['cursor'],
+                request_args['order'])
+            context['cursor_args'] = {
+                'category': request_args['category'] or None,
+                'order': request_args['order'],
+            }
+        else:
+            context['pagination'] = controllers.get_poems(
+                request_args['category'], request_args['page'],
+                request_args['order'])
         # get the poems returned from the pagination object
         context['poems'] = context['pagination'].items
 
@@ -33,16 +83,83 @@ class IndexView(MethodView):
 
 
 class SearchPoemsView(MethodView):
+    # the filter form lists the poets
+    decorators = [cache_anonymous_page(lambda: ['poems', 'poets'])]
+
     def get(self):
         """Search and filter through the poems returned"""
+        args = controllers.get_args(page={'type': int, 'default': 1},
+                                    per_page={'type': int})
+
         context = {
             'form': FilterPoemForm(request.args),
-            'results': controllers.search(),
+            'pagination': controllers.search(args['page'], args['per_page']),
+            # keep the search query and filters when changing pages
+            'query_args': {k: v for k, v in request.args.items() if k != 'page'},
         }
+        context['results'] = context['pagination'].items
 
         return render_template('poems/search_poems.html', **context)
 
 
+class SearchExportView(MethodView):
+    def get(self):
+        """Stream every poem that matches the search as a CSV file."""
+        def generate():
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(['title', 'author', 'category', 'rating',
+                             'completed', 'premium', 'created_at', 'url'])
+
+            for poem in controllers.stream_search():
+                writer.writerow([
+                    poem.title,
+                    poem.poets.poet_name if poem.poets else '',
+                    poem.categories.name if poem.categories else '',
+                    poem.rating, poem.completed, poem.premium,
+                    poem.created_at.isoformat() if poem.created_at else '',
+                    url_for('.poem_by_slug', slugname=poem.slug, _external=True),
+                ])
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate(0)
+
+        return Response(stream_with_context(generate()), mimetype='text/csv',
+                        headers={'Content-Disposition':
+                                 'attachment; filename=poems.csv'})
+
+
+class PoemsExportView(MethodView):
+    decorators = [is_poet]
+
+    def get(self):
+        """Download all your poems and their stanzas as JSON Lines."""
+        return Response(stream_with_context(controllers.export_poems()),
+                        mimetype='application/jsonl',
+                        headers={'Content-Disposition':
+                                 'attachment; filename=poems.jsonl'})
+
+
+class PoemsImportView(MethodView):
+    decorators = [is_poet]
+
+    def get(self):
+        """Display the form for importing poems."""
+        return render_template('poems/import_poems.html',
+                               form=PoemImportForm())
+
+    def post(self):
+        """Create or update your poems from an uploaded JSON Lines file."""
+        form = PoemImportForm()
+
+        if form.validate_on_submit():
+            controllers.import_poems(form.poems.data.stream)
+        else:
+            for errors in form.errors.values():
+                flash(errors[0], 'error')
+        return redirect(url_for('.import_poems'))
+
+
 class CategoryMutationView(MethodView):
     decorators = [is_poet]
 
@@ -66,13 +183,8 @@ class CategoryMutationView(MethodView):
                 flash('There are poems under this category, hence cannot proceed!', 'error')
             return redirect(url_for('.mutate_categories'))
 
-        # get categories ids and no of poems
-        result = controllers.get_categories()
-
-        context['categories'] = [{
-            'category': Category.find_by(id=category_id, one=True),
-            'no_poems': no_poems} for category_id, no_poems in result
-        ]
+        # get categories with their number of poems
+        context['categories'] = controllers.get_categories()
 
         return render_template('poems/categories.html', **context)
     
@@ -124,16 +236,30 @@ class PoemCreationView(MethodView):
 
 
 class PoemView(MethodView):
+    # the outermost decorator answers 304s before the page cache is read
+    decorators = [cache_anonymous_page(poem_page_tags),
+                  conditional_page(poem_page_version)]
+
     def get(self, slugname=None, poem_id=None):
         """Show information about a specific poem"""
-        poem = controllers.get_poem(poem_id, slugname)
+        # the poem was found already to validate the page
+        poem = controllers.get_poem(poem_id, slugname,
+                                    g.pop('page_poem', None))
 
         if not poem:
             return redirect(url_for('.index'))
 
+        # send visitors of a renamed poem to its current address
+        if slugname is not None and slugname != poem.slug:
+            return redirect(url_for('.poem_by_slug', slugname=poem.slug), 301)
+
+        user_rating = controllers.get_user_rating(poem)
+
         context = {
             'poem': poem,
             'form': CommentForm(),
+            'rating_form': RatingForm(rating=user_rating or 3),
+            'user_rating': user_rating,
             'stanzas': poem.stanzas.order_by(Stanza.index).all(),
         }
 
@@ -153,6 +279,26 @@ class PoemView(MethodView):
         return redirect(url_for('.poem_by_id', poem_id=poem.id))
 
 
+class PoemRatingView(MethodView):
+    decorators = [login_required]
+
+    def post(self, poem_id):
+        """Rate a poem or change the rating given to it."""
+        form = RatingForm()
+        poem = controllers.get_poem(poem_id)
+
+        if poem is None:
+            return redirect(url_for('.index'))
+
+        if form.validate_on_submit():
+            controllers.rate_poem(poem, form.rating.data)
+
+        for error in form.errors.items():
+            flash(error[1][0], 'error')
+
+        return redirect(url_for('.poem_by_id', poem_id=poem.id))
+
+
 class PoetView(MethodView):
     decorators = [login_required]
 
@@ -223,11 +369,12 @@ class StanzaCreationView(MethodView):
     decorators = [is_poet]
 
     def get(self, poem_id):
-        if not can_manage_poem(poem_id):
+        poem = can_manage_poem(poem_id)
+
+        if not poem:
             flash('You are unauthorized to create a new Stanza for this poem', 'error')
             return redirect(url_for('.poem_by_id', poem_id=poem_id))
         
-        poem = Poem.find_by(id=poem_id, one=True)
         form = StanzaForm(index=poem.stanzas.count() + 1)
 
         return render_template('poems/add_stanza.html', form=form)
@@ -249,6 +396,39 @@ class StanzaCreationView(MethodView):
         return redirect(url_for('.add_stanza', poem_id=poem_id))
 
 
+class StanzaBatchView(MethodView):
+    decorators = [is_poet]
+
+    @staticmethod
+    def serialize(poem):
+        return jsonify(stanzas=[
+            {'id': stanza.id, 'index': stanza.index, 'content': stanza.content}
+            for stanza in poem.stanzas.order_by(Stanza.index)
+        ])
+
+    def get(self, poem_id):
+        """List the stanzas of a poem in order."""
+        poem = can_manage_poem(poem_id)
+        if not poem:
+            return jsonify(error='You cannot manage the stanzas of this poem'), 403
+        return self.serialize(poem)
+
+    def put(self, poem_id):
+        """Save all the stanzas of a poem, in order, at once."""
+        poem = can_manage_poem(poem_id)
+        if not poem:
+            return jsonify(error='You cannot manage the stanzas of this poem'), 403
+
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify(error='Send an object with the list of stanzas'), 400
+
+        error = controllers.save_stanzas(poem, data.get('stanzas'))
+        if error:
+            return jsonify(error=error), 400
+        return self.serialize(poem)
+
+
 class StanzaDeletionView(MethodView):
     decorators = [is_poet]
 
@@ -320,10 +500,11 @@ class PoemPublishView(MethodView):
     decorators = [is_poet]
 
     def get(self, poem_id):
-        if not can_manage_poem(poem_id):
+        poem = can_manage_poem(poem_id)
+
+        if not poem:
             flash('You cannot publish/unpublish a poem that is not yours!', 'error')
         else:
-            poem = Poem.find_by(id=poem_id, one=True)
             poem.publish()
 
             flash('Now the world can see your creative piece; bravo!' if poem.published
@@ -336,16 +517,13 @@ class CompletePoemView(MethodView):
     decorators = [is_poet]
 
     def get(self, poem_id):
-        if not can_manage_poem(poem_id):
+        poem = can_manage_poem(poem_id)
+
+        if not poem:
             flash('You are not the author of this poem', 'error')
         else:
-            poem = Poem.find_by(id=poem_id, one=True)
-
-            if not poem:
-                flash('Poem with given id does not exist', 'error')
-            else:
-                poem.completed = not poem.completed
-                poem.save()
-                flash('Poem status has been updated')
+            poem.completed = not poem.completed
+            poem.save()
+            flash('Poem status has been updated')
         
         return redirect(url_for('.poem_by_id', poem_id=poem_id))
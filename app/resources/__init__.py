@@ -2,7 +2,7 @@ from flask import Blueprint
 
 resources = Blueprint('resources', __name__, url_prefix='/resources')
 
-from . import views
+from . import views, commands
 
 # register url endpoints
 resources.add_url_rule('/', view_func=views.IndexView.as_view('index'), methods=['GET', 'POST'])
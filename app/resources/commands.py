@@ -0,0 +1,38 @@
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import click
+from . import resources
+from ..models import Resource
+
+
+@resources.cli.command('recount-votes')
+def recount_votes():
+    """Recompute the vote tallies of resources from their reactions."""
+    count = Resource.recount_votes()
+    click.echo(f'Recounted the votes of {count} resource(s).')
+
+
+@resources.cli.command('rerender')
+@click.option('--workers', type=int,
+              help='Rendering processes, one per CPU by default.')
+@click.option('--batch-size', default=500, help='Resources read per batch.')
+def rerender(workers, batch_size):
+    """Render the html of every resource body again, e.g. after the
+    allowed tags change."""
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        count = Resource.rerender_bodies(
+            partial(pool.map, chunksize=50), batch_size)
+    click.echo(f'Rendered the html of {count} resource(s) again.')
+
+
+@resources.cli.command('make-variants')
+@click.option('--workers', type=int,
+              help='Resizing processes, one per CPU by default.')
+@click.option('--force', is_flag=True,
+              help='Record the variants of images that have them already.')
+@click.option('--batch-size', default=100, help='Resources read per batch.')
+def make_variants(workers, force, batch_size):
+    """Make the downscaled variants of the stored images of resources."""
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        count = Resource.make_image_variants(pool.map, force, batch_size)
+    click.echo(f'Recorded the variants of {count} image resource(s).')
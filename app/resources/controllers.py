@@ -1,13 +1,10 @@
-from ..models import Resource, Poet, Reaction
+from ..models import Resource, Poet, Reaction, get_current_poet
 from flask import flash, redirect, url_for, current_app, request
 from flask_login import current_user
 from .. import db
+from sqlalchemy.exc import IntegrityError
 from flask_wtf.file import FileStorage
-from werkzeug.utils import secure_filename
-from uuid import uuid4
-import os
-from hashlib import md5
-from ..helpers.img_handler import delete_img
+from ..helpers.img_handler import save_img
 
 
 class ResourceController:
@@ -35,23 +32,8 @@ class ResourceController:
         """Handle the image passed to it and return the image path."""
         if not isinstance(file_storage, FileStorage):
             raise TypeError('Body is not an image!')
-        
-        upload_folder = current_app.config.get('UPLOAD_FOLDER')
-        file_hash = md5(file_storage.read()).hexdigest()
-        filename = f'{file_hash}_{secure_filename(file_storage.filename)}'
-
-        # construct the complete path to save the image
-        img_path = os.path.join(upload_folder, custom_dir, filename)
-
-        # create the directory where image will be stored if necessary
-        os.makedirs(os.path.dirname(img_path), exist_ok=True)
 
-        # save the image to the filesystem
-        file_storage.seek(0)
-        file_storage.save(img_path)
-
-        # Generate and return the URL for the saved image
-        return url_for('static', filename=f'uploads/{custom_dir}/{filename}')
+        return save_img(file_storage, custom_dir)
 
     def _extract_data(self, data):
         """Extract resource data from form data."""
@@ -64,8 +46,7 @@ class ResourceController:
         }
 
         # add the poet_id to the formatted data
-        poet = Poet.find_by(user_id=current_user.id,
-                            one=True)
+        poet = get_current_poet()
         if not poet:
             raise TypeError("You don't have poetic privileges!")
         formatted_data['poet_id'] = poet.id
@@ -114,9 +95,10 @@ class ResourceController:
         db_query = self.model.query
 
         if itype is not None:
-            if current_user.is_poet:
-                # fetch the poet account
-                poet = Poet.find_by(user_id=current_user.id, one=True)
+            # fetch the poet account
+            poet = get_current_poet()
+
+            if poet is not None:
                 # query db for resources based on type
                 db_query = db_query.filter(
                     (Resource.rtype == itype) & ((Resource.published == True) | (
@@ -146,12 +128,41 @@ class ResourceController:
                                     user_id=current_user.id, one=True)
         
         if reaction:
-            reaction.reaction_type = vote_type
-            reaction.save()
+            if reaction.reaction_type == vote_type:
+                return True
+
+            # move the vote from one tally to the other, unless a concurrent
+            # request has moved it already
+            old_type = reaction.reaction_type
+            if Reaction.switch_type(reaction.id, old_type, vote_type):
+                self.model.update_votes(resource.id, added=vote_type,
+                                        removed=old_type)
+            db.session.commit()
         else:
-            Reaction.create(user_id=current_user.id, reaction_type=vote_type,
-                            record_id=resource.id)
+            try:
+                self.model.update_votes(resource.id, added=vote_type)
+                Reaction.create(user_id=current_user.id,
+                                reaction_type=vote_type, record_id=resource.id)
+            except IntegrityError:
+                # a concurrent request already counted this user's vote
+                db.session.rollback()
         return True
+
+    def get_user_votes(self, resources):
+        """Map the ids of the resources passed to the current user's votes."""
+        resource_ids = [resource.id for resource in resources]
+
+        if not resource_ids or current_user.is_anonymous:
+            return {}
+
+        reactions = db.session.query(
+            Reaction.record_id, Reaction.reaction_type
+        ).filter(
+            Reaction.user_id == current_user.id,
+            Reaction.record_id.in_(resource_ids)
+        ).all()
+
+        return dict(reactions)
     
     def delete_resource(self, resource_id):
         resource = Resource.find_by(id=resource_id, one=True)
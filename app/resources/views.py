@@ -19,6 +19,7 @@ class IndexView(MethodView):
         itype = Resource.get_type_value(r_type)
 
         g.resources = controllers.find_by_type(itype, True)
+        g.votes = controllers.get_user_votes(g.resources)
         g.r_type = r_type
 
         return render_template('resources/index.html')
@@ -3,7 +3,7 @@
 from functools import wraps
 from flask import flash, redirect, url_for, request
 from flask_login import current_user, login_required
-from .models import Poem, Poet, User
+from .models import Poem, Poet, User, get_current_poet
 
 
 def is_poet(func):
@@ -26,7 +26,7 @@ def is_verified_poet(func):
     @wraps(func)
     @is_poet
     def wrapper(**kwargs):
-        poet = Poet.find_by(user_id=current_user.id, one=True)
+        poet = get_current_poet()
 
         if not (poet and poet.verified):
             flash('Only verified poets can create categories.', 'error')
@@ -36,6 +36,6 @@ def is_verified_poet(func):
 
 
 def can_manage_poem(poem_id):
-    """Check if current user can manipulate poem."""
+    """Return the poem if current user can manipulate it, otherwise None."""
     poem = Poem.query.get_or_404(poem_id, 'Poem with such id was not found.')
-    return poem.is_accessible
+    return poem if poem.is_accessible else None
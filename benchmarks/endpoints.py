@@ -0,0 +1,178 @@
+"""Benchmark the main endpoints against a fixed synthetic dataset.
+
+Each endpoint is requested through the Flask test client as a logged-in
+reader, which bypasses the anonymous page cache. For every endpoint the
+median wall time, the number of SQL statements and the least peak memory
+allocated while serving it over a few traced requests are recorded, so a
+change can be compared with a saved baseline.
+"""
+
+import json
+import time
+import tracemalloc
+from statistics import median
+from sqlalchemy import event
+from app import create_app, db
+from app.models import Poet, Poem, Comment, Resource
+from app.helpers.seed import Seeder, DEFAULT_PASSWORD
+
+METRICS = ('time_ms', 'queries', 'peak_kb')
+
+# the share a metric may grow by before it counts as a regression;
+# statement counts are deterministic, so any extra query is one
+TOLERANCES = {'time_ms': 0.5, 'queries': 0.0, 'peak_kb': 0.25}
+
+# absolute growth that is always allowed, to absorb timer and allocator noise
+SLACK = {'time_ms': 2.0, 'queries': 0, 'peak_kb': 32.0}
+
+# traced requests per endpoint; a single one may also pay for refilling
+# caches or a garbage collection, so the smallest peak is kept
+MEMORY_SAMPLES = 5
+
+DATASET = {
+    'users': 200, 'poets': 40, 'categories': 8, 'poems': 400, 'stanzas': 4,
+    'comments': 2000, 'ratings': 2000, 'resources': 40, 'reactions': 400,
+}
+
+
+class QueryCounter:
+    """Count the SQL statements an engine runs."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+
+    def _count(self, *args):
+        self.count += 1
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._count)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self._count)
+
+
+def _seed():
+    seeder = Seeder(seed=1)
+    seeder.seed_users(DATASET['users'], DATASET['poets'])
+    seeder.seed_categories(DATASET['categories'])
+    seeder.seed_poems(DATASET['poems'], DATASET['stanzas'])
+    seeder.seed_comments(DATASET['comments'])
+    seeder.seed_ratings(DATASET['ratings'])
+    seeder.seed_resources(DATASET['resources'], DATASET['reactions'])
+    seeder.rebuild()
+    return seeder
+
+
+def _get_requests():
+    """Build the requests to measure, as (name, method, url, data) tuples."""
+    # the most commented poem and the most voted resource are the hot pages
+    poem = Poem.query.join(Comment).group_by(Poem.id).order_by(
+        db.func.count(Comment.id).desc()).first()
+    resource = Resource.query.order_by(Resource.upvotes.desc()).first()
+    comments = iter(range(1, 1_000_000))
+    votes = iter(range(1, 1_000_000))
+
+    return [
+        ('poems.index', 'GET', lambda: '/poems/', None),
+        ('poems.poem_by_slug', 'GET', lambda: f'/poems/s/{poem.slug}', None),
+        ('poems.search', 'GET', lambda: '/poems/search?q=moon+river', None),
+        ('poems.view_poet', 'GET', lambda: f'/poems/{poem.id}/poet', None),
+        ('resources.index', 'GET', lambda: '/resources/', None),
+        # alternate the vote so that every request moves a tally
+        ('resources.vote_resource', 'GET',
+         lambda: f'/resources/{resource.id}/vote'
+         + ('?downvote=1' if next(votes) % 2 else ''), None),
+        ('poems.comment', 'POST', lambda: f'/poems/s/{poem.slug}',
+         lambda: {'comment': f'Benchmark comment {next(comments)}'}),
+    ]
+
+
+def _measure(client, method, get_url, get_data, repeat):
+    def send():
+        data = get_data() if get_data else None
+        response = client.open(get_url(), method=method, data=data)
+        # redirects other than to the login page are the normal outcome
+        if response.status_code >= 400 or '/login' in \
+                response.headers.get('Location', ''):
+            raise RuntimeError(f'{method} {response.request.path} '
+                               f'returned {response.status_code}')
+
+    send()  # warm up lazily built state such as memoized choices
+
+    timings = []
+    for _ in range(repeat):
+        with QueryCounter(db.engine) as counter:
+            start = time.perf_counter()
+            send()
+            timings.append((time.perf_counter() - start) * 1000)
+
+    peaks = []
+    tracemalloc.start()
+    try:
+        for _ in range(MEMORY_SAMPLES):
+            tracemalloc.reset_peak()
+            start = tracemalloc.get_traced_memory()[0]
+            send()
+            peaks.append(tracemalloc.get_traced_memory()[1] - start)
+    finally:
+        tracemalloc.stop()
+
+    return {'time_ms': round(median(timings), 3), 'queries': counter.count,
+            'peak_kb': round(min(peaks) / 1024, 1)}
+
+
+def run(repeat=20, context_processors=()):
+    """Seed a fresh in-memory database and measure every endpoint."""
+    app = create_app('testing')
+    app.config.update(SECRET_KEY='benchmark', WTF_CSRF_ENABLED=False)
+    for processor in context_processors:
+        app.context_processor(processor)
+
+    with app.app_context():
+        db.create_all()
+        try:
+            seeder = _seed()
+            client = app.test_client()
+            poet = Poet.find_by(id=seeder.poets[0]['id'], one=True)
+            response = client.post('/login', data={
+                'username': poet.poet_name, 'password': DEFAULT_PASSWORD})
+            if response.status_code != 302:
+                raise RuntimeError('Could not log in as a seeded poet.')
+
+            return {name: _measure(client, method, get_url, get_data, repeat)
+                    for name, method, get_url, get_data in _get_requests()}
+        finally:
+            db.session.remove()
+            db.drop_all()
+
+
+def compare(results, baseline, tolerance=None):
+    """List the metrics that regressed beyond the tolerance of a baseline."""
+    tolerances = dict(TOLERANCES)
+    if tolerance is not None:
+        tolerances.update(time_ms=tolerance, peak_kb=tolerance)
+
+    regressions = []
+    for name, metrics in results.items():
+        for metric in METRICS:
+            before = baseline.get(name, {}).get(metric)
+            if before is None:
+                continue
+
+            allowed = before * (1 + tolerances[metric]) + SLACK[metric]
+            if metrics[metric] > allowed:
+                regressions.append((name, metric, before, metrics[metric]))
+    return regressions
+
+
+def load_baseline(path):
+    with open(path) as file:
+        return json.load(file)
+
+
+def save_baseline(path, results):
+    with open(path, 'w') as file:
+        json.dump(results, file, indent=2, sort_keys=True)
+        file.write('\n')
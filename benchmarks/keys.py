@@ -0,0 +1,145 @@
+"""Compare 16-byte UUID keys with the 32-char hex strings they replaced.
+
+A synthetic dataset is seeded into an in-memory SQLite database with the
+current schema and copied, row for row, into a second one whose keys are
+``VARCHAR(255)`` hex strings. The space taken by the tables and their
+indexes is read from SQLite's ``dbstat`` table, and the same joins and key
+lookups are timed on both databases.
+"""
+
+import time
+from statistics import median
+import sqlalchemy as sa
+from sqlalchemy.pool import StaticPool
+from app import create_app, db
+from app.helpers.seed import Seeder
+from app.helpers.types import HexUUID
+
+DATASET = {
+    'users': 2000, 'poets': 200, 'categories': 20, 'poems': 20000,
+    'stanzas': 4, 'comments': 50000, 'ratings': 50000, 'resources': 2000,
+    'reactions': 20000,
+}
+
+LOOKUPS = 1000
+
+
+def _seed(scale):
+    counts = {name: max(1, int(count * scale))
+              for name, count in DATASET.items()}
+    counts['stanzas'] = DATASET['stanzas']
+
+    seeder = Seeder(seed=1)
+    seeder.seed_users(counts['users'], counts['poets'])
+    seeder.seed_categories(counts['categories'])
+    seeder.seed_poems(counts['poems'], counts['stanzas'])
+    seeder.seed_comments(counts['comments'])
+    seeder.seed_ratings(counts['ratings'])
+    seeder.seed_resources(counts['resources'], counts['reactions'])
+
+
+def _string_keyed_copy(connection, batch_size=5000):
+    """Copy the seeded tables into a schema keyed by hex strings."""
+    metadata = sa.MetaData()
+    for table in db.metadata.sorted_tables:
+        copy = table.to_metadata(metadata)
+        for column in copy.columns:
+            if isinstance(column.type, HexUUID):
+                column.type = sa.String(255)
+    metadata.create_all(connection)
+
+    for table in db.metadata.sorted_tables:
+        result = db.session.execute(sa.select(table).execution_options(
+            yield_per=batch_size)).mappings()
+        for rows in result.partitions():
+            connection.execute(metadata.tables[table.name].insert(), rows)
+    connection.commit()
+    return metadata.tables
+
+
+def _sizes(connection, tables):
+    """Get the KiB taken by the rows and by the indexes of the tables."""
+    rows = connection.execute(sa.text(
+        'SELECT m.type, SUM(s.pgsize) FROM dbstat AS s '
+        'JOIN sqlite_master AS m ON m.name = s.name '
+        'WHERE m.tbl_name IN :tables GROUP BY m.type'
+    ).bindparams(sa.bindparam('tables', expanding=True)),
+        {'tables': list(tables)})
+    sizes = dict(rows.all())
+    return {'tables_kb': round(sizes.get('table', 0) / 1024, 1),
+            'indexes_kb': round(sizes.get('index', 0) / 1024, 1)}
+
+
+def _get_queries(tables, poem_ids):
+    """Build the joins and lookups to time, for either set of tables.
+
+    The joins are counted in the database so that they measure the join,
+    not the conversion of the keys they return; the lookups by id include
+    the conversion of the bound key and of the row.
+    """
+    poems, stanzas, comments = (tables['poems'], tables['stanzas'],
+                                tables['comments'])
+    poets, users = tables['poets'], tables['users']
+
+    def count(statement):
+        return sa.select(sa.func.count()).select_from(statement.subquery())
+
+    return {
+        'stanzas per poem': count(sa.select(
+            poems.c.id, sa.func.count(stanzas.c.id)
+        ).join(stanzas, stanzas.c.poem_id == poems.c.id).group_by(poems.c.id)),
+        'comments with readers and poems': count(sa.select(comments.c.id).join(
+            users, users.c.id == comments.c.user_id
+        ).join(poems, poems.c.id == comments.c.poem_id)),
+        'poems with poets': count(sa.select(poems.c.id).join(
+            poets, poets.c.id == poems.c.author_id
+        ).join(users, users.c.id == poets.c.user_id)),
+        'poems by id': [sa.select(poems).where(poems.c.id == poem_id)
+                        for poem_id in poem_ids],
+    }
+
+
+def _time(connection, query, repeat):
+    statements = query if isinstance(query, list) else [query]
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for statement in statements:
+            connection.execute(statement).all()
+        timings.append((time.perf_counter() - start) * 1000)
+    return round(median(timings), 3)
+
+
+def run(repeat=5, scale=1.0):
+    """Seed both kinds of keys and measure their size and join speed."""
+    app = create_app('testing')
+    engine = sa.create_engine('sqlite://', poolclass=StaticPool)
+
+    with app.app_context():
+        db.create_all()
+        try:
+            _seed(scale)
+            poem_ids = db.session.execute(sa.select(
+                db.metadata.tables['poems'].c.id).limit(LOOKUPS)).scalars().all()
+
+            with engine.connect() as connection:
+                string_tables = _string_keyed_copy(connection)
+                sizes = {'string': _sizes(connection, string_tables),
+                         'uuid': _sizes(db.session.connection(),
+                                        db.metadata.tables)}
+
+                joins = {}
+                string_queries = _get_queries(string_tables, poem_ids)
+                uuid_queries = _get_queries(db.metadata.tables, poem_ids)
+                for name in uuid_queries:
+                    joins[name] = {
+                        'string': _time(connection, string_queries[name],
+                                        repeat),
+                        'uuid': _time(db.session.connection(),
+                                      uuid_queries[name], repeat),
+                    }
+            return {'sizes': sizes, 'joins': joins}
+        finally:
+            db.session.remove()
+            db.drop_all()
+            engine.dispose()
@@ -0,0 +1,190 @@
+"""Compare the plans of the hot queries before and after their indexes.
+
+A synthetic dataset is seeded into an in-memory database whose schema
+leaves out the indexes listed in ``INDEXES``. Each hot query is explained
+and timed, the indexes are then created the way the migration adds them,
+and the same queries are explained and timed again on the same rows.
+"""
+
+import time
+from statistics import median
+import sqlalchemy as sa
+from app import create_app, db
+from app.helpers import search, keyset
+from app.helpers.seed import Seeder
+from app.models import (Poem, Stanza, Comment, PoemRating, Resource, Reaction,
+                        Category)
+
+# the indexes and unique constraints under test, by table and columns
+INDEXES = {
+    'stanzas': [('poem_id', 'index')],
+    'comments': [('poem_id',)],
+    'poem_ratings': [('poem_id',)],
+    'poems': [('published', 'created_at'), ('author_id',), ('category_id',),
+              ('rating', 'id')],
+    'resources': [('rtype', 'published')],
+    'reactions': [('record_id', 'reaction_type'), ('record_id', 'user_id')],
+}
+
+DATASET = {
+    'users': 2000, 'poets': 200, 'categories': 20, 'poems': 20000,
+    'stanzas': 4, 'comments': 50000, 'ratings': 50000, 'resources': 2000,
+    'reactions': 20000,
+}
+
+
+def _columns(item):
+    return tuple(column.name for column in item.columns)
+
+
+def _is_tested(table, item):
+    return _columns(item) in INDEXES.get(table.name, [])
+
+
+def _schema_without_indexes():
+    """Copy the schema, leaving out the indexes under test."""
+    metadata = sa.MetaData()
+    removed = []
+
+    for table in db.metadata.sorted_tables:
+        copy = table.to_metadata(metadata)
+        for index in list(copy.indexes):
+            if _is_tested(copy, index):
+                copy.indexes.remove(index)
+        for constraint in list(copy.constraints):
+            if isinstance(constraint, sa.UniqueConstraint) and \
+                    _is_tested(copy, constraint):
+                copy.constraints.remove(constraint)
+                removed.append((copy, constraint))
+    return metadata, removed
+
+
+def _add_indexes(connection, removed):
+    """Create the indexes under test on the seeded tables."""
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            if _is_tested(table, index):
+                index.create(connection)
+
+    # a unique index is how the databases enforce a unique constraint
+    for table, constraint in removed:
+        sa.Index(constraint.name, *[table.c[name] for name in
+                                    _columns(constraint)],
+                 unique=True).create(connection)
+
+
+def _seed(scale):
+    counts = {name: max(1, int(count * scale))
+              for name, count in DATASET.items()}
+    counts['stanzas'] = DATASET['stanzas']
+
+    seeder = Seeder(seed=1)
+    seeder.seed_users(counts['users'], counts['poets'])
+    seeder.seed_categories(counts['categories'])
+    seeder.seed_poems(counts['poems'], counts['stanzas'])
+    seeder.seed_comments(counts['comments'])
+    seeder.seed_ratings(counts['ratings'])
+    seeder.seed_resources(counts['resources'], counts['reactions'])
+    seeder.rebuild()
+    return seeder
+
+
+def _get_queries():
+    """Build the hot queries, as the pages run them, on popular records."""
+    poem = db.session.execute(db.select(Comment.poem_id).group_by(
+        Comment.poem_id).order_by(db.func.count().desc()).limit(1)).scalar()
+    author_id, category_id = db.session.execute(db.select(
+        Poem.author_id, Poem.category_id).where(Poem.id == poem)).one()
+    record, user = db.session.execute(db.select(
+        Reaction.record_id, Reaction.user_id).limit(1)).one()
+
+    # the second page of the popular and author orderings of the listing
+    def listing_page(keys):
+        order = [keyset.sort_order(key) for key in keys]
+        first = db.session.execute(db.select(*[key[0] for key in keys]).where(
+            Poem.published == True).order_by(*order).offset(8).limit(1)).one()
+        return db.select(Poem).join(Category).where(
+            Poem.published == True, keyset.seek(keys, list(first))
+        ).order_by(*order).limit(10)
+
+    return {
+        'popular poems page': listing_page([(Poem.rating, True),
+                                            (Poem.id, True)]),
+        'author poems page': listing_page([(Poem.author_id, False, True),
+                                           (Poem.rating, True),
+                                           (Poem.id, True)]),
+        'poem stanzas': db.select(Stanza).where(
+            Stanza.poem_id == poem).order_by(Stanza.index),
+        'poem comments': db.select(Comment).where(Comment.poem_id == poem),
+        'poem ratings': db.select(PoemRating.rating).where(
+            PoemRating.poem_id == poem),
+        'latest poems': db.select(Poem).where(Poem.published == True)
+        .order_by(Poem.created_at.desc()).limit(9),
+        'poet poems': db.select(Poem).where(Poem.author_id == author_id),
+        'category poems': db.select(Poem).where(
+            Poem.category_id == category_id),
+        'published resources': db.select(Resource).where(
+            (Resource.rtype == Resource.ResourceTypes.BRIEF.value) &
+            (Resource.published == True)
+        ).order_by(Resource.created_at.desc()),
+        'user vote': db.select(Reaction).where(
+            (Reaction.record_id == record) & (Reaction.user_id == user)),
+        'vote tally': db.select(db.func.count(Reaction.id)).where(
+            (Reaction.record_id == record) &
+            (Reaction.reaction_type == 'UPVOTE')),
+    }
+
+
+def explain(connection, statement):
+    """Get the plan the database picks for a statement, one line per step."""
+    sql = str(statement.compile(connection,
+                                compile_kwargs={'literal_binds': True}))
+    prefix = 'EXPLAIN QUERY PLAN ' if connection.dialect.name == 'sqlite' \
+        else 'EXPLAIN '
+    rows = connection.exec_driver_sql(prefix + sql)
+    # SQLite puts the step last, after the ids of the plan tree
+    return [str(row[-1]) if connection.dialect.name == 'sqlite'
+            else str(row[0]) for row in rows]
+
+
+def _measure(connection, queries, repeat):
+    results = {}
+    for name, statement in queries.items():
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            connection.execute(statement).all()
+            timings.append((time.perf_counter() - start) * 1000)
+        results[name] = {'plan': explain(connection, statement),
+                         'time_ms': round(median(timings), 3)}
+    return results
+
+
+def run(repeat=20, scale=1.0):
+    """Seed a database without the indexes and measure before and after."""
+    app = create_app('testing')
+    metadata, removed = _schema_without_indexes()
+
+    with app.app_context():
+        connection = db.session.connection()
+        metadata.create_all(connection)
+        search.create_index(metadata, connection)
+        db.session.commit()
+        try:
+            _seed(scale)
+            queries = _get_queries()
+
+            connection = db.session.connection()
+            before = _measure(connection, queries, repeat)
+            _add_indexes(connection, removed)
+            # as the migration does, so that SQLite weighs the rating index
+            if connection.dialect.name == 'sqlite':
+                connection.exec_driver_sql('ANALYZE poems')
+            db.session.commit()
+            after = _measure(db.session.connection(), queries, repeat)
+
+            return {name: {'before': before[name], 'after': after[name]}
+                    for name in queries}
+        finally:
+            db.session.remove()
+            db.drop_all()
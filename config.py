@@ -8,11 +8,41 @@ class Config:
 
     SECRET_KEY = os.environ.get('SECRET_KEY')
     FLASK_POEMS_PER_PAGE = int(os.environ.get('FLASK_POEMS_PER_PAGE', 9))
+    FLASK_SEARCH_MAX_PER_PAGE = int(os.environ.get('FLASK_SEARCH_MAX_PER_PAGE', 50))
+    FLASK_SEARCH_STREAM_BATCH = int(os.environ.get('FLASK_SEARCH_STREAM_BATCH', 500))
     MAXIMUM_POET_COUNT = int(os.environ.get('MAXIMUM_POET_COUNT', 10))
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     UPLOAD_FOLDER = os.path.join(basedir, 'app/static/uploads')
     CACHE_TYPE = 'simple'
+    # pages are invalidated on writes, but only in the worker that made
+    # them with the simple cache; the timeout bounds how long the others
+    # serve a stale page. 0 keeps pages until invalidated, which is only
+    # right with a cache every worker shares, such as redis
+    PAGE_CACHE_TIMEOUT = int(os.environ.get('PAGE_CACHE_TIMEOUT', 60))
     MAX_CONTENT_LENGTH = 1024 * 1024
+    # uploads are named by their content and cached by browsers for good;
+    # a front proxy can send them: Apache and lighttpd with USE_X_SENDFILE,
+    # nginx with the internal location mapped to UPLOAD_FOLDER
+    UPLOADS_MAX_AGE = 365 * 24 * 60 * 60
+    USE_X_SENDFILE = os.environ.get(
+        'USE_X_SENDFILE', '').lower() in ('1', 'true', 'yes')
+    UPLOADS_ACCEL_REDIRECT = os.environ.get('UPLOADS_ACCEL_REDIRECT')
+    # processes making the downscaled variants of uploaded images; with 0
+    # they are made in the request once it commits
+    IMAGE_VARIANT_WORKERS = int(os.environ.get('IMAGE_VARIANT_WORKERS', 2))
+    # count and time the SQL of each request; the summary at /_perf is
+    # public to whoever can reach the app, so it has a flag of its own
+    SQL_PROFILING = os.environ.get(
+        'SQL_PROFILING', '').lower() in ('1', 'true', 'yes')
+    SQL_PROFILING_PAGE = os.environ.get(
+        'SQL_PROFILING_PAGE', '').lower() in ('1', 'true', 'yes')
+    SQL_PROFILING_WINDOW = int(os.environ.get('SQL_PROFILING_WINDOW', 500))
+    # log statements slower than this many milliseconds; 0 turns it off
+    SLOW_QUERY_THRESHOLD = float(os.environ.get('SLOW_QUERY_THRESHOLD', 0))
+    SLOW_QUERY_LOG = os.environ.get('SLOW_QUERY_LOG') or \
+        os.path.join(basedir, 'logs', 'slow_queries.jsonl')
+    SLOW_QUERY_LOG_MAX_BYTES = 1024 * 1024
+    SLOW_QUERY_LOG_BACKUPS = 5
 
     @staticmethod
     def init_app(app):
@@ -37,6 +67,7 @@ class TestingConfig(Config):
     """Add custom configurations to Config for test mode."""
 
     TESTING = True
+    IMAGE_VARIANT_WORKERS = 0
     SQLALCHEMY_DATABASE_URI = os.environ.get('TEST_DATABASE_URL') or \
         'sqlite://'
 
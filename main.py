@@ -1,4 +1,5 @@
 import os
+import click
 from app import create_app, db
 from app.models import (User, Poet, Poem, Category, Stanza, Comment,
                         Resource, PoemRating)
@@ -30,3 +31,106 @@ def test():
     import unittest
     tests = unittest.TestLoader().discover('tests')
     unittest.TextTestRunner(verbosity=2).run(tests)
+
+
+@app.cli.command()
+@click.option('--users', default=1000, help='Number of users.')
+@click.option('--poets', default=200, help='Number of users who are poets.')
+@click.option('--categories', default=20, help='Number of categories.')
+@click.option('--poems', default=5000, help='Number of poems.')
+@click.option('--stanzas', default=4, help='Average stanzas per poem.')
+@click.option('--comments', default=20000, help='Number of comments.')
+@click.option('--ratings', default=20000, help='Most poem ratings to add.')
+@click.option('--resources', default=500, help='Number of resources.')
+@click.option('--reactions', default=5000, help='Most resource votes to add.')
+@click.option('--batch-size', default=5000, help='Rows per INSERT batch.')
+@click.option('--seed', type=int, help='Random seed for the generated content.')
+def seed(users, poets, categories, poems, stanzas, comments, ratings,
+         resources, reactions, batch_size, seed):
+    """Fill the database with a large synthetic dataset."""
+    from app.helpers.seed import Seeder
+
+    seeder = Seeder(batch_size=batch_size, seed=seed)
+    seeder.seed_users(users, min(poets, users))
+    seeder.seed_categories(categories)
+    seeder.seed_poems(poems, stanzas)
+    seeder.seed_comments(comments)
+    seeder.seed_ratings(ratings)
+    seeder.seed_resources(resources, reactions)
+    seeder.rebuild()
+
+    for table, count in seeder.counts.items():
+        click.echo(f'Inserted {count} row(s) into {table}.')
+
+
+@app.cli.command()
+@click.option('--baseline', default='benchmarks/baseline.json',
+              help='Path of the JSON baseline.')
+@click.option('--save', is_flag=True, help='Save the results as the baseline.')
+@click.option('--repeat', default=20, help='Timed requests per endpoint.')
+@click.option('--tolerance', type=float,
+              help='Allowed growth of time and memory, e.g. 0.5 for 50%.')
+def benchmark(baseline, save, repeat, tolerance):
+    """Benchmark the main endpoints and compare them with a baseline."""
+    from benchmarks import endpoints
+
+    results = endpoints.run(repeat, context_processors=[inject_data])
+    click.echo(f"{'endpoint':<28}{'time (ms)':>12}{'queries':>10}{'peak (KiB)':>12}")
+    for name, metrics in results.items():
+        click.echo(f"{name:<28}{metrics['time_ms']:>12.2f}"
+                   f"{metrics['queries']:>10}{metrics['peak_kb']:>12.1f}")
+
+    if save:
+        endpoints.save_baseline(baseline, results)
+        click.echo(f'Saved the baseline to {baseline}.')
+        return
+
+    if not os.path.exists(baseline):
+        click.echo(f'No baseline at {baseline}; run with --save to create it.')
+        return
+
+    regressions = endpoints.compare(
+        results, endpoints.load_baseline(baseline), tolerance)
+    for name, metric, before, after in regressions:
+        click.echo(f'{name}: {metric} regressed from {before} to {after}.',
+                   err=True)
+    if regressions:
+        raise SystemExit(1)
+
+
+@app.cli.command('benchmark-plans')
+@click.option('--repeat', default=20, help='Timed runs per query.')
+@click.option('--scale', default=1.0,
+              help='Size of the seeded dataset relative to the default.')
+def benchmark_plans(repeat, scale):
+    """Compare the plans of the hot queries without and with their indexes."""
+    from benchmarks import plans
+
+    results = plans.run(repeat, scale)
+    for name, states in results.items():
+        before, after = states['before'], states['after']
+        click.echo(f"{name}: {before['time_ms']:.3f} ms -> "
+                   f"{after['time_ms']:.3f} ms")
+        for state, result in states.items():
+            for step in result['plan']:
+                click.echo(f'  {state:<7}{step}')
+
+
+@app.cli.command('benchmark-keys')
+@click.option('--repeat', default=5, help='Timed runs per query.')
+@click.option('--scale', default=1.0,
+              help='Size of the seeded dataset relative to the default.')
+def benchmark_keys(repeat, scale):
+    """Compare the size and join speed of UUID and hex string keys."""
+    from benchmarks import keys
+
+    results = keys.run(repeat, scale)
+    click.echo(f"{'keys':<34}{'tables (KiB)':>14}{'indexes (KiB)':>15}")
+    for kind, sizes in results['sizes'].items():
+        click.echo(f"{kind:<34}{sizes['tables_kb']:>14.1f}"
+                   f"{sizes['indexes_kb']:>15.1f}")
+
+    click.echo(f"\n{'query':<34}{'string (ms)':>14}{'uuid (ms)':>15}")
+    for name, timings in results['joins'].items():
+        click.echo(f"{name:<34}{timings['string']:>14.3f}"
+                   f"{timings['uuid']:>15.3f}")
@@ -0,0 +1,100 @@
+"""store ids as native uuids
+
+Revision ID: 020cd02e791a
+Revises: 23f959612650
+Create Date: 2026-10-18 13:40:49.573318
+
+"""
+from uuid import UUID
+from alembic import op
+import sqlalchemy as sa
+from app.helpers import search
+from app.helpers.types import HexUUID
+
+
+# revision identifiers, used by Alembic.
+revision = '020cd02e791a'
+down_revision = '23f959612650'
+branch_labels = None
+depends_on = None
+
+# the primary and foreign keys of every table
+COLUMNS = {
+    'users': ['id'],
+    'categories': ['id'],
+    'poets': ['id', 'user_id'],
+    'poems': ['id', 'author_id', 'category_id'],
+    'poem_slug_redirects': ['id', 'poem_id'],
+    'stanzas': ['id', 'poem_id'],
+    'comments': ['id', 'user_id', 'poem_id'],
+    'poem_ratings': ['id', 'user_id', 'poem_id'],
+    'resources': ['id', 'poet_id'],
+    'reactions': ['id', 'user_id', 'record_id'],
+}
+
+
+def _to_bytes(value):
+    if isinstance(value, bytes):
+        value = value.decode()
+    return UUID(value).bytes if value else value
+
+
+def _to_hex(value):
+    return UUID(bytes=value).hex if isinstance(value, bytes) else value
+
+
+def _convert_postgresql(type_, using):
+    # the search documents reference poems and are converted in place too
+    columns = dict(COLUMNS, **{search.SEARCH_TABLE: ['poem_id']})
+    inspector = sa.inspect(op.get_bind())
+    foreign_keys = [(table, key) for table in columns
+                    for key in inspector.get_foreign_keys(table)]
+
+    # a key cannot change type while a foreign key of the old type refers to it
+    for table, key in foreign_keys:
+        op.drop_constraint(key['name'], table, type_='foreignkey')
+
+    for table, names in columns.items():
+        for name in names:
+            op.alter_column(table, name, type_=type_,
+                            postgresql_using=using.format(column=name))
+
+    for table, key in foreign_keys:
+        op.create_foreign_key(
+            key['name'], table, key['referred_table'],
+            key['constrained_columns'], key['referred_columns'],
+            ondelete=key['options'].get('ondelete'))
+
+
+def _convert_sqlite(type_, function):
+    connection = op.get_bind()
+    connection.connection.driver_connection.create_function(
+        'convert_key', 1, function, deterministic=True)
+
+    # the values are converted before the columns are retyped: SQLite keeps
+    # a blob as is in a text column and a text in a blob column
+    columns = dict(COLUMNS, **{
+        search.SQLiteSearchBackend.DOCUMENTS_TABLE: ['poem_id']})
+    for table, names in columns.items():
+        op.execute(f'UPDATE {table} SET ' + ', '.join(
+            f'{name} = convert_key({name})' for name in names))
+
+    for table, names in COLUMNS.items():
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            for name in names:
+                batch_op.alter_column(name, type_=type_)
+
+
+def upgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        _convert_postgresql(HexUUID(), '{column}::uuid')
+    else:
+        _convert_sqlite(HexUUID(), _to_bytes)
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        _convert_postgresql(sa.String(length=255),
+                            "replace({column}::text, '-', '')")
+    else:
+        _convert_sqlite(sa.String(length=255), _to_hex)
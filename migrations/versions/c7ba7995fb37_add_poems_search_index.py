@@ -0,0 +1,30 @@
+"""add poems search index
+
+Revision ID: c7ba7995fb37
+Revises: fc29217842a0
+Create Date: 2026-10-18 13:00:20.023533
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from app.helpers import search
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7ba7995fb37'
+down_revision = 'fc29217842a0'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # create the dialect's search structures and index the existing poems
+    connection = op.get_bind()
+    backend = search.get_backend(connection.dialect.name)
+    backend.create(connection)
+    backend.reindex_all(connection)
+
+
+def downgrade():
+    connection = op.get_bind()
+    search.get_backend(connection.dialect.name).drop(connection)
@@ -0,0 +1,50 @@
+"""serve uploads from their own route
+
+Revision ID: ebed64b4d4e3
+Revises: 712edfdb8c40
+Create Date: 2026-10-18 13:57:02.705670
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from app.helpers.types import HexUUID
+
+
+# revision identifiers, used by Alembic.
+revision = 'ebed64b4d4e3'
+down_revision = '712edfdb8c40'
+branch_labels = None
+depends_on = None
+
+
+OLD_PREFIX, NEW_PREFIX = '/static/uploads/', '/uploads/'
+
+
+def _move_urls(old, new):
+    """Point the images of resources, and their variants, at a new prefix."""
+    resources = sa.table('resources', sa.column('id', HexUUID()),
+                         sa.column('rtype', sa.Integer),
+                         sa.column('body', sa.String),
+                         sa.column('variants', sa.JSON(none_as_null=True)))
+    connection = op.get_bind()
+
+    # 1 is the IMAGE type
+    rows = connection.execute(sa.select(
+        resources.c.id, resources.c.body, resources.c.variants
+    ).where((resources.c.rtype == 1) &
+            resources.c.body.startswith(old))).all()
+    for row in rows:
+        variants = row.variants and {
+            name: dict(variant, url=variant['url'].replace(old, new, 1))
+            for name, variant in row.variants.items()}
+        connection.execute(resources.update().where(
+            resources.c.id == row.id
+        ).values(body=row.body.replace(old, new, 1), variants=variants))
+
+
+def upgrade():
+    _move_urls(OLD_PREFIX, NEW_PREFIX)
+
+
+def downgrade():
+    _move_urls(NEW_PREFIX, OLD_PREFIX)
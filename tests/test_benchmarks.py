@@ -0,0 +1,59 @@
+import unittest
+from benchmarks import keys, plans
+from benchmarks.endpoints import compare
+
+
+class CompareTestCase(unittest.TestCase):
+    """Test how benchmark results are held against a baseline."""
+
+    baseline = {'poems.index': {'time_ms': 10.0, 'queries': 3,
+                                'peak_kb': 100.0}}
+
+    def test_noise_within_tolerance_passes(self):
+        results = {'poems.index': {'time_ms': 16.0, 'queries': 3,
+                                   'peak_kb': 150.0}}
+        self.assertEqual(compare(results, self.baseline), [])
+
+    def test_any_extra_query_regresses(self):
+        results = {'poems.index': {'time_ms': 10.0, 'queries': 4,
+                                   'peak_kb': 100.0}}
+        self.assertEqual(compare(results, self.baseline),
+                         [('poems.index', 'queries', 3, 4)])
+
+    def test_tolerance_applies_to_time_and_memory(self):
+        results = {'poems.index': {'time_ms': 16.0, 'queries': 3,
+                                   'peak_kb': 100.0}}
+        self.assertEqual(compare(results, self.baseline, tolerance=0.1),
+                         [('poems.index', 'time_ms', 10.0, 16.0)])
+
+    def test_new_endpoints_are_skipped(self):
+        results = {'poems.search': {'time_ms': 1.0, 'queries': 1,
+                                    'peak_kb': 1.0}}
+        self.assertEqual(compare(results, self.baseline), [])
+
+
+class PlansTestCase(unittest.TestCase):
+    """Test that the hot queries only search by index once it exists."""
+
+    def test_indexes_replace_table_scans(self):
+        # enough categories for their index to narrow the analyzed poems
+        results = plans.run(repeat=1, scale=0.1)
+
+        for name, states in results.items():
+            before = ' '.join(states['before']['plan'])
+            after = ' '.join(states['after']['plan'])
+            self.assertIn('SCAN', before, name)
+            self.assertIn('USING INDEX', after, name)
+
+
+class KeysTestCase(unittest.TestCase):
+    """Test that UUID keys take less space than hex strings."""
+
+    def test_uuid_indexes_are_smaller(self):
+        results = keys.run(repeat=1, scale=0.01)
+
+        self.assertLess(results['sizes']['uuid']['indexes_kb'],
+                        results['sizes']['string']['indexes_kb'])
+        self.assertEqual(set(results['joins']), {
+            'stanzas per poem', 'comments with readers and poems',
+            'poems with poets', 'poems by id'})
@@ -0,0 +1,601 @@
+import hashlib
+import io
+import os
+import tempfile
+import unittest
+from PIL import Image
+from werkzeug.datastructures import FileStorage
+from app import create_app, db
+from app.models import (Poem, Resource, Reaction, User, Stanza, PoemRating,
+                        Category, Poet, Upload)
+from app.helpers import (search, rendering, img_handler, image_variants,
+                         page_cache)
+
+
+class PoemSlugTestCase(unittest.TestCase):
+    """Test that poems keep a stored slug in sync with their titles."""
+
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_slug_is_stored_on_create(self):
+        poem = Poem.create(return_=True, title='The Raven Sings')
+        self.assertEqual(poem.slug, 'the-raven-sings')
+        self.assertEqual(Poem.find_poem_by_slug('the-raven-sings'), poem)
+
+    def test_renamed_poem_resolves_old_slug(self):
+        poem = Poem.create(return_=True, title='First Light')
+        poem.title = 'Last Light'
+        poem.save()
+
+        self.assertEqual(poem.slug, 'last-light')
+        self.assertEqual(Poem.find_poem_by_slug('first-light'), poem)
+        self.assertEqual(Poem.find_poem_by_slug('last-light'), poem)
+
+    def test_live_slug_wins_over_redirect(self):
+        first = Poem.create(return_=True, title='Ember')
+        first.title = 'Ash'
+        first.save()
+
+        second = Poem.create(return_=True, title='Ember')
+        self.assertEqual(Poem.find_poem_by_slug('ember'), second)
+        self.assertEqual(Poem.find_poem_by_slug('ash'), first)
+
+    def test_colliding_slugs_are_suffixed(self):
+        first = Poem.create(return_=True, title='Ode')
+        second = Poem.create(return_=True, title='Ode!')
+        third = Poem.create(return_=True, title='An Ode')
+        third.title = 'ODE'
+        third.save()
+
+        self.assertEqual([first.slug, second.slug, third.slug],
+                         ['ode', 'ode-2', 'ode-3'])
+        second.title = 'Ode?!'
+        second.save()
+        self.assertEqual(second.slug, 'ode-2')
+
+    def test_unknown_slug_returns_none(self):
+        self.assertIsNone(Poem.find_poem_by_slug('nothing-here'))
+
+
+class ResourceVotesTestCase(unittest.TestCase):
+    """Test that the vote tallies on resources match their reactions."""
+
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.resource = Resource.create(return_=True, title='Meter',
+                                        body='Iambs and trochees')
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_update_votes_moves_a_vote(self):
+        Resource.update_votes(self.resource.id, added='UPVOTE')
+        Resource.update_votes(self.resource.id, added='DOWNVOTE',
+                              removed='UPVOTE')
+        db.session.commit()
+
+        self.assertEqual(self.resource.upvotes, 0)
+        self.assertEqual(self.resource.downvotes, 1)
+
+    def test_concurrent_switches_move_a_vote_once(self):
+        user = User.create(return_=True, username='ada', password='password')
+        reaction = Reaction.create(return_=True, user_id=user.id,
+                                   reaction_type='UPVOTE',
+                                   record_id=self.resource.id)
+        Resource.update_votes(self.resource.id, added='UPVOTE')
+
+        # both requests read the vote as an upvote
+        for _ in range(2):
+            if Reaction.switch_type(reaction.id, 'UPVOTE', 'DOWNVOTE'):
+                Resource.update_votes(self.resource.id, added='DOWNVOTE',
+                                      removed='UPVOTE')
+        db.session.commit()
+
+        self.assertEqual((self.resource.upvotes, self.resource.downvotes),
+                         (0, 1))
+
+    def test_recount_votes(self):
+        for username, vote in [('ada', 'UPVOTE'), ('bola', 'UPVOTE'),
+                               ('chi', 'DOWNVOTE')]:
+            user = User.create(return_=True, username=username,
+                               password='password')
+            Reaction.create(user_id=user.id, reaction_type=vote,
+                            record_id=self.resource.id)
+
+        Resource.recount_votes()
+
+        self.assertEqual(self.resource.upvotes, 2)
+        self.assertEqual(self.resource.downvotes, 1)
+
+
+class PoemSearchTestCase(unittest.TestCase):
+    """Test that the full-text index follows poems and their stanzas."""
+
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.backend = search.get_backend()
+        self.raven = Poem.create(return_=True, title='The Raven',
+                                 description='A midnight visitor')
+        self.sea = Poem.create(return_=True, title='Sea Fever',
+                               description='A poem about the raven sea')
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def find(self, search_string):
+        query, rank = self.backend.match(Poem.query, Poem, search_string)
+        return query.order_by(rank).all()
+
+    def test_title_matches_rank_first(self):
+        self.assertEqual(self.find('raven'), [self.raven, self.sea])
+
+    def test_stanzas_are_searchable(self):
+        Stanza.create(poem_id=self.sea.id, index=1,
+                      content='I must go down to the seas again')
+        self.assertEqual(self.find('seas again'), [self.sea])
+
+    def test_moved_stanzas_are_reindexed_in_both_poems(self):
+        stanza = Stanza.create(return_=True, poem_id=self.sea.id, index=1,
+                               content='Quinquireme of Nineveh')
+        stanza.poem_id = self.raven.id
+        stanza.save()
+        self.assertEqual(self.find('quinquireme'), [self.raven])
+
+    def test_edits_and_deletions_are_reindexed(self):
+        self.raven.title = 'The Crow'
+        self.raven.save()
+        self.assertEqual(self.find('crow'), [self.raven])
+
+        self.sea.delete()
+        self.assertEqual(self.find('raven'), [])
+
+
+class PoemRatingTestCase(unittest.TestCase):
+    """Test that the rating aggregates of poems follow their ratings."""
+
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.poem = Poem.create(return_=True, title='Kubla Khan')
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def rate(self, rating, removed=None):
+        Poem.update_rating(self.poem.id, rating, removed=removed)
+        db.session.commit()
+
+    def test_update_rating_keeps_the_mean(self):
+        self.rate(5)
+        self.rate(2)
+        self.assertEqual(self.poem.rating_count, 2)
+        self.assertAlmostEqual(self.poem.rating, 3.5)
+
+        # changing a rating does not add to the count
+        self.rate(4, removed=2)
+        self.assertEqual(self.poem.rating_count, 2)
+        self.assertAlmostEqual(self.poem.rating, 4.5)
+
+    def test_concurrent_changes_remove_the_old_rating_once(self):
+        user = User.create(return_=True, username='ada', password='password')
+        rating = PoemRating.create(return_=True, user_id=user.id,
+                                   poem_id=self.poem.id, rating=2)
+        self.rate(2)
+
+        # both requests read the rating as 2
+        for new in (4, 5):
+            if rating.change(new):
+                Poem.update_rating(self.poem.id, new, removed=2)
+        db.session.commit()
+
+        db.session.refresh(rating)
+        self.assertEqual((rating.rating, self.poem.rating_sum), (4, 4))
+
+    def test_recount_ratings(self):
+        for username, rating in [('ada', 1), ('bola', 2), ('chi', 4)]:
+            user = User.create(return_=True, username=username,
+                               password='password')
+            PoemRating.create(user_id=user.id, poem_id=self.poem.id,
+                              rating=rating)
+        unrated = Poem.create(return_=True, title='Ozymandias', rating=3)
+
+        Poem.recount_ratings()
+
+        self.assertEqual(self.poem.rating_count, 3)
+        self.assertAlmostEqual(self.poem.rating_sum, 7)
+        self.assertAlmostEqual(self.poem.rating, 7 / 3)
+        self.assertEqual(unrated.rating, 0)
+
+
+class CategorySummaryTestCase(unittest.TestCase):
+    """Test the memoized summaries of categories."""
+
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.odes = Category.create(return_=True, name='odes')
+        Category.create(name='sonnets', description='Fourteen lines')
+        Poem.create(title='Ode to Psyche', category_id=self.odes.id)
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def counts(self):
+        return {c['name']: c['poem_count'] for c in Category.get_summaries()}
+
+    def test_summaries_count_poems(self):
+        self.assertEqual(self.counts(), {'odes': 1, 'sonnets': 0})
+
+    def test_summaries_follow_writes(self):
+        self.counts()
+        Poem.create(title='Ode on Melancholy', category_id=self.odes.id)
+        Category.create(name='elegies')
+
+        self.assertEqual(self.counts(),
+                         {'elegies': 0, 'odes': 2, 'sonnets': 0})
+
+
+class ChoicesTestCase(unittest.TestCase):
+    """Test the memoized select field choices of poets and categories."""
+
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.add_poet('bola')
+        Category.create(name='odes')
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def add_poet(self, username):
+        user = User.create(return_=True, username=username,
+                           password='password')
+        return Poet.create(return_=True, user_id=user.id, gender='female',
+                           email=f'{username}@example.com')
+
+    def test_choices_follow_writes(self):
+        self.assertEqual(Poet.get_choices(), [('bola', 'Bola')])
+        self.assertEqual(Category.get_choices(), [('odes', 'ODES')])
+
+        self.add_poet('ada').delete()
+        self.add_poet('chi')
+        Category.create(name='elegies')
+
+        self.assertEqual(Poet.get_choices(), [('bola', 'Bola'), ('chi', 'Chi')])
+        self.assertEqual(Category.get_choices(),
+                         [('elegies', 'ELEGIES'), ('odes', 'ODES')])
+
+    def test_renamed_user_updates_choices(self):
+        Poet.get_choices()
+        user = User.find_by(username='bola', one=True)
+        user.username = 'bolaji'
+        user.save()
+
+        self.assertEqual(Poet.get_choices(), [('bolaji', 'Bolaji')])
+
+    def test_signups_and_logins_keep_cached_pages(self):
+        tags = ['poems', 'poets', 'categories']
+        versions = page_cache._get_versions(tags)
+
+        user = User.create(return_=True, username='ada', password='password')
+        user.password = 'changed'
+        user.save()
+        self.assertEqual(page_cache._get_versions(tags), versions)
+
+        user.username = 'lovelace'
+        user.save()
+        self.assertNotIn(page_cache._get_versions(tags)[0], versions)
+
+
+class HexUUIDTestCase(unittest.TestCase):
+    """Test that compact keys are still read and written as hex strings."""
+
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_keys_are_stored_as_16_bytes(self):
+        poem = Poem.create(return_=True, title='Compact')
+        stored = db.session.execute(
+            db.text('SELECT id FROM poems')).scalar()
+
+        self.assertEqual(len(poem.id), 32)
+        self.assertEqual(stored.hex(), poem.id)
+
+    def test_foreign_keys_join_on_hex_ids(self):
+        poem = Poem.create(return_=True, title='Joined')
+        Stanza.create(poem_id=poem.id, index=1, content='A line')
+
+        self.assertEqual(Stanza.find_by(poem_id=poem.id, one=True).poem_id,
+                         poem.id)
+        self.assertEqual(Poem.find_by(id=poem.id.upper(), one=True), poem)
+
+    def test_malformed_id_matches_nothing(self):
+        Poem.create(title='Lonely')
+        self.assertIsNone(Poem.find_by(id='not-a-uuid', one=True))
+
+
+class ResourceRenderingTestCase(unittest.TestCase):
+    """Test that resource bodies are rendered once per distinct text."""
+
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        rendering.renders.clear()
+
+        self.resource = Resource.create(
+            return_=True, title='Forms',
+            rtype=Resource.ResourceTypes.BRIEF.value, body='A **sonnet**, see https://example.com <script>x</script>')
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_body_is_sanitized_and_linkified(self):
+        html = self.resource.body_html
+        self.assertIn('<strong>sonnet</strong>', html)
+        self.assertIn('<a href="https://example.com" rel="nofollow">', html)
+        self.assertNotIn('<script>', html)
+
+    def test_unchanged_body_is_not_rendered_again(self):
+        self.resource.body_html = 'kept'
+        self.resource.body = self.resource.body
+        self.resource.save()
+        self.assertEqual(self.resource.body_html, 'kept')
+
+    def test_repeated_text_hits_the_cache(self):
+        other = Resource.create(return_=True, title='Forms again',
+                                rtype=Resource.ResourceTypes.BRIEF.value,
+                                body=self.resource.body)
+        self.assertEqual(other.body_html, self.resource.body_html)
+        self.assertEqual((rendering.renders.misses, rendering.renders.hits),
+                         (1, 1))
+
+    def test_rerender_writes_only_changed_html(self):
+        db.session.execute(db.update(Resource).values(body_html='stale'))
+        db.session.commit()
+
+        self.assertEqual(Resource.rerender_bodies(batch_size=1), 1)
+        db.session.expire_all()
+        self.assertIn('<strong>sonnet</strong>', self.resource.body_html)
+        self.assertEqual(Resource.rerender_bodies(), 0)
+
+
+class ImageStoreTestCase(unittest.TestCase):
+    """Test that uploaded images are stored once and counted by use."""
+
+    def setUp(self):
+        self.app = create_app('testing')
+        self.upload_folder = tempfile.TemporaryDirectory()
+        self.app.config['UPLOAD_FOLDER'] = self.upload_folder.name
+        self.context = self.app.test_request_context()
+        self.context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.context.pop()
+        self.upload_folder.cleanup()
+
+    def save(self, content, filename='photo.PNG'):
+        return img_handler.save_img(FileStorage(io.BytesIO(content), filename))
+
+    def create(self, title, url):
+        return Resource.create(return_=True, title=title, body=url,
+                               rtype=Resource.ResourceTypes.IMAGE.value)
+
+    def exists(self, url):
+        return os.path.exists(os.path.join(
+            self.upload_folder.name, img_handler.upload_path(url)))
+
+    def test_image_is_stored_under_its_sharded_hash(self):
+        content = b'\x89PNG' * 50000
+        url = self.save(content)
+        digest = hashlib.sha256(content).hexdigest()
+
+        self.assertEqual(url, f'/uploads/resources/{digest[:2]}/'
+                              f'{digest[2:4]}/{digest}.png')
+        with open(os.path.join(self.upload_folder.name,
+                               img_handler.upload_path(url)), 'rb') as file:
+            self.assertEqual(file.read(), content)
+        self.assertEqual(os.listdir(os.path.join(
+            self.upload_folder.name, '.tmp')), [])
+
+    def test_shared_image_is_deleted_with_its_last_use(self):
+        url = self.save(b'same image')
+        self.assertEqual(self.save(b'same image', 'copy.png'), url)
+        first, second = self.create('First', url), self.create('Second', url)
+        self.assertEqual(Upload.find_by(path=img_handler.upload_path(url),
+                                        one=True).refcount, 2)
+
+        first.delete()
+        self.assertTrue(self.exists(url))
+        second.delete()
+        self.assertFalse(self.exists(url))
+        self.assertEqual(Upload.find_all(), [])
+
+    def test_replaced_image_is_deleted_on_commit(self):
+        old, new = self.save(b'old image'), self.save(b'new image')
+        resource = self.create('Replaced', old)
+
+        resource.body = new
+        db.session.flush()
+        self.assertTrue(self.exists(old))
+        db.session.commit()
+        self.assertFalse(self.exists(old))
+        self.assertTrue(self.exists(new))
+
+    def test_image_of_a_rolled_back_resource_is_deleted(self):
+        kept = self.save(b'kept image')
+        self.create('Kept', kept)
+
+        dropped = self.save(b'dropped image')
+        self.assertEqual(self.save(b'kept image', 'copy.png'), kept)
+        db.session.add(Resource(title='Dropped', body=dropped,
+                                rtype=Resource.ResourceTypes.IMAGE.value))
+        db.session.flush()
+        db.session.rollback()
+        self.assertFalse(self.exists(dropped))
+        self.assertTrue(self.exists(kept))
+
+    def test_rolled_back_delete_keeps_the_image(self):
+        url = self.save(b'kept image')
+        resource = self.create('Kept', url)
+
+        db.session.delete(resource)
+        db.session.flush()
+        db.session.rollback()
+        self.assertTrue(self.exists(url))
+        self.assertEqual(Upload.find_by(path=img_handler.upload_path(url),
+                                        one=True).refcount, 1)
+
+
+class ImageVariantsTestCase(unittest.TestCase):
+    """Test that image resources get downscaled variants once saved."""
+
+    def setUp(self):
+        self.app = create_app('testing')
+        self.upload_folder = tempfile.TemporaryDirectory()
+        self.app.config['UPLOAD_FOLDER'] = self.upload_folder.name
+        self.context = self.app.test_request_context()
+        self.context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.context.pop()
+        self.upload_folder.cleanup()
+
+    def save(self, size, color='teal', filename='photo.png'):
+        content = io.BytesIO()
+        Image.new('RGB', size, color).save(content, 'PNG')
+        content.seek(0)
+        return img_handler.save_img(FileStorage(content, filename))
+
+    def create(self, title, url):
+        return Resource.create(return_=True, title=title, body=url,
+                               rtype=Resource.ResourceTypes.IMAGE.value)
+
+    def exists(self, url):
+        return os.path.exists(os.path.join(
+            self.upload_folder.name, img_handler.upload_path(url)))
+
+    def test_variants_are_recorded_once_saved(self):
+        url = self.save((2000, 1000))
+        resource = self.create('Wide', url)
+        db.session.refresh(resource)
+
+        self.assertEqual({name: (variant['width'], variant['height'])
+                          for name, variant in resource.variants.items()},
+                         {'thumbnail': (160, 80), 'card': (480, 240),
+                          'full': (1280, 640)})
+        for variant in resource.variants.values():
+            self.assertTrue(variant['url'].endswith('.webp'))
+            self.assertTrue(self.exists(variant['url']))
+        card = resource.variants['card']['url']
+        self.assertEqual(resource.image_url('card'), card)
+        self.assertIn(f'{card} 480w', resource.srcset)
+
+    def test_small_image_is_not_upscaled(self):
+        resource = self.create('Small', self.save((100, 50)))
+        db.session.refresh(resource)
+        self.assertEqual(resource.srcset,
+                         f"{resource.variants['thumbnail']['url']} 100w")
+
+    def test_unreadable_image_is_served_as_is(self):
+        url = img_handler.save_img(FileStorage(io.BytesIO(b'no image'),
+                                               'broken.png'))
+        resource = self.create('Broken', url)
+        db.session.refresh(resource)
+        self.assertIsNone(resource.variants)
+        self.assertIsNone(resource.srcset)
+        self.assertEqual(resource.image_url('card'), url)
+
+    def test_replaced_image_gets_new_variants(self):
+        old, new = self.save((600, 600), 'red'), self.save((600, 600), 'blue')
+        resource = self.create('Replaced', old)
+        old_card = resource.variants['card']['url']
+
+        resource.body = new
+        self.assertIsNone(resource.variants)
+        db.session.commit()
+        db.session.refresh(resource)
+        self.assertNotEqual(resource.variants['card']['url'], old_card)
+        # the variants go with the image they were made from
+        self.assertFalse(self.exists(old_card))
+        self.assertTrue(self.exists(resource.variants['card']['url']))
+
+    def test_deleting_a_legacy_image_keeps_similar_names(self):
+        folder = os.path.join(self.upload_folder.name, 'resources')
+        os.makedirs(folder)
+        for name in ('abc_photo.png', 'abc_photo-2.png',
+                     'abc_photo-card.webp'):
+            open(os.path.join(folder, name), 'wb').close()
+
+        self.assertTrue(img_handler.delete_img(
+            '/static/uploads/resources/abc_photo.png'))
+        self.assertEqual(os.listdir(folder), ['abc_photo-2.png'])
+
+    def test_backfill_makes_missing_variants(self):
+        resource = self.create('Backfilled', self.save((800, 400)))
+        db.session.execute(db.update(Resource).values(variants=None))
+        db.session.commit()
+        for name, _ in image_variants.VARIANTS:
+            os.remove(os.path.join(self.upload_folder.name,
+                                   image_variants.variant_path(
+                                       img_handler.upload_path(resource.body),
+                                       name)))
+
+        self.assertEqual(Resource.make_image_variants(), 1)
+        self.assertEqual(Resource.make_image_variants(), 0)
+        resource = Resource.find_by(id=resource.id, one=True)
+        self.assertEqual(resource.variants['card']['width'], 480)
+        self.assertTrue(self.exists(resource.variants['card']['url']))
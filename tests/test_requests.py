@@ -0,0 +1,648 @@
+import json
+import os
+import re
+import tempfile
+import unittest
+from unittest import mock
+from app import create_app, db, slow_query_log
+from app.helpers.idempotency import ExpiringKeys
+from app.helpers.slow_queries import logger as slow_query_logger
+from app.models import User, Poet, Poem, Category, Stanza, Comment
+
+
+class QueryCounter:
+    """Count the SQL statements (that mention a table) while active."""
+
+    def __init__(self, table=None):
+        self.table = table
+        self.count = 0
+        self.statements = []
+
+    def __call__(self, conn, cursor, statement, *args):
+        if self.table is None or f'FROM {self.table}' in statement:
+            self.count += 1
+            self.statements.append(statement)
+
+    def __enter__(self):
+        db.event.listen(db.engine, 'before_cursor_execute', self)
+        return self
+
+    def __exit__(self, *exc):
+        db.event.remove(db.engine, 'before_cursor_execute', self)
+
+
+class CurrentPoetTestCase(unittest.TestCase):
+    """Test that the current user's poet account is resolved once per request."""
+
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config.update(SECRET_KEY='testing', WTF_CSRF_ENABLED=False)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        user = User.create(return_=True, username='ovid', password='password')
+        poet = Poet.create(return_=True, user_id=user.id, gender='male',
+                           email='ovid@example.com')
+        for title in ['Metamorphoses', 'Amores', 'Fasti']:
+            Poem.create(title=title, author_id=poet.id)
+
+        self.client = self.app.test_client()
+        self.client.post('/login', data={'username': 'ovid',
+                                         'password': 'password'})
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_poems_index_queries_poet_once(self):
+        with QueryCounter('poets') as counter:
+            response = self.client.get('/poems/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(counter.count, 1)
+
+
+class AnonymousPageCacheTestCase(unittest.TestCase):
+    """Test that anonymous pages are cached until the poems they show change."""
+
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['SECRET_KEY'] = 'testing'
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.category = Category.create(return_=True, name='odes')
+        self.poem = Poem.create(return_=True, title='Ode to Autumn',
+                                category_id=self.category.id, published=True)
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_index_is_served_from_cache(self):
+        self.client.get('/poems/')
+
+        with QueryCounter('poems') as counter:
+            response = self.client.get('/poems/')
+
+        self.assertIn(b'Ode to Autumn', response.data)
+        self.assertEqual(counter.count, 0)
+
+    def test_writes_invalidate_cached_pages(self):
+        self.client.get('/poems/')
+        self.client.get(f'/poems/s/{self.poem.slug}')
+
+        Stanza.create(poem_id=self.poem.id, index=1,
+                      content='Season of mists and mellow fruitfulness')
+        self.poem.title = 'To Autumn'
+        self.poem.save()
+
+        self.assertIn(b'To Autumn', self.client.get('/poems/').data)
+        response = self.client.get(f'/poems/s/{self.poem.slug}')
+        self.assertIn(b'mellow fruitfulness', response.data)
+
+    def test_new_poets_appear_on_the_cached_search_page(self):
+        self.client.get('/poems/search')
+
+        user = User.create(return_=True, username='keats',
+                           password='password')
+        Poet.create(user_id=user.id, gender='male', email='keats@example.com')
+
+        self.assertIn(b'Keats', self.client.get('/poems/search').data)
+
+    def test_unrelated_poem_pages_stay_cached(self):
+        other = Poem.create(return_=True, title='Ode to a Nightingale',
+                            category_id=self.category.id, published=True)
+        self.client.get(f'/poems/s/{other.slug}')
+
+        Comment.create(poem_id=self.poem.id, comment='Lovely')
+
+        with QueryCounter('stanzas') as counter:
+            self.client.get(f'/poems/s/{other.slug}')
+        self.assertEqual(counter.count, 0)
+
+
+class PoemCardsQueryCountTestCase(unittest.TestCase):
+    """Test that listing pages cost the same number of queries at any size."""
+
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config.update(SECRET_KEY='testing', WTF_CSRF_ENABLED=False)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        categories = [Category.create(return_=True, name=name)
+                      for name in ['odes', 'sonnets', 'elegies']]
+        for i in range(12):
+            user = User.create(return_=True, username=f'poet{i}',
+                               password='password')
+            poet = Poet.create(return_=True, user_id=user.id, gender='male',
+                               email=f'poet{i}@example.com')
+            Poem.create(title=f'Poem {i}', author_id=poet.id, published=True,
+                        category_id=categories[i % 3].id)
+
+        # logged-in readers skip the page cache
+        User.create(username='reader', password='password')
+        self.client = self.app.test_client()
+        self.client.post('/login', data={'username': 'reader',
+                                         'password': 'password'})
+        # warm up the lookups of the logged-in reader and the form choices
+        self.client.get('/poems/')
+        self.client.get('/poems/search')
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def count_queries(self, url, per_page):
+        self.app.config['FLASK_POEMS_PER_PAGE'] = per_page
+
+        with QueryCounter() as counter:
+            response = self.client.get(url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data.count(b'class="poem-author"'), per_page)
+        return counter.count
+
+    def test_index_query_count_is_fixed(self):
+        self.assertEqual(self.count_queries('/poems/', 3),
+                         self.count_queries('/poems/', 12))
+
+    def test_search_query_count_is_fixed(self):
+        self.assertEqual(self.count_queries('/poems/search?q=poem', 3),
+                         self.count_queries('/poems/search?q=poem', 12))
+
+
+class CursorPaginationTestCase(unittest.TestCase):
+    """Test that cursor pages cover every poem once in each ordering."""
+
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config.update(SECRET_KEY='testing', FLASK_POEMS_PER_PAGE=4)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        category = Category.create(return_=True, name='odes')
+        self.titles = set()
+        for i in range(11):
+            user = User.create(return_=True, username=f'poet{i % 3}{i}',
+                               password='password')
+            poet = Poet.create(return_=True, user_id=user.id, gender='male',
+                               email=f'poet{i}@example.com')
+            # many poems share a rating so the id has to break ties
+            Poem.create(title=f'Poem {i:02}', author_id=poet.id,
+                        rating=i % 2, published=True,
+                        category_id=category.id)
+            self.titles.add(f'Poem {i:02}')
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def walk(self, order):
+        titles, cursor = [], ''
+
+        while cursor is not None:
+            response = self.client.get('/poems/', query_string={
+                'order': order, 'cursor': cursor})
+            html = response.get_data(as_text=True)
+            titles += re.findall(r'class="poem-title">(.*?)<', html)
+
+            next_page = re.search(r'href="[^"]*cursor=([\w-]+)[^"]*">\s*&rArr;', html)
+            cursor = next_page.group(1) if next_page else None
+        return titles
+
+    def test_every_ordering_visits_each_poem_once(self):
+        for order in ['RECENT', 'POPULAR', 'A-Z', 'Z-A', 'AUTHORS']:
+            titles = self.walk(order)
+            self.assertEqual(len(titles), len(self.titles), order)
+            self.assertEqual(set(titles), self.titles, order)
+
+    def test_cursor_follows_the_ordering(self):
+        self.assertEqual(self.walk('Z-A'), sorted(self.titles, reverse=True))
+
+    def test_poems_without_authors_come_last(self):
+        category = Category.find_by(name='odes', one=True)
+        for i in range(3):
+            Poem.create(title=f'Orphan {i}', published=True, rating=i,
+                        category_id=category.id)
+
+        titles = self.walk('AUTHORS')
+        self.assertEqual(len(titles), len(self.titles) + 3)
+        self.assertEqual(sorted(titles[-3:]),
+                         ['Orphan 0', 'Orphan 1', 'Orphan 2'])
+
+
+class SearchResultsTestCase(unittest.TestCase):
+    """Test that search results are paginated and can be streamed."""
+
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config.update(SECRET_KEY='testing',
+                               FLASK_SEARCH_MAX_PER_PAGE=3,
+                               FLASK_SEARCH_STREAM_BATCH=2)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        for i in range(5):
+            Poem.create(title=f'Raven {i}', published=True)
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_page_size_is_capped(self):
+        response = self.client.get('/poems/search', query_string={
+            'q': 'raven', 'per_page': 100})
+        html = response.get_data(as_text=True)
+        self.assertEqual(len(re.findall(r'class="poem-title"', html)), 3)
+
+    def test_export_streams_every_result(self):
+        response = self.client.get('/poems/search/export',
+                                   query_string={'q': 'raven'})
+        self.assertTrue(response.is_streamed)
+        self.assertEqual(response.mimetype, 'text/csv')
+
+        rows = response.get_data(as_text=True).splitlines()
+        self.assertEqual(len(rows), 6)
+        self.assertTrue(rows[0].startswith('title,'))
+
+
+class SQLProfilingTestCase(unittest.TestCase):
+    """Test the per-request SQL profile and its summary page."""
+
+    def setUp(self):
+        with mock.patch.dict(os.environ, {'POETPIECE_SQL_PROFILING': 'true',
+                                          'POETPIECE_SQL_PROFILING_PAGE': 'true'}):
+            self.app = create_app('testing')
+        self.app.config.update(SECRET_KEY='testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        category = Category.create(return_=True, name='odes')
+        Poem.create(title='Ode to a Nightingale', published=True,
+                    category_id=category.id)
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_responses_carry_server_timing(self):
+        response = self.client.get('/poems/search?q=ode')
+        timing = response.headers['Server-Timing']
+        self.assertRegex(timing, r'^db;dur=[\d.]+;desc="\d+ queries", app;dur=')
+
+    def test_summary_lists_endpoints_and_statements(self):
+        for _ in range(3):
+            self.client.get('/poems/search?q=ode')
+
+        response = self.client.get('/_perf')
+        html = response.get_data(as_text=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('poems.search', html)
+        self.assertIn('FROM poems', html)
+
+    def test_summary_needs_its_own_flag(self):
+        with mock.patch.dict(os.environ, {'POETPIECE_SQL_PROFILING': 'true'}):
+            app = create_app('testing')
+        response = app.test_client().get('/_perf')
+        self.assertEqual(response.status_code, 404)
+        self.assertIn('Server-Timing', response.headers)
+
+
+class SlowQueryLogTestCase(unittest.TestCase):
+    """Test that slow statements are logged once with their plans."""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'slow.jsonl')
+        # every statement counts as slow
+        with mock.patch.dict(os.environ, {
+                'POETPIECE_SLOW_QUERY_THRESHOLD': '0.000001',
+                # plans are read on another connection than the request's
+                'POETPIECE_SQLALCHEMY_DATABASE_URI': json.dumps(
+                    f'sqlite:///{self.directory.name}/poems.sqlite'),
+                'POETPIECE_SLOW_QUERY_LOG': json.dumps(self.path)}):
+            self.app = create_app('testing')
+        self.app.config.update(SECRET_KEY='testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        Poem.create(title='Tintern Abbey', published=True)
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        slow_query_log.threshold = 0
+        slow_query_log.seen.clear()
+        for handler in list(slow_query_logger.handlers):
+            slow_query_logger.removeHandler(handler)
+            handler.close()
+        self.directory.cleanup()
+
+    def entries(self):
+        slow_query_log.flush()
+        with open(self.path) as file:
+            return [json.loads(line) for line in file]
+
+    def test_statements_are_logged_with_plans(self):
+        self.client.get('/poems/s/tintern-abbey')
+
+        entries = [entry for entry in self.entries()
+                   if entry['endpoint'] == 'poems.poem_by_slug'
+                   and 'WHERE poems.slug = ?' in entry['sql']]
+        self.assertTrue(entries)
+        for entry in entries:
+            self.assertEqual(entry['parameters'][0], 'str')
+            self.assertTrue(entry['plan'])
+
+    def test_repeated_statements_are_logged_once(self):
+        self.client.get('/poems/s/tintern-abbey')
+        self.client.get('/poems/s/tintern-abbey')
+
+        statements = [entry['sql'] for entry in self.entries()]
+        self.assertEqual(len(statements), len(set(statements)))
+
+
+class StanzaBatchTestCase(unittest.TestCase):
+    """Test saving every stanza of a poem in one request."""
+
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config.update(SECRET_KEY='testing', WTF_CSRF_ENABLED=False)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        user = User.create(return_=True, username='blake', password='password')
+        poet = Poet.create(return_=True, user_id=user.id, gender='male',
+                           email='blake@example.com')
+        self.poem = Poem.create(return_=True, title='The Tyger',
+                                author_id=poet.id)
+        self.ids = []
+        for index, content in enumerate(['Tyger Tyger', 'In what distant',
+                                         'And what shoulder'], 1):
+            stanza = Stanza.create(return_=True, poem_id=self.poem.id,
+                                   index=index, content=content)
+            self.ids.append(stanza.id)
+
+        self.client = self.app.test_client()
+        self.client.post('/login', data={'username': 'blake',
+                                         'password': 'password'})
+        self.url = f'/poems/{self.poem.id}/stanzas'
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_insert_edit_move_and_delete_at_once(self):
+        first, second, third = self.ids
+
+        with QueryCounter() as counter:
+            response = self.client.put(self.url, json={'stanzas': [
+                {'id': third, 'content': 'And what shoulder'},
+                {'content': 'When the stars threw down'},
+                {'id': first, 'content': 'Tyger Tyger, burning bright'},
+            ]})
+
+        self.assertEqual(response.status_code, 200)
+        stanzas = response.get_json()['stanzas']
+        self.assertEqual([s['index'] for s in stanzas], [1, 2, 3])
+        self.assertEqual([s['content'] for s in stanzas], [
+            'And what shoulder', 'When the stars threw down',
+            'Tyger Tyger, burning bright'])
+        self.assertEqual(stanzas[0]['id'], third)
+        self.assertIsNone(Stanza.find_by(id=second, one=True))
+
+        # both moved stanzas are renumbered by the same statement
+        moves = [statement for statement in counter.statements
+                 if statement.startswith('UPDATE stanzas SET "index"')]
+        self.assertEqual(len(moves), 1)
+
+    def test_stanzas_of_other_poems_are_refused(self):
+        other = Poem.create(return_=True, title='London')
+        stray = Stanza.create(return_=True, poem_id=other.id, index=1,
+                              content='I wander thro each charterd street')
+
+        response = self.client.put(self.url, json={'stanzas': [
+            {'id': stray.id, 'content': 'Taken'}]})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.poem.stanzas.count(), 3)
+        self.assertEqual(Stanza.find_by(id=stray.id, one=True).poem_id, other.id)
+
+    def test_empty_content_is_refused(self):
+        response = self.client.put(self.url, json={'stanzas': [
+            {'content': '  '}]})
+        self.assertEqual(response.status_code, 400)
+
+    def test_malformed_bodies_are_refused(self):
+        for body in ([{'content': 'Tyger Tyger'}], 'stanzas', None,
+                     {'stanzas': [{'id': [1], 'content': 'Tyger'}]}):
+            with self.subTest(body=body):
+                response = self.client.put(self.url, json=body)
+                self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.poem.stanzas.count(), 3)
+
+
+class UploadServingTestCase(unittest.TestCase):
+    """Test that uploads are served to be cached for good."""
+
+    def setUp(self):
+        self.app = create_app('testing')
+        self.upload_folder = tempfile.TemporaryDirectory()
+        self.app.config['UPLOAD_FOLDER'] = self.upload_folder.name
+        self.path = 'resources/ab/cd/abcdef.png'
+        os.makedirs(os.path.join(self.upload_folder.name, 'resources/ab/cd'))
+        os.makedirs(os.path.join(self.upload_folder.name, '.tmp'))
+        for path in (self.path, '.tmp/partial'):
+            with open(os.path.join(self.upload_folder.name, path), 'wb') as f:
+                f.write(b'\x89PNG image')
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        self.upload_folder.cleanup()
+
+    def test_upload_is_immutable_with_a_strong_etag(self):
+        response = self.client.get(f'/uploads/{self.path}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, b'\x89PNG image')
+        self.assertEqual(response.mimetype, 'image/png')
+        self.assertEqual(response.headers['ETag'], '"abcdef"')
+        self.assertIn('immutable', response.headers['Cache-Control'])
+        self.assertEqual(response.headers['Cache-Control'],
+                         'public, max-age=31536000, immutable')
+
+    def test_conditional_get_is_not_modified(self):
+        response = self.client.get(f'/uploads/{self.path}',
+                                   headers={'If-None-Match': '"abcdef"'})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, b'')
+        self.assertIn('immutable', response.headers['Cache-Control'])
+
+    def test_proxy_can_send_the_file(self):
+        self.app.config['UPLOADS_ACCEL_REDIRECT'] = '/_uploads/'
+        response = self.client.get(f'/uploads/{self.path}')
+        self.assertEqual(response.headers['X-Accel-Redirect'],
+                         f'/_uploads/{self.path}')
+        self.assertEqual(response.data, b'')
+        self.assertEqual(self.client.get(
+            f'/uploads/{self.path}', headers={'If-None-Match': '"abcdef"'}
+        ).status_code, 304)
+
+        self.app.config.update(UPLOADS_ACCEL_REDIRECT=None,
+                               USE_X_SENDFILE=True)
+        response = self.client.get(f'/uploads/{self.path}')
+        self.assertTrue(response.headers['X-Sendfile'].endswith(self.path))
+
+    def test_missing_and_hidden_files_are_not_found(self):
+        for path in ('resources/ab/cd/missing.png', '.tmp/partial',
+                     '../secret'):
+            self.assertEqual(self.client.get(f'/uploads/{path}').status_code,
+                             404)
+
+
+class ConditionalPoemPageTestCase(unittest.TestCase):
+    """Test that poem pages are validated by a version kept on write."""
+
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config.update(SECRET_KEY='testing', WTF_CSRF_ENABLED=False)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.category = Category.create(return_=True, name='sonnets')
+        self.poem = Poem.create(return_=True, title='Ozymandias',
+                                category_id=self.category.id, published=True)
+        self.url = f'/poems/s/{self.poem.slug}'
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def revisit(self, response):
+        return self.client.get(self.url, headers={
+            'If-None-Match': response.headers['ETag']})
+
+    def test_unchanged_page_is_not_modified_before_it_is_queried(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Last-Modified', response.headers)
+        self.assertIn('no-cache', response.headers['Cache-Control'])
+
+        with QueryCounter() as counter:
+            revisit = self.revisit(response)
+        self.assertEqual(revisit.status_code, 304)
+        self.assertEqual(revisit.data, b'')
+        self.assertEqual(counter.count, 1)
+
+        revisit = self.client.get(self.url, headers={
+            'If-Modified-Since': response.headers['Last-Modified']})
+        self.assertEqual(revisit.status_code, 304)
+
+    def test_writes_to_the_poem_and_its_content_change_the_version(self):
+        writes = [
+            lambda: Stanza.create(poem_id=self.poem.id, index=1,
+                                  content='I met a traveller'),
+            lambda: Comment.create(poem_id=self.poem.id, comment='Vast'),
+            lambda: Poem.update_rating(self.poem.id, 4),
+            lambda: setattr(self.poem, 'description', 'Two vast legs'),
+            lambda: setattr(self.category, 'name', 'ruins'),
+        ]
+        response = self.client.get(self.url)
+        for write in writes:
+            write()
+            db.session.commit()
+            revisit = self.revisit(response)
+            self.assertEqual(revisit.status_code, 200)
+            self.assertNotEqual(revisit.headers['ETag'],
+                                response.headers['ETag'])
+            response = revisit
+        self.assertIn(b'ruins', response.data)
+
+    def test_renamed_commenters_and_moved_stanzas_change_the_version(self):
+        user = User.create(return_=True, username='shelley',
+                           password='password')
+        Comment.create(poem_id=self.poem.id, user_id=user.id, comment='Vast')
+        stanza = Stanza.create(return_=True, poem_id=self.poem.id, index=1,
+                               content='I met a traveller')
+        other = Poem.create(return_=True, title='Mont Blanc')
+
+        writes = [lambda: setattr(user, 'username', 'percy'),
+                  lambda: setattr(stanza, 'poem_id', other.id)]
+        response = self.client.get(self.url)
+        for write in writes:
+            write()
+            db.session.commit()
+            revisit = self.revisit(response)
+            self.assertEqual(revisit.status_code, 200)
+            response = revisit
+        self.assertNotIn(b'I met a traveller', response.data)
+
+    def test_pages_of_other_visitors_are_not_reused(self):
+        response = self.client.get(self.url)
+        User.create(username='shelley', password='password')
+        self.client.post('/login', data={'username': 'shelley',
+                                         'password': 'password'})
+
+        revisit = self.revisit(response)
+        self.assertEqual(revisit.status_code, 200)
+        self.assertIn('private', revisit.headers['Cache-Control'])
+        self.assertEqual(self.revisit(revisit).status_code, 304)
+
+
+class ExpiringKeysTestCase(unittest.TestCase):
+    """Test that the keys of failed posts expire and stay bounded."""
+
+    def setUp(self):
+        self.now = 0
+        self.keys = ExpiringKeys(ttl=60, size=3, clock=lambda: self.now)
+
+    def test_key_is_added_once_until_it_expires(self):
+        self.assertTrue(self.keys.add('post'))
+        self.assertFalse(self.keys.add('post'))
+
+        self.now = 59
+        self.assertIn('post', self.keys)
+        self.now = 60
+        self.assertNotIn('post', self.keys)
+        self.assertTrue(self.keys.add('post'))
+
+    def test_keys_expire_in_the_order_they_were_added(self):
+        for self.now, key in enumerate(['a', 'b', 'c']):
+            self.keys.add(key)
+
+        self.now = 61
+        self.assertEqual(len(self.keys), 1)
+        self.assertIn('c', self.keys)
+
+    def test_oldest_keys_go_over_the_size_cap(self):
+        for key in ['a', 'b', 'c', 'd']:
+            self.keys.add(key)
+
+        self.assertEqual(len(self.keys), 3)
+        self.assertNotIn('a', self.keys)
+        self.assertIn('d', self.keys)
@@ -0,0 +1,48 @@
+import unittest
+from app import create_app, db
+from app.models import Poem, PoemRating, Resource, Reaction, Stanza
+from app.helpers import search
+from app.helpers.seed import Seeder
+
+
+class SeederTestCase(unittest.TestCase):
+    """Test that the synthetic dataset is consistent once loaded."""
+
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        seeder = Seeder(batch_size=50, seed=7)
+        seeder.seed_users(30, 5)
+        seeder.seed_categories(3)
+        seeder.seed_poems(40, 2)
+        seeder.seed_comments(100)
+        seeder.seed_ratings(200)
+        seeder.seed_resources(5, 40)
+        seeder.rebuild()
+        self.seeder = seeder
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_counts_match_the_tables(self):
+        self.assertEqual(self.seeder.counts['poems'], Poem.query.count())
+        self.assertEqual(self.seeder.counts['stanzas'], Stanza.query.count())
+        self.assertEqual(self.seeder.counts['poem_ratings'],
+                         PoemRating.query.count())
+
+    def test_aggregates_are_rebuilt(self):
+        self.assertEqual(db.session.query(db.func.sum(Poem.rating_count)).scalar(),
+                         PoemRating.query.count())
+        self.assertEqual(
+            db.session.query(db.func.sum(Resource.upvotes + Resource.downvotes)).scalar(),
+            Reaction.query.count())
+
+    def test_poems_are_searchable(self):
+        poem = Poem.query.first()
+        query, rank = search.get_backend().match(Poem.query, Poem, poem.title)
+        self.assertIn(poem, query.all())
@@ -0,0 +1,124 @@
+import io
+import json
+import unittest
+from app import create_app, db
+from app.models import User, Poet, Poem, Category, Stanza
+from app.helpers import search
+from app.poems import transfer
+
+
+class PoemTransferTestCase(unittest.TestCase):
+    """Test exporting poems as JSON Lines and importing them back."""
+
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config.update(SECRET_KEY='testing', WTF_CSRF_ENABLED=False)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.poet = self.add_poet('wordsworth')
+        odes = Category.create(return_=True, name='odes')
+        poem = Poem.create(return_=True, title='Ode to Duty', published=True,
+                           author_id=self.poet.id, category_id=odes.id)
+        for index, content in enumerate(['Stern Daughter', 'Of the Voice'], 1):
+            Stanza.create(poem_id=poem.id, index=index, content=content)
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def add_poet(self, username):
+        user = User.create(return_=True, username=username,
+                           password='password')
+        return Poet.create(return_=True, user_id=user.id, gender='male',
+                           email=f'{username}@example.com')
+
+    def export(self):
+        return [json.loads(line)
+                for line in transfer.export_poems(batch_size=1)]
+
+    def test_export_includes_stanzas_and_references(self):
+        [poem] = self.export()
+        self.assertEqual(poem['slug'], 'ode-to-duty')
+        self.assertEqual(poem['category'], 'odes')
+        self.assertEqual(poem['author'], 'wordsworth')
+        self.assertEqual([s['content'] for s in poem['stanzas']],
+                         ['Stern Daughter', 'Of the Voice'])
+
+    def test_import_upserts_by_slug(self):
+        [poem] = self.export()
+        poem['stanzas'] = [{'index': 1, 'content': 'Rewritten'}]
+        lines = [json.dumps(poem),
+                 json.dumps({'title': 'The Prelude', 'category': 'epics',
+                             'author': 'wordsworth',
+                             'stanzas': [{'content': 'Oh there is blessing'}]})]
+
+        self.assertEqual(transfer.import_poems(lines, chunk_size=1), (1, 1, 0))
+        self.assertEqual(Poem.query.count(), 2)
+        self.assertEqual([s.content for s in Stanza.query.order_by(Stanza.content)],
+                         ['Oh there is blessing', 'Rewritten'])
+
+        prelude = Poem.find_by(slug='the-prelude', one=True)
+        self.assertEqual(prelude.categories.name, 'epics')
+        self.assertEqual(prelude.author_id, self.poet.id)
+
+        query, _ = search.get_backend().match(Poem.query, Poem, 'blessing')
+        self.assertEqual(query.all(), [prelude])
+
+    def test_invalid_lines_are_rejected(self):
+        with self.assertRaises(transfer.PoemImportError):
+            transfer.import_poems(['{"description": "no title"}'])
+
+    def test_fields_are_checked_and_converted(self):
+        for poem in (['a list'], {'title': 42}, {'title': 'A', 'premium': 'no'},
+                     {'title': 'A', 'stanzas': [{'index': 'one',
+                                                 'content': 'x'}]},
+                     {'title': 'A', 'stanzas': [{'index': 1, 'content': 'x'},
+                                                {'index': 1, 'content': 'y'}]},
+                     {'title': '!!!'}):
+            with self.subTest(poem=poem), \
+                    self.assertRaises(transfer.PoemImportError):
+                transfer.import_poems([json.dumps(poem)])
+
+        transfer.import_poems([json.dumps({
+            'title': 'Lines', 'slug': 'Lines Written',
+            'stanzas': [{'index': '3', 'content': 'Five years have past'}]})])
+        poem = Poem.find_by(slug='lines-written', one=True)
+        self.assertEqual([(s.index, s.content) for s in poem.stanzas],
+                         [(3, 'Five years have past')])
+
+    def test_failed_chunks_report_the_committed_ones(self):
+        lines = [json.dumps({'title': 'The Prelude'}),
+                 json.dumps({'title': 'Ode to Duty', 'slug': 'another'})]
+
+        with self.assertRaises(transfer.PoemImportError) as raised:
+            transfer.import_poems(lines, chunk_size=1)
+        self.assertIn('Lines 2 to 2', str(raised.exception))
+        self.assertEqual(raised.exception.counts, (1, 0, 0))
+        self.assertIsNotNone(Poem.find_by(slug='the-prelude', one=True))
+
+    def test_poets_cannot_overwrite_other_poems(self):
+        other = self.add_poet('coleridge')
+        lines = self.export()
+        lines[0]['title'] = 'Taken'
+
+        self.assertEqual(transfer.import_poems([json.dumps(lines[0])],
+                                               author_id=other.id), (0, 0, 1))
+        self.assertEqual(Poem.find_by(slug='ode-to-duty', one=True).title,
+                         'Ode to Duty')
+
+    def test_endpoints_round_trip(self):
+        client = self.app.test_client()
+        client.post('/login', data={'username': 'wordsworth',
+                                    'password': 'password'})
+
+        exported = client.get('/poems/export')
+        self.assertEqual(exported.mimetype, 'application/jsonl')
+        data = exported.get_data().replace(b'Ode to Duty', b'Ode to Duty II')
+
+        client.post('/poems/import', data={
+            'poems': (io.BytesIO(data), 'poems.jsonl')})
+        self.assertEqual(Poem.find_by(slug='ode-to-duty', one=True).title,
+                         'Ode to Duty II')